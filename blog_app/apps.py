@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class BlogAppConfig(AppConfig):
     name = 'blog_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .backends import check_shared_cache
+
+        checks.register(check_shared_cache, checks.Tags.caches)
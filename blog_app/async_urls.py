@@ -0,0 +1,21 @@
+"""
+``urls.py`` with the read views swapped for their async versions.
+Included instead of ``blog_app.urls`` when ``BLOG_ASYNC_VIEWS`` is on.
+"""
+
+from django.urls import URLPattern
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'home': async_views.home,
+    'category_posts': async_views.category_posts,
+    'post_detail': async_views.post_detail,
+    'post_comments': async_views.post_comments,
+}
+
+urlpatterns = [
+    URLPattern(pattern.pattern, ASYNC_VIEWS.get(pattern.name, pattern.callback), pattern.default_args, pattern.name)
+    for pattern in sync_urlpatterns
+]
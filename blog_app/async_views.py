@@ -0,0 +1,114 @@
+"""
+Async versions of the read-heavy public views, for ASGI servers.
+
+They replace their ``views.py`` counterparts when ``BLOG_ASYNC_VIEWS`` is
+on (see ``async_urls.py``). Queries go through the async ORM, and queries
+that don't depend on each other are awaited together with
+``asyncio.gather``.
+"""
+
+import asyncio
+
+from django.contrib import messages
+from django.http import Http404, JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from . import directory
+from .conditional import acategory_last_modified, ahome_last_modified, apost_last_modified, conditional_page
+from .forms import CommentForm
+from .fragments import arender_post_cards
+from .models import Comment, Post
+from .page_cache import anonymous_page_cache
+from .pagination import InvalidCursor, KeysetPaginator
+from .views import comment_paginator
+
+
+@conditional_page(ahome_last_modified)
+@anonymous_page_cache
+async def home(request):
+    posts = Post.objects.filter(status='published').select_related('author', 'category')
+    paginator = KeysetPaginator(posts, 6)
+    page_obj, categories = await asyncio.gather(
+        paginator.aget_page(request.GET.get('page')),
+        directory.acategories(),
+    )
+
+    context = {
+        'page_obj': page_obj,
+        'post_cards': await arender_post_cards(page_obj, 'home'),
+        'categories': categories,
+    }
+    return render(request, 'blog_app/home.html', context)
+
+
+@conditional_page(acategory_last_modified)
+@anonymous_page_cache
+async def category_posts(request, category_id):
+    posts = Post.objects.filter(category_id=category_id, status='published').select_related('author', 'category')
+    paginator = KeysetPaginator(posts, 9)
+    category, page_obj = await asyncio.gather(
+        directory.aget(category_id),
+        paginator.aget_page(request.GET.get('page')),
+    )
+    if category is None:
+        raise Http404('No such category')
+
+    context = {
+        'category': category,
+        'page_obj': page_obj,
+        'post_cards': await arender_post_cards(page_obj, 'category'),
+        'post_count': category.post_count,
+    }
+    return render(request, 'blog_app/category_posts.html', context)
+
+
+@conditional_page(apost_last_modified)
+@anonymous_page_cache
+async def post_detail(request, pk):
+    post, comments = await asyncio.gather(
+        aget_object_or_404(Post.objects.select_related('author', 'category'), pk=pk),
+        comment_paginator(Comment.objects.filter(post_id=pk)).apage(),
+    )
+
+    if request.method == 'POST':
+        if request.user.is_authenticated:
+            form = CommentForm(request.POST)
+            if form.is_valid():
+                comment = form.save(commit=False)
+                comment.post = post
+                comment.author = request.user
+                await comment.asave()
+                messages.success(request, 'Your comment has been added!')
+                return redirect('post_detail', pk=post.pk)
+        else:
+            messages.warning(request, 'Please login to comment.')
+            return redirect('login')
+    else:
+        form = CommentForm()
+
+    context = {
+        'post': post,
+        'comments': comments,
+        'form': form,
+    }
+    return render(request, 'blog_app/post_detail.html', context)
+
+
+@conditional_page(apost_last_modified)
+@anonymous_page_cache
+async def post_comments(request, pk):
+    try:
+        _, comments = await asyncio.gather(
+            aget_object_or_404(Post.objects.only('pk'), pk=pk),
+            comment_paginator(Comment.objects.filter(post_id=pk)).apage(request.GET.get('page')),
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid page'}, status=400)
+
+    next_url = None
+    if comments.has_next():
+        next_url = f"{reverse('post_comments', args=[pk])}?page={comments.next_token}"
+    html = render_to_string('blog_app/includes/comment_list.html', {'comments': comments}, request=request)
+    return JsonResponse({'html': html, 'next': next_url})
@@ -0,0 +1,84 @@
+"""
+``ModelBackend`` with the per-request user lookup served from the cache.
+
+``AuthenticationMiddleware`` loads the logged-in user on every request
+that looks at ``request.user``. This backend keeps each user in the cache
+for ``BLOG_USER_CACHE_TIMEOUT`` seconds, so that lookup is a cache hit;
+``signals.py`` drops the entry whenever the user is saved or deleted
+(password and ``is_active`` changes included). Writes that send no signals,
+such as ``User.objects.update()``, show up only once the entry expires.
+Logging in still checks the password against the database.
+
+The entry is dropped in the default cache, so the other workers only see
+it go if they share that cache. With a process-local cache and several
+processes (``page_cache.cache_is_shared()`` is False) the cache is not used
+here; ``check_shared_cache`` warns about that, and about ``cached_db``
+sessions, where a logout would otherwise not reach the other workers.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core import checks
+from django.core.cache import cache
+
+from .page_cache import cache_is_shared
+
+
+def user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def _timeout():
+    return getattr(settings, 'BLOG_USER_CACHE_TIMEOUT', 60 * 15)
+
+
+def check_shared_cache(app_configs=None, **kwargs):
+    """System check: cached sessions and users need a cache every worker shares"""
+    if cache_is_shared():
+        return []
+    uses = []
+    if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.cached_db':
+        uses.append('cached_db sessions')
+    if f'{__name__}.CachedModelBackend' in settings.AUTHENTICATION_BACKENDS:
+        uses.append('CachedModelBackend')
+    if not uses:
+        return []
+    return [checks.Warning(
+        f'{" and ".join(uses)} with a process-local cache: a logout or a deactivated user '
+        'is only seen by the worker that handled it.',
+        hint='Configure a shared cache (file, Redis) or set BLOG_SINGLE_PROCESS = True '
+             'if only one process serves requests.',
+        id='blog_app.W001',
+    )]
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not cache_is_shared():
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, _timeout())
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        if not cache_is_shared():
+            return await super().aget_user(user_id)
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            try:
+                user = await get_user_model()._default_manager.aget(pk=user_id)
+            except get_user_model().DoesNotExist:
+                return None
+            await cache.aset(key, user, _timeout())
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,62 @@
+"""
+Helpers shared by the benchmark management commands: latency percentiles,
+a one-line summary of a run, and the regression check between two
+``benchmark_views`` result files.
+"""
+
+import math
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Summarize per-request ``latencies`` (seconds) of a run that took ``elapsed`` seconds"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def format_summary(label, summary):
+    return (
+        f'{label:<10} {summary["rps"]:>9.1f} req/s   '
+        f'p50 {summary["p50_ms"]:>8.2f} ms   p95 {summary["p95_ms"]:>8.2f} ms   '
+        f'p99 {summary["p99_ms"]:>8.2f} ms   errors {summary["errors"]}'
+    )
+
+
+# A change must also exceed these absolute amounts to count, so noise on
+# fast views isn't flagged
+REGRESSION_FLOORS = {'p95_ms': 1.0, 'queries': 0.5, 'peak_kib': 64.0}
+
+
+def compare_runs(old, new, threshold=0.2):
+    """
+    Compare two ``benchmark_views`` results. Returns ``(size, view, metric,
+    old value, new value)`` for every p95 latency or peak memory that grew
+    by more than ``threshold`` (a fraction), and every query count that grew.
+    """
+    regressions = []
+    for size, views in new['sizes'].items():
+        for view, metrics in views.items():
+            before = old['sizes'].get(size, {}).get(view)
+            if before is None:
+                continue
+            for metric, floor in REGRESSION_FLOORS.items():
+                was, now = before[metric], metrics[metric]
+                limit = was if metric == 'queries' else was * (1 + threshold)
+                if now > limit and now - was > floor:
+                    regressions.append((size, view, metric, was, now))
+    return regressions
@@ -0,0 +1,94 @@
+"""
+Admin changelist helpers for large tables.
+
+* ``EstimatedCountPaginator`` takes the row count of an unfiltered
+  changelist from the table statistics instead of ``COUNT(*)``, caps the
+  count of a filtered one, and loads a page by first reading only its
+  primary keys and then fetching those rows. Deep pages still use
+  ``OFFSET``, so page N costs O(N * per_page): the database steps over
+  every skipped row, but as index entries (an index-only scan when the
+  ordering is indexed) rather than full rows. Keyset pagination would
+  avoid that, but the admin links to arbitrary page numbers.
+* ``CachedRelatedFieldListFilter`` keeps the choices of a related-field
+  filter in the cache (``related_choices()``, also used by the category
+  action form); ``signals.py`` clears them when the related model changes.
+"""
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Below this many rows an exact count is cheap enough
+EXACT_COUNT_THRESHOLD = 10000
+# Filtered changelists count at most this many rows
+FILTERED_COUNT_LIMIT = 10000
+
+FILTER_CHOICES_TIMEOUT = 60 * 10
+
+
+def estimated_row_count(model, using='default'):
+    """Row count from the table statistics, or None when the database keeps none"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for changelists too big to COUNT(*) on every request, or to OFFSET through full rows"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > EXACT_COUNT_THRESHOLD:
+                return estimate
+            return queryset.count()
+        # Filtered: only count as far as the limit; later pages aren't linked
+        return queryset.order_by()[:FILTERED_COUNT_LIMIT].count()
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        # Still O(bottom), but only the primary keys are walked
+        pks = list(self.object_list.values_list('pk', flat=True)[bottom:top])
+        # Same queryset, so ordering and list_select_related are kept
+        return self._get_page(self.object_list.filter(pk__in=pks), number, self)
+
+
+def filter_choices_key(field):
+    return f'admin_filter_choices:{field.model._meta.label_lower}.{field.name}'
+
+
+def related_choices(field, ordering=()):
+    """``(pk, label)`` choices of a related field, kept in the cache"""
+    key = filter_choices_key(field)
+    choices = cache.get(key)
+    if choices is None:
+        choices = field.get_choices(include_blank=False, ordering=ordering)
+        cache.set(key, choices, FILTER_CHOICES_TIMEOUT)
+    return choices
+
+
+class CachedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    def field_choices(self, field, request, model_admin):
+        return related_choices(field, self.field_admin_ordering(field, request, model_admin))
@@ -0,0 +1,123 @@
+"""
+Conditional GET support (ETag / Last-Modified / 304) for the public pages.
+
+Validators come from one indexed "latest timestamp" query per request, so
+a revalidation that ends in 304 Not Modified never renders a template.
+The ETag also folds in the page-cache generation and the current user:
+deletes and comment approvals don't move any timestamp but do bump the
+generation, and logged-in pages differ from the anonymous ones.
+
+Async views pass an async timestamp function (``ahome_last_modified``
+etc.); the validators are then resolved with async queries before
+``condition()``, which calls them synchronously, runs.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.messages import get_messages
+from django.db.models import OuterRef, Subquery
+from django.views.decorators.http import condition
+
+from .models import Comment, Post
+from .page_cache import acurrent_generation, alast_invalidated, aprime_request, current_generation, last_invalidated
+
+
+def latest_post_change(queryset):
+    return queryset.order_by('-updated_date').values_list('updated_date', flat=True).first()
+
+
+async def alatest_post_change(queryset):
+    return await queryset.order_by('-updated_date').values_list('updated_date', flat=True).afirst()
+
+
+def home_last_modified(request):
+    return latest_post_change(Post.objects.filter(status='published'))
+
+
+def category_last_modified(request, category_id):
+    return latest_post_change(Post.objects.filter(category_id=category_id, status='published'))
+
+
+async def ahome_last_modified(request):
+    return await alatest_post_change(Post.objects.filter(status='published'))
+
+
+async def acategory_last_modified(request, category_id):
+    return await alatest_post_change(Post.objects.filter(category_id=category_id, status='published'))
+
+
+def _post_change_row(pk):
+    latest_comment = Comment.objects.filter(post=OuterRef('pk')).order_by('-created_date')
+    return Post.objects.filter(pk=pk).values_list('updated_date', Subquery(latest_comment.values('created_date')[:1]))
+
+
+def _latest(row):
+    if row is None:
+        return None
+    return max(value for value in row if value is not None)
+
+
+def post_last_modified(request, pk):
+    return _latest(_post_change_row(pk).first())
+
+
+async def apost_last_modified(request, pk):
+    return _latest(await _post_change_row(pk).afirst())
+
+
+def _include_invalidation(value, changed_at):
+    if value is not None and changed_at is not None:
+        value = max(value, datetime.fromtimestamp(changed_at, tz=timezone.utc))
+    return value
+
+
+def conditional_page(timestamp_func):
+    """
+    Decorate a view with ETag and Last-Modified validators derived from
+    ``timestamp_func(request, *args, **kwargs)``.
+    """
+
+    def _modified(request, *args, **kwargs):
+        # condition() asks for both validators; compute the query once
+        if not hasattr(request, '_blog_last_modified'):
+            value = timestamp_func(request, *args, **kwargs)
+            request._blog_last_modified = _include_invalidation(value, last_invalidated())
+        return request._blog_last_modified
+
+    def _etag(request, *args, **kwargs):
+        if len(get_messages(request)):
+            return None
+        value = _modified(request, *args, **kwargs)
+        if value is None:
+            return None
+        generation = getattr(request, '_blog_generation', None) or current_generation()
+        parts = [generation, request.user.pk or 0, value.timestamp(), request.GET.get('page', '')]
+        return hashlib.md5(':'.join(map(str, parts)).encode(), usedforsecurity=False).hexdigest()
+
+    def _last_modified(request, *args, **kwargs):
+        # Logged-in pages vary per user; those rely on the ETag alone
+        if request.user.is_authenticated or len(get_messages(request)):
+            return None
+        return _modified(request, *args, **kwargs)
+
+    add_validators = condition(etag_func=_etag, last_modified_func=_last_modified)
+
+    def decorator(view_func):
+        conditional_view = add_validators(view_func)
+        if not iscoroutinefunction(view_func):
+            return conditional_view
+
+        @wraps(view_func)
+        async def _async_view(request, *args, **kwargs):
+            await aprime_request(request)
+            value = await timestamp_func(request, *args, **kwargs)
+            request._blog_last_modified = _include_invalidation(value, await alast_invalidated())
+            request._blog_generation = await acurrent_generation()
+            return await conditional_view(request, *args, **kwargs)
+
+        return _async_view
+
+    return decorator
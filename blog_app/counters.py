@@ -0,0 +1,84 @@
+"""
+Denormalized ``Post.comment_count``: the number of approved comments.
+
+Counts only ever change with ``UPDATE ... SET comment_count =
+comment_count + n``, so concurrent comments can't lose an increment.
+``signals.py`` handles comments saved or deleted one at a time, bulk
+approval goes through ``approve_comments()``, and the ``recount_comments``
+command repairs any drift.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Post
+
+
+def _add_to_counts(post_ids, delta):
+    posts = Post.objects.filter(pk__in=post_ids)
+    if delta < 0:
+        # The column is unsigned; drift must not take it below zero
+        posts = posts.filter(comment_count__gte=-delta)
+    return posts.update(comment_count=F('comment_count') + delta)
+
+
+def adjust_comment_count(post_id, delta):
+    _add_to_counts([post_id], delta)
+
+
+def approve_comments(queryset):
+    """Approve the pending comments in ``queryset``; returns how many were approved"""
+    with transaction.atomic():
+        # Lock them first so a concurrent approval can't count them twice
+        pending = list(queryset.filter(approved=False).select_for_update().values_list('pk', 'post_id'))
+        if not pending:
+            return 0
+        Comment.objects.filter(pk__in=[pk for pk, _ in pending]).update(approved=True)
+
+        per_post = defaultdict(int)
+        for _, post_id in pending:
+            per_post[post_id] += 1
+        # One UPDATE per distinct increment rather than one per post
+        by_delta = defaultdict(list)
+        for post_id, delta in per_post.items():
+            by_delta[delta].append(post_id)
+        for delta, post_ids in by_delta.items():
+            _add_to_counts(post_ids, delta)
+    return len(pending)
+
+
+def recount_comments(batch_size=1000):
+    """
+    Recompute every post's ``comment_count`` in primary-key batches.
+    Returns ``(posts checked, posts fixed)``.
+    """
+    approved = (
+        Comment.objects.filter(post=OuterRef('pk'), approved=True)
+        .order_by().values('post').annotate(total=Count('pk')).values('total')
+    )
+    checked = fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1]
+        checked += len(batch)
+
+        with transaction.atomic():
+            # Lock the batch so a comment counted meanwhile isn't overwritten
+            drifted = (
+                Post.objects.filter(pk__in=batch).select_for_update()
+                .annotate(actual=Coalesce(Subquery(approved), Value(0)))
+                .exclude(comment_count=F('actual'))
+                .values_list('pk', 'actual')
+            )
+            by_count = defaultdict(list)
+            for pk, actual in drifted:
+                by_count[actual].append(pk)
+            for actual, post_ids in by_count.items():
+                fixed += Post.objects.filter(pk__in=post_ids).update(comment_count=actual)
+    return checked, fixed
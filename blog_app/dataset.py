@@ -0,0 +1,254 @@
+"""
+Deterministic bulk data for load and benchmark runs.
+
+``generate()`` builds users, categories, posts and comments with
+``bulk_create``, one transaction per batch of posts (their comments
+included). Everything about a post — title, text, dates, status, image
+colour, its comments — comes from a ``random.Random`` seeded with the
+run's seed and the post's number, so a seed always yields the same data,
+whatever the batch size or process count. Timestamps are counted back
+from a fixed ``end`` date rather than from now.
+
+Sample images are rendered in a process pool and written to the default
+storage. Bulk inserts bypass signals, so ``comment_count`` is filled in
+directly and the category directory is refreshed at the end; the search index and image derivatives are built afterwards by
+their own commands.
+"""
+
+import io
+import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import directory
+from .models import Category, Comment, Post
+
+USERNAME_PREFIX = 'load_user_'
+PASSWORD = 'loadtest123'
+IMAGE_DIR = 'blog_images/generated/'
+IMAGE_SIZE = (800, 400)
+
+# Per unit of --scale
+POSTS_PER_SCALE = 1000
+USERS_PER_SCALE = 50
+
+DEFAULT_END = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+CATEGORY_NAMES = [
+    'Technology & AI', 'Science & Nature', 'Art & Design', 'Travel & Adventure', 'Food & Cooking',
+    'Health & Fitness', 'Education & Learning', 'Business & Finance', 'Entertainment & Movies',
+    'Sports & Games', 'Lifestyle & Fashion', 'Music & Podcasts', 'Programming & Coding',
+    'Photography', 'Gardening & DIY',
+]
+
+ADJECTIVES = [
+    'practical', 'hidden', 'modern', 'simple', 'essential', 'surprising', 'quiet', 'sustainable',
+    'complete', 'curious', 'ancient', 'remote', 'healthy', 'digital', 'creative', 'local',
+]
+NOUNS = [
+    'guide', 'garden', 'kitchen', 'journey', 'algorithm', 'habit', 'market', 'camera', 'city',
+    'recipe', 'workout', 'startup', 'library', 'planet', 'studio', 'network', 'river', 'budget',
+]
+TOPICS = [
+    'beginners', 'busy people', 'remote teams', 'small budgets', 'weekends', 'families',
+    'the next decade', 'rainy days', 'students', 'travellers',
+]
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore '
+    'et dolore magna aliqua technology learning travel health food design energy science community '
+    'finance music garden practice habit data system culture nature city project idea time people'
+).split()
+COMMENTS = [
+    'Great article! Really enjoyed reading this.',
+    'Thanks for sharing these insights.',
+    'Could you elaborate more on the second point?',
+    'This has been really helpful for my project.',
+    'Interesting take on the subject.',
+    'Looking forward to the next article in this series.',
+    'Practical and actionable advice. Thank you!',
+    'Clear and concise explanation. Well done!',
+]
+
+
+def post_rng(seed, number):
+    return random.Random(f'{seed}:post:{number}')
+
+
+def _sentence(rng, words):
+    text = ' '.join(rng.choices(WORDS, k=words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def _paragraphs(rng, count):
+    return '\n\n'.join(
+        ' '.join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(3, 6)))
+        for _ in range(count)
+    )
+
+
+def render_image(number, title, color):
+    """JPEG bytes of a sample post image; runs in a worker process"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', IMAGE_SIZE, color=color)
+    draw = ImageDraw.Draw(image)
+    draw.text((20, IMAGE_SIZE[1] // 2), f'#{number} {title[:60]}', fill=(255, 255, 255))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=80)
+    return number, buffer.getvalue()
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let ``bulk_create`` keep the given auto_now / auto_now_add values"""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def create_users(count, seed):
+    if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+        raise ValueError('Generated data already exists; generate into an empty database')
+    rng = random.Random(f'{seed}:users')
+    # One hash for everyone: hashing is deliberately slow
+    password = make_password(PASSWORD, salt='loadtest')
+    users = [
+        User(
+            username=f'{USERNAME_PREFIX}{n}',
+            email=f'{USERNAME_PREFIX}{n}@example.com',
+            first_name=rng.choice(NOUNS).title(),
+            password=password,
+        )
+        for n in range(count)
+    ]
+    User.objects.bulk_create(users, batch_size=1000)
+    return list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk').values_list('pk', flat=True))
+
+
+def create_categories(count):
+    names = [CATEGORY_NAMES[n] if n < len(CATEGORY_NAMES) else f'Topic {n + 1}' for n in range(count)]
+    existing = set(Category.objects.filter(name__in=names).values_list('name', flat=True))
+    Category.objects.bulk_create([Category(name=name) for name in names if name not in existing])
+    ids = dict(Category.objects.filter(name__in=names).values_list('name', 'pk'))
+    return [ids[name] for name in names]
+
+
+def build_post(seed, number, user_ids, category_ids, end, days, comments_per_post, image_ratio):
+    """Return ``(post, [comment kwargs], image args or None)`` for post ``number``"""
+    rng = post_rng(seed, number)
+    title = f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} for {rng.choice(TOPICS)}'
+    publish_date = end - timedelta(seconds=rng.randrange(days * 86400))
+    status = 'published' if rng.random() < 0.8 else 'draft'
+
+    comments = []
+    for _ in range(rng.randint(0, comments_per_post * 2)):
+        content = rng.choice(COMMENTS)
+        if rng.random() < 0.3:
+            content += ' ' + _sentence(rng, rng.randint(10, 30))
+        comments.append({
+            'author_id': rng.choice(user_ids),
+            'content': content,
+            'approved': rng.random() < 0.9,
+            'created_date': min(publish_date + timedelta(seconds=rng.randrange(30 * 86400)), end),
+        })
+
+    post = Post(
+        title=title,
+        slug=f'{slugify(title)[:40]}-{number}',
+        author_id=rng.choice(user_ids),
+        content=_paragraphs(rng, rng.randint(2, 5)),
+        category_id=rng.choice(category_ids) if rng.random() < 0.95 else None,
+        status=status,
+        publish_date=publish_date,
+        created_date=publish_date,
+        updated_date=publish_date,
+        comment_count=sum(comment['approved'] for comment in comments),
+    )
+    image = None
+    if rng.random() < image_ratio:
+        image = (number, title, tuple(rng.randint(60, 200) for _ in range(3)))
+    return post, comments, image
+
+
+def _save_images(executor, images, posts):
+    if not images:
+        return
+    by_number = {number: post for number, post in posts}
+    if executor is None:
+        rendered = (render_image(*args) for args in images)
+    else:
+        rendered = executor.map(render_image, *zip(*images), chunksize=8)
+    for number, data in rendered:
+        by_number[number].image = default_storage.save(f'{IMAGE_DIR}{number}.jpg', ContentFile(data))
+
+
+def _assign_pks(posts, user_ids):
+    """MySQL's bulk_create doesn't return primary keys; look them up by slug"""
+    if all(post.pk is not None for post in posts):
+        return
+    pks = dict(
+        Post.objects.filter(slug__in=[post.slug for post in posts], author_id__in=set(post.author_id for post in posts))
+        .values_list('slug', 'pk')
+    )
+    for post in posts:
+        post.pk = pks[post.slug]
+
+
+def generate(
+    posts, users, categories=len(CATEGORY_NAMES), comments_per_post=5, seed=0, end=DEFAULT_END, days=365,
+    image_ratio=0.0, batch_size=1000, processes=None, progress=None,
+):
+    """
+    Generate the dataset; returns ``{'users': n, 'categories': n, 'posts': n, 'comments': n, 'images': n}``.
+    ``progress(posts_done, comments_done)`` is called after every batch.
+    """
+    user_ids = create_users(users, seed)
+    category_ids = create_categories(categories)
+    counts = {'users': len(user_ids), 'categories': len(category_ids), 'posts': 0, 'comments': 0, 'images': 0}
+
+    executor = ProcessPoolExecutor(processes) if image_ratio > 0 and processes != 1 else None
+    timestamps = [Post._meta.get_field('created_date'), Post._meta.get_field('updated_date'), Comment._meta.get_field('created_date')]
+    try:
+        with explicit_timestamps(*timestamps):
+            for start in range(0, posts, batch_size):
+                built = [
+                    (number, build_post(seed, number, user_ids, category_ids, end, days, comments_per_post, image_ratio))
+                    for number in range(start, min(start + batch_size, posts))
+                ]
+                batch = [post for _, (post, _, _) in built]
+                images = [image for _, (_, _, image) in built if image is not None]
+                _save_images(executor, images, [(number, post) for number, (post, _, _) in built])
+
+                with transaction.atomic():
+                    Post.objects.bulk_create(batch)
+                    _assign_pks(batch, user_ids)
+                    comments = [
+                        Comment(post_id=post.pk, **kwargs)
+                        for _, (post, post_comments, _) in built
+                        for kwargs in post_comments
+                    ]
+                    Comment.objects.bulk_create(comments, batch_size=1000)
+
+                counts['posts'] += len(batch)
+                counts['comments'] += len(comments)
+                counts['images'] += len(images)
+                if progress is not None:
+                    progress(counts['posts'], counts['comments'])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    directory.invalidate()
+    return counts
@@ -0,0 +1,80 @@
+"""
+Category diagnostics computed in the database.
+
+Every figure comes from one ``aggregate()`` or ``annotate()`` query,
+however many categories and posts there are: ``overview()`` for the
+totals, ``category_stats()`` for one row per category (streamed), and
+``latest_posts()`` for the newest posts of every category in a single
+window-function query. Used by the ``category_report`` command and
+``check_categories.py``.
+"""
+
+from django.db.models import Count, F, Max, Min, Q, Sum, Window
+from django.db.models.functions import RowNumber
+
+from .models import Category, Post
+
+
+def per_day(count, first, last):
+    """Average per day between ``first`` and ``last``, or None for less than two items / no time span"""
+    if count < 2 or first is None or last is None:
+        return None
+    days = (last - first).total_seconds() / 86400
+    return count / days if days > 0 else None
+
+
+def overview():
+    totals = Post.objects.aggregate(
+        posts=Count('pk'),
+        published=Count('pk', filter=Q(status='published')),
+        uncategorized=Count('pk', filter=Q(category__isnull=True)),
+        first_post=Min('created_date'),
+        last_post=Max('created_date'),
+    )
+    totals['categories'] = Category.objects.count()
+    totals['per_day'] = per_day(totals['posts'], totals['first_post'], totals['last_post'])
+    return totals
+
+
+def category_stats(chunk_size=500):
+    """Yield per-category post counts, comment totals, first/last post dates and posts per day"""
+    rows = (
+        Category.objects
+        .annotate(
+            posts=Count('post'),
+            published=Count('post', filter=Q(post__status='published')),
+            comments=Sum('post__comment_count', default=0),
+            first_post=Min('post__created_date'),
+            last_post=Max('post__created_date'),
+        )
+        .order_by('name', 'pk')
+        .values('pk', 'name', 'posts', 'published', 'comments', 'first_post', 'last_post')
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        row['per_day'] = per_day(row['posts'], row['first_post'], row['last_post'])
+        yield row
+
+
+def latest_posts(per_category=3):
+    """``{category id: [post rows]}`` with the newest ``per_category`` posts of each category"""
+    rank = Window(RowNumber(), partition_by=F('category_id'), order_by=[F('publish_date').desc(), F('pk').desc()])
+    rows = (
+        Post.objects
+        .filter(category__isnull=False)
+        .annotate(rank=rank)
+        .filter(rank__lte=per_category)
+        .order_by('category_id', 'rank')
+        .values('pk', 'category_id', 'title', 'author__username', 'status', 'publish_date')
+    )
+    latest = {}
+    for row in rows:
+        latest.setdefault(row['category_id'], []).append(row)
+    return latest
+
+
+def uncategorized_posts(limit=10):
+    return list(
+        Post.objects.filter(category__isnull=True)
+        .order_by('-pk')
+        .values('pk', 'title', 'author__username', 'status', 'created_date')[:limit]
+    )
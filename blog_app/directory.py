@@ -0,0 +1,88 @@
+"""
+The category directory: every category, ordered by name, with its number
+of published posts, kept in a single cache entry.
+
+It is built with one grouped ``COUNT`` query. ``signals.py`` drops it
+whenever a post or category is saved or deleted, and rebuilds it once the
+transaction has committed so readers rarely hit a miss; bulk updates that
+send no signals call ``invalidate()`` themselves. It is always read from
+the primary database: a lagging replica would leave a stale directory in
+the cache until the next write. Nor is it cached when the cache is local
+to each process (``page_cache.cache_is_shared()``): only the process that
+handled a write would drop it, and the others would keep the old directory,
+so a new category would 404, until they restart.
+
+The home sidebar, the category page (name and post count) and the
+``PostForm`` category select all read from it.
+"""
+
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Q
+
+from .models import Category
+from .page_cache import cache_is_shared
+
+DIRECTORY_KEY = 'category_directory:v1'
+
+Entry = namedtuple('Entry', 'id name post_count')
+
+
+def _query():
+    return (
+        Category.objects.using(DEFAULT_DB_ALIAS)
+        .annotate(post_count=Count('post', filter=Q(post__status='published')))
+        # Sorted in Python: no temporary table for a few hundred rows
+        .order_by()
+        .values_list('pk', 'name', 'post_count')
+    )
+
+
+def _entries(rows):
+    return sorted((Entry(*row) for row in rows), key=lambda entry: (entry.name, entry.id))
+
+
+def rebuild():
+    entries = _entries(_query())
+    if cache_is_shared():
+        cache.set(DIRECTORY_KEY, entries, None)
+    return entries
+
+
+async def arebuild():
+    entries = _entries([row async for row in _query()])
+    if cache_is_shared():
+        await cache.aset(DIRECTORY_KEY, entries, None)
+    return entries
+
+
+def categories():
+    """``Entry(id, name, post_count)`` for every category, ordered by name"""
+    entries = cache.get(DIRECTORY_KEY) if cache_is_shared() else None
+    if entries is None:
+        entries = rebuild()
+    return entries
+
+
+async def acategories():
+    entries = await cache.aget(DIRECTORY_KEY) if cache_is_shared() else None
+    if entries is None:
+        entries = await arebuild()
+    return entries
+
+
+def get(category_id):
+    """The entry of one category, or None"""
+    return next((entry for entry in categories() if entry.id == category_id), None)
+
+
+async def aget(category_id):
+    return next((entry for entry in await acategories() if entry.id == category_id), None)
+
+
+def invalidate():
+    cache.delete(DIRECTORY_KEY)
+    if cache_is_shared():
+        transaction.on_commit(rebuild)
@@ -29,7 +29,9 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Post, Comment
+from . import directory
+from .models import Post, Comment, VideoUpload
+from .uploads import attach_upload
 
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField()
@@ -48,6 +50,9 @@ class UserRegisterForm(UserCreationForm):
 #             'status': forms.Select(attrs={'class': 'form-control'}),
 #         }
 class PostForm(forms.ModelForm):
+    # Id of a completed chunked upload to use instead of the `video` file field
+    video_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Post
         fields = [
@@ -58,6 +63,32 @@ class PostForm(forms.ModelForm):
             'category',
             'status'
         ]
+
+    def __init__(self, *args, user=None, **kwargs):
+        self.user = user
+        super().__init__(*args, **kwargs)
+        # Options from the cached category directory; only a submitted value is looked up
+        self.fields['category'].choices = [('', self.fields['category'].empty_label)] + [
+            (entry.id, entry.name) for entry in directory.categories()
+        ]
+
+    def clean_video_upload(self):
+        upload_id = self.cleaned_data.get('video_upload')
+        if not upload_id:
+            return None
+        try:
+            return VideoUpload.objects.get(pk=upload_id, owner=self.user, completed=True)
+        except VideoUpload.DoesNotExist:
+            raise forms.ValidationError('The video upload is missing or not finished yet.')
+
+    def save(self, commit=True):
+        post = super().save(commit=False)
+        upload = self.cleaned_data.get('video_upload')
+        if upload:
+            attach_upload(post, upload)
+        if commit:
+            post.save()
+        return post
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
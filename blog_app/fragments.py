@@ -0,0 +1,83 @@
+"""
+Fragment cache for the post cards shown on listing pages.
+
+Each card is cached per (variant, post id, updated_date, comment_count).
+A page of cards
+is fetched with a single ``get_many``; only the misses are rendered and
+written back with one ``set_many``. Saving a post bumps ``updated_date``
+and a new approved comment bumps ``comment_count``, so the old card is
+never read again; category changes and deletes are
+cleared explicitly from ``signals.py``.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATES = {
+    'home': 'blog_app/cards/home.html',
+    'category': 'blog_app/cards/category.html',
+    'user': 'blog_app/cards/user.html',
+}
+
+# Bump when a card template changes so old HTML is ignored
+CARD_VERSION = 4
+
+
+def card_timeout():
+    return getattr(settings, 'BLOG_CARD_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def card_key(variant, post_id, updated_date, comment_count):
+    return f'post_card:v{CARD_VERSION}:{variant}:{post_id}:{updated_date.timestamp()}:{comment_count}'
+
+
+def card_keys(post_id, updated_date, comment_count):
+    """Keys of every variant of one post's card"""
+    return [card_key(variant, post_id, updated_date, comment_count) for variant in CARD_TEMPLATES]
+
+
+def _render_cards(posts, keys, cached, variant):
+    """Return the cards for ``posts`` and the ``{key: html}`` of those rendered now"""
+    template = CARD_TEMPLATES[variant]
+    missing = {}
+    cards = []
+    for key, post in zip(keys, posts):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string(template, {'post': post})
+            missing[key] = html
+        cards.append(html)
+    return cards, missing
+
+
+def render_post_cards(posts, variant):
+    """Return the concatenated card HTML for ``posts``"""
+    posts = list(posts)
+    keys = [card_key(variant, post.pk, post.updated_date, post.comment_count) for post in posts]
+    cards, missing = _render_cards(posts, keys, cache.get_many(keys), variant)
+    if missing:
+        cache.set_many(missing, card_timeout())
+    return mark_safe(''.join(cards))
+
+
+async def arender_post_cards(posts, variant):
+    posts = list(posts)
+    keys = [card_key(variant, post.pk, post.updated_date, post.comment_count) for post in posts]
+    cards, missing = _render_cards(posts, keys, await cache.aget_many(keys), variant)
+    if missing:
+        await cache.aset_many(missing, card_timeout())
+    return mark_safe(''.join(cards))
+
+
+def invalidate_post_cards(rows):
+    """Drop cached cards for ``rows`` of ``(post_id, updated_date, comment_count)``"""
+    keys = []
+    for row in rows:
+        keys.extend(card_keys(*row))
+        if len(keys) >= 1000:
+            cache.delete_many(keys)
+            keys = []
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,144 @@
+"""
+Derivative images for ``Post.image``.
+
+When a post is saved with a new image, ``build_derivatives()`` uses Pillow
+to write auto-oriented, EXIF-free copies at several widths in the original
+format plus WebP, and a tiny blurred placeholder. The result is stored in
+``Post.image_meta``, which the ``responsive_image`` template tag turns into
+``srcset`` / ``sizes`` markup.
+"""
+
+import base64
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError
+
+from .fragments import invalidate_post_cards
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 960, 1280)
+PLACEHOLDER_WIDTH = 16
+
+JPEG_OPTIONS = {'quality': 82, 'optimize': True, 'progressive': True}
+PNG_OPTIONS = {'optimize': True}
+WEBP_OPTIONS = {'quality': 80, 'method': 4}
+
+
+def derivative_name(source_name, width, ext):
+    # The source extension is kept: photo.jpg and photo.png are different sources
+    stem, source_ext = os.path.splitext(os.path.basename(source_name))
+    folder = os.path.dirname(source_name)
+    suffix = f'-{source_ext.lstrip(".").lower()}' if source_ext else ''
+    return f'{folder}/derived/{stem}{suffix}-{width}w.{ext}'
+
+
+def _encode(image, fmt, options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def _placeholder(image):
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.convert('RGB').resize((PLACEHOLDER_WIDTH, height), Image.Resampling.BILINEAR)
+    tiny = tiny.filter(ImageFilter.GaussianBlur(1))
+    data = base64.b64encode(_encode(tiny, 'JPEG', {'quality': 50})).decode()
+    return f'data:image/jpeg;base64,{data}'
+
+
+def _save(storage, name, data):
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(data))
+
+
+def delete_derivatives(storage, meta):
+    for variant in meta.get('variants', []):
+        for name in (variant['src'], variant['webp']):
+            if storage.exists(name):
+                storage.delete(name)
+
+
+def build_derivatives(fieldfile):
+    """Write the derivatives of ``fieldfile`` and return the metadata dict"""
+    storage = fieldfile.storage
+    with fieldfile.open('rb') as f:
+        image = Image.open(f)
+        animated = getattr(image, 'is_animated', False)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    meta = {
+        'source': fieldfile.name,
+        'width': image.width,
+        'height': image.height,
+        'placeholder': _placeholder(image),
+        'variants': [],
+    }
+    if animated:
+        # Resizing would drop the animation; keep serving the original
+        return meta
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha:
+        image = image.convert('RGBA')
+        fmt, ext, options = 'PNG', 'png', PNG_OPTIONS
+    else:
+        image = image.convert('RGB')
+        fmt, ext, options = 'JPEG', 'jpg', JPEG_OPTIONS
+
+    # Never upscale; the widest variant is the image itself, capped at WIDTHS[-1]
+    widths = [w for w in WIDTHS if w < image.width]
+    widths.append(min(image.width, WIDTHS[-1]))
+    widths = sorted(set(widths))
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        meta['variants'].append({
+            'width': width,
+            'src': _save(storage, derivative_name(fieldfile.name, width, ext), _encode(resized, fmt, options)),
+            'webp': _save(storage, derivative_name(fieldfile.name, width, 'webp'), _encode(resized, 'WEBP', WEBP_OPTIONS)),
+        })
+    return meta
+
+
+def refresh_post_image_meta(post):
+    """
+    Rebuild ``post.image_meta`` if the image changed since it was built.
+    Returns True when the stored metadata was updated.
+    """
+    old = post.image_meta or {}
+    source = post.image.name if post.image else None
+    if old.get('source') == source:
+        return False
+
+    if old:
+        delete_derivatives(post.image.storage, old)
+    meta = {}
+    if source:
+        try:
+            meta = build_derivatives(post.image)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+            logger.warning('Could not build derivatives for post %s (%s): %s', post.pk, source, exc)
+            # Remember the failure so every later save doesn't retry it
+            meta = {'source': source, 'variants': []}
+
+    # update() keeps this out of the save signals that triggered it
+    Post.objects.filter(pk=post.pk).update(image_meta=meta)
+    post.image_meta = meta
+    invalidate_post_cards([(post.pk, post.updated_date, post.comment_count)])
+    return True
+
+
+def delete_post_derivatives(post):
+    """Delete the derivatives of a deleted post once the deletion has committed"""
+    meta = post.image_meta or {}
+    if meta.get('variants'):
+        storage = post.image.storage
+        transaction.on_commit(lambda: delete_derivatives(storage, meta))
@@ -0,0 +1,294 @@
+import hashlib
+import json
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+import django
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from blog_app import dataset, urls as blog_urls
+from blog_project import profiling
+from blog_app.benchmarks import compare_runs, format_summary, summarize
+from blog_app.models import Category, Post
+from blog_app.search import index_post
+from blog_app.uploads import start_upload
+
+# ``user`` is None (anonymous), 'author' (of the fixture post) or 'staff'.
+# ``relogin`` logs the client in again before every request (logout).
+Request = namedtuple('Request', ['method', 'path', 'user', 'data', 'headers', 'relogin'], defaults=(None, None, None, False))
+Fixture = namedtuple('Fixture', ['post', 'author', 'category', 'upload', 'search_term', 'profile'])
+
+CHUNK = bytes(range(256)) * 256
+CHUNK_SHA256 = hashlib.sha256(CHUNK).hexdigest()
+VIDEO = bytes(range(256)) * 4096
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+BENCHMARK_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark_views'}}
+
+
+def _chunk_request(fx, i):
+    # A new upload each time: re-sending a stored chunk is a no-op
+    upload = start_upload(fx.author, 'bench.bin', len(CHUNK), CHUNK_SHA256)
+    return Request(
+        'POST', reverse('upload_video_chunk', args=[upload.pk, 0]), 'author',
+        data=CHUNK, headers={'X-Chunk-SHA256': CHUNK_SHA256},
+    )
+
+
+# One request per URL name in blog_app/urls.py; a new URL has to be added here
+VIEW_REQUESTS = {
+    'home': lambda fx, i: Request('GET', reverse('home')),
+    'register': lambda fx, i: Request('GET', reverse('register')),
+    'login': lambda fx, i: Request('GET', reverse('login')),
+    'logout': lambda fx, i: Request('GET', reverse('logout'), 'author', relogin=True),
+    'create_post': lambda fx, i: Request('GET', reverse('create_post'), 'author'),
+    'post_detail': lambda fx, i: Request('GET', reverse('post_detail', args=[fx.post.pk])),
+    'post_comments': lambda fx, i: Request('GET', reverse('post_comments', args=[fx.post.pk])),
+    'update_post': lambda fx, i: Request('GET', reverse('update_post', args=[fx.post.pk]), 'author'),
+    'delete_post': lambda fx, i: Request('GET', reverse('delete_post', args=[fx.post.pk]), 'author'),
+    'category_posts': lambda fx, i: Request('GET', reverse('category_posts', args=[fx.category.pk])),
+    'user_posts': lambda fx, i: Request('GET', reverse('user_posts'), 'author'),
+    'search': lambda fx, i: Request('GET', f"{reverse('search')}?q={fx.search_term}"),
+    'download_post_image': lambda fx, i: Request('GET', reverse('download_post_image', args=[fx.post.pk]), 'author'),
+    'stream_post_video': lambda fx, i: Request(
+        'GET', reverse('stream_post_video', args=[fx.post.pk]), headers={'Range': 'bytes=0-65535'},
+    ),
+    'start_video_upload': lambda fx, i: Request(
+        'POST', reverse('start_video_upload'), 'author', data={'filename': 'bench.mp4', 'size': len(VIDEO)},
+    ),
+    'video_upload_status': lambda fx, i: Request('GET', reverse('video_upload_status', args=[fx.upload.pk]), 'author'),
+    'upload_video_chunk': _chunk_request,
+    'db_pool_stats': lambda fx, i: Request('GET', reverse('db_pool_stats'), 'staff'),
+    'profile_list': lambda fx, i: Request('GET', reverse('profile_list'), 'staff'),
+    'download_profile': lambda fx, i: Request('GET', reverse('download_profile', args=[fx.profile, 'speedscope']), 'staff'),
+}
+
+
+class QueryTimer:
+    """``execute_wrapper`` counting queries and their time (captured query times are rounded to ms)"""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+
+
+def _sizes(value):
+    try:
+        sizes = [int(size) for size in value.split(',')]
+    except ValueError:
+        raise CommandError(f'Invalid --sizes: {value}')
+    return sizes
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every URL in blog_app/urls.py against freshly generated test databases '
+        '(1k, 100k and 1M posts by default), recording p50/p95/p99 latency, queries, SQL time '
+        'and peak memory per view. --compare OLD NEW flags regressions between two result files. '
+        'Anonymous pages are served from the page cache after the warmup unless --no-cache is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=_sizes, default=[1000, 100000, 1000000], help='Posts per dataset, comma separated')
+        parser.add_argument('--views', help='Only these URL names, comma separated')
+        parser.add_argument('--requests', type=int, default=100, help='Measured requests per view (default: 100)')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per view first (default: 5)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--search-index', action='store_true', help='Index the posts so search returns results (slow for big datasets)')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the page/fragment caches')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files instead of running')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p95/memory growth when comparing (default: 0.2)')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(*options['compare'], options['threshold'])
+
+        names = {pattern.name for pattern in blog_urls.urlpatterns}
+        missing = names - set(VIEW_REQUESTS)
+        if missing:
+            raise CommandError(f'No benchmark request for: {", ".join(sorted(missing))}')
+        views = options['views'].split(',') if options['views'] else list(VIEW_REQUESTS)
+        unknown = set(views) - set(VIEW_REQUESTS)
+        if unknown:
+            raise CommandError(f'Unknown view: {", ".join(sorted(unknown))}')
+
+        results = {
+            'meta': {
+                'created': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'requests': options['requests'],
+                'cache': not options['no_cache'],
+                'seed': options['seed'],
+            },
+            'sizes': {},
+        }
+        for size in options['sizes']:
+            results['sizes'][str(size)] = self.run_size(size, views, options)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def run_size(self, size, views, options):
+        media_root = tempfile.mkdtemp()
+        overrides = {
+            'ALLOWED_HOSTS': ['*'],
+            'CACHES': NO_CACHE if options['no_cache'] else BENCHMARK_CACHE,
+            # Every request runs in this process, so the local cache is shared
+            'BLOG_SINGLE_PROCESS': True,
+            'MEDIA_ROOT': media_root,
+            'BLOG_CHUNKED_UPLOAD_DIR': f'{media_root}/upload_tmp',
+            'BLOG_UPLOAD_CHUNK_SIZE': len(CHUNK),
+            'BLOG_DB_REPLICAS': [],
+            'BLOG_PROFILE_DIR': f'{media_root}/profiles',
+        }
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        if connection.vendor == 'sqlite':
+            # A file, so each size starts empty (in-memory test databases outlive destroy_test_db)
+            test_settings['NAME'] = f'{media_root}/benchmark.sqlite3'
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(**overrides):
+                self.stdout.write(f'Generating {size} posts...')
+                fixture = self.prepare(size, options)
+                results = {}
+                self.stdout.write(f'{size} posts, {options["requests"]} requests per view')
+                for name in views:
+                    results[name] = self.run_view(name, fixture, options['requests'], options['warmup'])
+                    self.stdout.write(
+                        f'{format_summary(name[:10], results[name])}   '
+                        f'{results[name]["queries"]:.1f} queries   {results[name]["sql_ms"]:.2f} ms SQL   '
+                        f'{results[name]["peak_kib"]:.0f} KiB peak'
+                    )
+                return results
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = old_test_name
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def prepare(self, size, options):
+        dataset.generate(posts=size, users=max(size // 20, 10), seed=options['seed'])
+        # The published post with the most comments, its author and the biggest category
+        post = Post.objects.filter(status='published').select_related('author').order_by('-comment_count', '-pk').first()
+        category = Category.objects.annotate(posts=Count('post')).order_by('-posts', 'pk').first()
+        staff = User.objects.create_user('bench_staff', password=dataset.PASSWORD, is_staff=True)
+
+        _, image = dataset.render_image(post.pk, post.title, (90, 120, 150))
+        Post.objects.filter(pk=post.pk).update(
+            image=default_storage.save('blog_images/bench.jpg', ContentFile(image)),
+            video=default_storage.save('blog_videos/bench.mp4', ContentFile(VIDEO)),
+        )
+        post.refresh_from_db()
+        if options['search_index']:
+            for indexed in Post.objects.only('pk', 'title', 'content').iterator(chunk_size=500):
+                index_post(indexed)
+        upload = start_upload(post.author, 'bench.mp4', len(VIDEO))
+        client = Client()
+        client.force_login(staff)
+        profile = client.get(f"{reverse('home')}?{profiling.PARAM}={profiling.make_token(staff)}")['X-Profile-Id']
+        return Fixture(post, post.author, category, upload, post.title.split()[-1], profile)
+
+    def client_for(self, clients, request, fixture):
+        """A client logged in as ``request.user``; set up outside the timed part"""
+        client = clients.get(request.user)
+        if client is None or request.relogin:
+            client = clients[request.user] = Client()
+            if request.user == 'staff':
+                client.force_login(User.objects.get(username='bench_staff'))
+            elif request.user == 'author':
+                client.force_login(fixture.author)
+        return client
+
+    def send(self, client, request):
+        kwargs = {'headers': request.headers or {}}
+        if request.method == 'POST':
+            if isinstance(request.data, bytes):
+                kwargs['content_type'] = 'application/octet-stream'
+            response = client.post(request.path, request.data, **kwargs)
+        else:
+            response = client.get(request.path, **kwargs)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        response.close()
+        return response.status_code < 400
+
+    def run_view(self, name, fixture, total, warmup):
+        build = VIEW_REQUESTS[name]
+        clients = {}
+        for i in range(warmup):
+            request = build(fixture, i)
+            self.send(self.client_for(clients, request, fixture), request)
+
+        latencies, queries, sql_times = [], [], []
+        errors = 0
+        elapsed = 0.0
+        for i in range(total):
+            request = build(fixture, i)
+            client = self.client_for(clients, request, fixture)
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                start = time.perf_counter()
+                ok = self.send(client, request)
+                latency = time.perf_counter() - start
+            elapsed += latency
+            if not ok:
+                errors += 1
+                continue
+            latencies.append(latency)
+            queries.append(timer.count)
+            sql_times.append(timer.time)
+
+        request = build(fixture, total)
+        client = self.client_for(clients, request, fixture)
+        tracemalloc.start()
+        try:
+            self.send(client, request)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        summary = summarize(latencies, elapsed, errors=errors)
+        summary.update({
+            'queries': statistics.fmean(queries) if queries else 0.0,
+            'sql_ms': statistics.fmean(sql_times) * 1000 if sql_times else 0.0,
+            'peak_kib': peak / 1024,
+        })
+        return summary
+
+    def compare(self, old_path, new_path, threshold):
+        with open(old_path) as f:
+            old = json.load(f)
+        with open(new_path) as f:
+            new = json.load(f)
+        regressions = compare_runs(old, new, threshold)
+        for size, view, metric, was, now in regressions:
+            self.stdout.write(self.style.ERROR(f'{size} posts  {view:<20} {metric:<8} {was:>10.2f} -> {now:>10.2f}'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s)')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.images import refresh_post_image_meta
+from blog_app.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Build resized / WebP derivatives and placeholders for post images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild even if already up to date')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image', 'image_meta', 'updated_date', 'comment_count')
+        built = 0
+        for post in posts.iterator(chunk_size=500):
+            if options['force']:
+                post.image_meta = {}
+            if refresh_post_image_meta(post):
+                built += 1
+                self.stdout.write(f'  {post.image.name}')
+        self.stdout.write(self.style.SUCCESS(f'Built derivatives for {built} post image(s)'))
@@ -0,0 +1,87 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from blog_app import diagnostics
+
+
+def _rate(value):
+    return f'{value:.2f}' if value is not None else 'N/A'
+
+
+def _date(value):
+    return f'{value:%Y-%m-%d}' if value is not None else '-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Report post counts, first/last post dates and posts per day for every category, '
+        'plus uncategorized posts and empty categories. Rows are written as they are read; '
+        '--format json writes one JSON document for dashboards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['text', 'json'], default='text')
+        parser.add_argument(
+            '--latest', type=int, default=0,
+            help='Also list the newest N posts of each category (one extra query over all posts)',
+        )
+        parser.add_argument('--uncategorized', type=int, default=10, help='Uncategorized posts to list (default: 10)')
+
+    def handle(self, *args, **options):
+        if options['latest'] < 0 or options['uncategorized'] < 0:
+            raise CommandError('--latest and --uncategorized cannot be negative')
+        totals = diagnostics.overview()
+        latest = diagnostics.latest_posts(options['latest']) if options['latest'] else {}
+        rows = diagnostics.category_stats()
+        uncategorized = diagnostics.uncategorized_posts(options['uncategorized']) if totals['uncategorized'] else []
+        if options['format'] == 'json':
+            self.write_json(totals, rows, latest, uncategorized)
+        else:
+            self.write_text(totals, rows, latest, uncategorized)
+
+    def emit(self, line, ending='\n'):
+        self.stdout.write(line, ending=ending)
+        self.stdout.flush()
+
+    def write_text(self, totals, rows, latest, uncategorized):
+        self.emit(
+            f"Categories: {totals['categories']}  Posts: {totals['posts']} ({totals['published']} published)  "
+            f"Uncategorized: {totals['uncategorized']}  Posts/day: {_rate(totals['per_day'])}"
+        )
+        self.emit(f"{'Category':<30} {'Posts':>7} {'Published':>9} {'%':>6} {'Comments':>8} {'Posts/day':>9}  First       Last")
+        self.emit('-' * 100)
+        empty = 0
+        for row in rows:
+            empty += not row['posts']
+            share = row['posts'] / totals['posts'] * 100 if totals['posts'] else 0
+            self.emit(
+                f"{row['name'][:30]:<30} {row['posts']:>7} {row['published']:>9} {share:>5.1f}% {row['comments']:>8} "
+                f"{_rate(row['per_day']):>9}  {_date(row['first_post']):<10}  {_date(row['last_post'])}"
+            )
+            for post in latest.get(row['pk'], []):
+                self.emit(f"    - {post['title'][:60]} by {post['author__username']} ({post['status']})")
+        self.emit('-' * 100)
+        self.emit(f'Empty categories: {empty}')
+        if uncategorized:
+            self.emit(f"Uncategorized posts ({len(uncategorized)} of {totals['uncategorized']}):")
+            for post in uncategorized:
+                self.emit(
+                    f"    #{post['pk']} {post['title'][:60]} by {post['author__username']} "
+                    f"({post['status']}, {_date(post['created_date'])})"
+                )
+
+    def write_json(self, totals, rows, latest, uncategorized):
+        def dumps(value):
+            return json.dumps(value, cls=DjangoJSONEncoder)
+
+        self.emit(f'{{"generated": {dumps(timezone.now())}, "overview": {dumps(totals)}, "categories": [', ending='')
+        empty = 0
+        for number, row in enumerate(rows):
+            empty += not row['posts']
+            if latest:
+                row['latest'] = latest.get(row['pk'], [])
+            self.emit(('' if number == 0 else ',') + '\n' + dumps(row), ending='')
+        self.emit(f'\n], "empty_categories": {empty}, "uncategorized": {dumps(uncategorized)}}}')
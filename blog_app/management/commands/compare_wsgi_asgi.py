@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from blog_app.benchmarks import format_summary, summarize
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def _split(path):
+    path, _, query = path.partition('?')
+    return path, query
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/sec and p50/p95/p99 latency of the read views under WSGI '
+        '(sync views, thread pool) and ASGI (async views, one event loop). Runs both '
+        'handlers in-process against the configured database, or load-tests two '
+        'running servers given --wsgi-url and --asgi-url.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['/'], help='Paths to request in turn (default: /)')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per run (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight (default: 20)')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests before each run')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the page/fragment caches (in-process only)')
+        parser.add_argument('--wsgi-url', help='Base URL of a running WSGI server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', help='Base URL of a running ASGI server, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        paths = options['paths']
+        total, concurrency = options['requests'], options['concurrency']
+        if bool(options['wsgi_url']) != bool(options['asgi_url']):
+            raise CommandError('Pass both --wsgi-url and --asgi-url, or neither')
+
+        results = {}
+        if options['wsgi_url']:
+            for label in ('wsgi', 'asgi'):
+                base = options[f'{label}_url'].rstrip('/')
+                self.run_http(base, paths, options['warmup'], concurrency)
+                results[label] = self.run_http(base, paths, total, concurrency)
+        else:
+            overrides = {'ALLOWED_HOSTS': ['*']}
+            if options['no_cache']:
+                overrides['CACHES'] = NO_CACHE
+            with override_settings(ROOT_URLCONF='blog_app.urls', **overrides):
+                self.run_wsgi(paths, options['warmup'], concurrency)
+                results['wsgi'] = self.run_wsgi(paths, total, concurrency)
+            with override_settings(ROOT_URLCONF='blog_app.async_urls', **overrides):
+                asyncio.run(self.run_asgi(paths, options['warmup'], concurrency))
+                results['asgi'] = asyncio.run(self.run_asgi(paths, total, concurrency))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'{total} requests, concurrency {concurrency}, paths: {" ".join(paths)}')
+        for label, summary in results.items():
+            self.stdout.write(format_summary(label.upper(), summary))
+        if results['wsgi']['rps']:
+            ratio = results['asgi']['rps'] / results['wsgi']['rps']
+            self.stdout.write(f'ASGI/WSGI throughput: {ratio:.2f}x')
+
+    def run_wsgi(self, paths, total, concurrency):
+        app = WSGIHandler()
+
+        def request(path):
+            path, query = _split(path)
+            environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'REQUEST_METHOD': 'GET'}
+            setup_testing_defaults(environ)
+            statuses = []
+            start = time.perf_counter()
+            body = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                for _ in body:
+                    pass
+            finally:
+                body.close()
+            return time.perf_counter() - start, int(statuses[0].split()[0]) < 400
+
+        return self._run_threads(request, paths, total, concurrency)
+
+    async def run_asgi(self, paths, total, concurrency):
+        app = ASGIHandler()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(path):
+            path, query = _split(path)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+                'query_string': query.encode(), 'headers': [(b'host', b'localhost')],
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            # One request message; later receive() calls wait like an open connection
+            inbox = asyncio.Queue()
+            inbox.put_nowait({'type': 'http.request', 'body': b'', 'more_body': False})
+            status = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            async with semaphore:
+                start = time.perf_counter()
+                await app(scope, inbox.get, send)
+                return time.perf_counter() - start, status[0] < 400
+
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(request(path) for path in itertools.islice(itertools.cycle(paths), total)))
+        return self._summary(outcomes, time.perf_counter() - start)
+
+    def run_http(self, base, paths, total, concurrency):
+        def request(path):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base + path) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        return self._run_threads(request, paths, total, concurrency)
+
+    def _run_threads(self, request, paths, total, concurrency):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            outcomes = list(pool.map(request, itertools.islice(itertools.cycle(paths), total)))
+        return self._summary(outcomes, time.perf_counter() - start)
+
+    def _summary(self, outcomes, elapsed):
+        latencies = [latency for latency, ok in outcomes if ok]
+        return summarize(latencies, elapsed, errors=len(outcomes) - len(latencies))
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog_app import remediation
+from blog_app.models import Category, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk category fixes without prompts. '
+        '"assign --to C" puts the uncategorized posts (every post with --all) in C; '
+        '"merge --from A --from B --to C" moves the posts of A and B to C and deletes A and B; '
+        '"spread" gives the uncategorized posts (every post with --all) random categories, '
+        'optionally only --among the given ones. Categories are given by id or name.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('operation', choices=['assign', 'merge', 'spread'])
+        parser.add_argument('--to', help='Target category (assign, merge)')
+        parser.add_argument('--create', action='store_true', help='Create the --to category if no category has that name')
+        parser.add_argument('--from', dest='sources', action='append', default=[], help='Category to merge (repeatable)')
+        parser.add_argument('--among', action='append', default=[], help='Category to spread across (repeatable; default: all)')
+        parser.add_argument('--all', action='store_true', help='Every post rather than only the uncategorized ones')
+        parser.add_argument('--seed', type=int, help='Random seed for spread')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts per UPDATE chunk (default: 1000)')
+
+    def category(self, value, create=False):
+        if value.isdigit():
+            found = Category.objects.filter(pk=int(value))
+        else:
+            found = Category.objects.filter(name=value)
+        matches = list(found[:2])
+        if not matches and create and not value.isdigit():
+            return Category.objects.create(name=value)
+        if len(matches) != 1:
+            raise CommandError(f'"{value}" matches {"no" if not matches else "more than one"} category; use its id')
+        return matches[0]
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        posts = Post.objects.all() if options['all'] else Post.objects.filter(category__isnull=True)
+        operation = options['operation']
+        start = time.perf_counter()
+
+        if operation in ('assign', 'merge') and not options['to']:
+            raise CommandError(f'{operation} needs --to')
+        if operation == 'assign':
+            target = self.category(options['to'], create=options['create'])
+            moved = remediation.assign_category(posts, target, options['batch_size'])
+            summary = f'Assigned {moved} post(s) to "{target}"'
+        elif operation == 'merge':
+            if not options['sources']:
+                raise CommandError('merge needs at least one --from')
+            target = self.category(options['to'])
+            sources = [self.category(value) for value in options['sources']]
+            moved, deleted = remediation.merge_categories(
+                Category.objects.filter(pk__in=[source.pk for source in sources]), target, options['batch_size'],
+            )
+            summary = f'Moved {moved} post(s) to "{target}" and deleted {deleted} category(ies)'
+        else:
+            among = None
+            if options['among']:
+                among = Category.objects.filter(pk__in=[self.category(value).pk for value in options['among']])
+            try:
+                moved = remediation.spread_categories(posts, among, options['seed'], options['batch_size'])
+            except ValueError as exc:
+                raise CommandError(exc)
+            summary = f'Spread {moved} post(s) across categories'
+
+        self.stdout.write(self.style.SUCCESS(f'{summary} in {time.perf_counter() - start:.1f}s'))
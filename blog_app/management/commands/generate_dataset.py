@@ -0,0 +1,70 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog_app import dataset
+
+
+def _end_date(value):
+    return datetime.fromisoformat(value).replace(tzinfo=dt_timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill an empty database with a reproducible dataset for load tests and benchmarks: '
+        f'--scale 1 is {dataset.POSTS_PER_SCALE} posts by {dataset.USERS_PER_SCALE} users. '
+        'The same --seed always produces the same data. Afterwards run rebuild_search_index '
+        '(and build_image_derivatives when using --image-ratio).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1, help='Size of the dataset (default: 1)')
+        parser.add_argument('--posts', type=int, help='Number of posts (overrides --scale)')
+        parser.add_argument('--users', type=int, help='Number of users (overrides --scale)')
+        parser.add_argument('--categories', type=int, default=len(dataset.CATEGORY_NAMES))
+        parser.add_argument('--comments-per-post', type=int, default=5, help='Average comments per post (default: 5)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--end', type=_end_date, default=dataset.DEFAULT_END, help='Latest publish date (UTC, ISO format)')
+        parser.add_argument('--days', type=int, default=365, help='Posts are spread over this many days before --end')
+        parser.add_argument('--image-ratio', type=float, default=0.0, help='Share of posts given a sample image (default: 0)')
+        parser.add_argument('--processes', type=int, help='Image rendering processes (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts per transaction (default: 1000)')
+
+    def handle(self, *args, **options):
+        posts = options['posts'] if options['posts'] is not None else round(options['scale'] * dataset.POSTS_PER_SCALE)
+        users = options['users'] if options['users'] is not None else max(round(options['scale'] * dataset.USERS_PER_SCALE), 1)
+        if posts < 0 or users < 1 or options['categories'] < 1 or options['batch_size'] < 1:
+            raise CommandError('Need at least one user, category and post per batch')
+
+        start = time.perf_counter()
+
+        def progress(posts_done, comments_done):
+            elapsed = time.perf_counter() - start
+            rate = (posts_done + comments_done) / elapsed if elapsed else 0
+            self.stdout.write(f'  {posts_done}/{posts} posts, {comments_done} comments ({rate:,.0f} rows/s)')
+
+        try:
+            counts = dataset.generate(
+                posts, users,
+                categories=options['categories'],
+                comments_per_post=options['comments_per_post'],
+                seed=options['seed'],
+                end=options['end'],
+                days=options['days'],
+                image_ratio=options['image_ratio'],
+                batch_size=options['batch_size'],
+                processes=options['processes'],
+                progress=progress,
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        elapsed = time.perf_counter() - start
+        rows = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['users']} users, {counts['categories']} categories, {counts['posts']} posts, "
+            f"{counts['comments']} comments and {counts['images']} images in {elapsed:.1f}s "
+            f'({rows / elapsed if elapsed else 0:,.0f} rows/s)'
+        ))
+        self.stdout.write(f'Users log in as {dataset.USERNAME_PREFIX}<n> / {dataset.PASSWORD}')
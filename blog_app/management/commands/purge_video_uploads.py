@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog_app.models import VideoUpload
+from blog_app.uploads import discard_upload
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked video uploads that were abandoned before being attached to a post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Age of the last chunk (default: 24)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        purged = 0
+        for upload in VideoUpload.objects.filter(updated_date__lt=cutoff).iterator():
+            discard_upload(upload)
+            purged += 1
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} stale upload(s)'))
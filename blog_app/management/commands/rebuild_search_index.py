@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.models import Post, SearchDocument
+from blog_app.search import index_post
+
+
+class Command(BaseCommand):
+    help = 'Add posts to the full-text search index, or refresh their entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Reindex posts even if their text is unchanged')
+
+    def handle(self, *args, **options):
+        if options['force']:
+            SearchDocument.objects.update(checksum='')
+        indexed = 0
+        for post in Post.objects.only('pk', 'title', 'content').iterator(chunk_size=500):
+            if index_post(post):
+                indexed += 1
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} post(s)'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.counters import recount_comments
+
+
+class Command(BaseCommand):
+    help = 'Recompute Post.comment_count from the approved comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts per batch')
+
+    def handle(self, *args, **options):
+        checked, fixed = recount_comments(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} post(s), fixed {fixed}'))
@@ -1,4 +1,6 @@
-from django.db import models
+import uuid
+
+from django.db import DatabaseError, connections, models, router, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
@@ -24,6 +26,8 @@ class Post(models.Model):
     content = models.TextField()
 
     image = models.ImageField(upload_to='blog_images/', blank=True, null=True)
+    # Resized / WebP derivatives and blur placeholder, see images.py
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
     video = models.FileField(upload_to='blog_videos/', blank=True, null=True)
 
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
@@ -31,15 +35,63 @@ class Post(models.Model):
     publish_date = models.DateTimeField(default=timezone.now)
     created_date = models.DateTimeField(auto_now_add=True)
     updated_date = models.DateTimeField(auto_now=True)
+    # Approved comments, kept up to date with F() updates, see counters.py
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
     
     def __str__(self):
         return self.title
     
     def get_absolute_url(self):
         return reverse('post_detail', kwargs={'pk': self.pk})
-    
+
+    def save(self, *args, **kwargs):
+        # Never write back a comment_count read before a concurrent F() update,
+        # and don't fetch deferred fields just to write them back unchanged.
+        # New rows (including clones with pk = None) and saves given
+        # update_fields or force_insert are left to Django.
+        if (
+            self._state.adding or self.pk is None
+            or kwargs.get('update_fields') is not None or kwargs.get('force_insert')
+        ):
+            return super().save(*args, **kwargs)
+        deferred = self.get_deferred_fields()
+        update_fields = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name != 'comment_count'
+            # updated_date is set, never read, so it's written even when deferred
+            and (field.attname not in deferred or field.name == 'updated_date')
+        ]
+        try:
+            super().save(*args, update_fields=update_fields, **kwargs)
+        except DatabaseError as exc:
+            # Django's own "did not affect any rows" (raised in Python, driver
+            # errors are subclasses): the row was deleted since it was loaded.
+            # A plain save would insert it again, so do that.
+            if type(exc) is not DatabaseError or kwargs.get('force_update'):
+                raise
+            using = kwargs.get('using') or router.db_for_write(Post, instance=self)
+            if connections[using].in_atomic_block:
+                # Nothing failed in the database; keep the caller's transaction usable
+                transaction.set_rollback(False, using=using)
+            if Post._base_manager.using(using).filter(pk=self.pk).exists():
+                raise
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-publish_date']
+        indexes = [
+            # home
+            models.Index(fields=['status', '-publish_date', '-id'], name='post_status_pub_idx'),
+            # category_posts
+            models.Index(fields=['category', 'status', '-publish_date', '-id'], name='post_cat_status_pub_idx'),
+            # user_posts
+            models.Index(fields=['author', '-publish_date', '-id'], name='post_author_pub_idx'),
+            # Last-Modified validators for home and category_posts
+            models.Index(fields=['status', '-updated_date'], name='post_status_upd_idx'),
+            models.Index(fields=['category', 'status', '-updated_date'], name='post_cat_status_upd_idx'),
+            # admin changelist
+            models.Index(fields=['-publish_date', '-id'], name='post_pub_idx'),
+        ]
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
@@ -52,4 +104,58 @@ class Comment(models.Model):
         return f'Comment by {self.author} on {self.post}'
     
     class Meta:
-        ordering = ['-created_date']
\ No newline at end of file
+        ordering = ['-created_date']
+        indexes = [
+            # post_detail. `approved` is filtered per row: approved=True compiles to a
+            # bare boolean predicate, which can't be used as an index equality.
+            models.Index(fields=['post', '-created_date', '-id'], name='comment_post_created_idx'),
+            # admin changelist
+            models.Index(fields=['-created_date', '-id'], name='comment_created_idx'),
+        ]
+
+class VideoUpload(models.Model):
+    """A chunked, resumable upload of a post video, see uploads.py"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='video_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    completed = models.BooleanField(default=False)
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.received}/{self.size})'
+
+class SearchTerm(models.Model):
+    """A normalized word in the full-text index, see search.py"""
+    term = models.CharField(max_length=64, unique=True)
+    # Number of documents containing the term, for BM25's idf
+    doc_freq = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.term
+
+class SearchDocument(models.Model):
+    """Per-post index state: its (weighted) token count and a checksum of the indexed text"""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    length = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=40)
+
+    def __str__(self):
+        return f'Search document for post {self.post_id}'
+
+class SearchPosting(models.Model):
+    """One term's occurrences in one document"""
+    term = models.ForeignKey(SearchTerm, on_delete=models.CASCADE, related_name='postings')
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='postings')
+    frequency = models.PositiveIntegerField()
+    positions = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            # Also the index every query scans: postings by term
+            models.UniqueConstraint(fields=['term', 'document'], name='search_posting_term_doc_uniq'),
+        ]
@@ -0,0 +1,234 @@
+"""
+Full-page cache for anonymous readers.
+
+Only anonymous GET/HEAD requests with no pending messages are served from
+or stored in the cache. Entries are keyed on the path and the ``page``
+parameter and tagged with a global generation; any write to a post,
+category or comment replaces the generation (see ``signals.py``), which
+makes every cached page stale at once.
+
+Stale entries are kept for a grace period. When a page is missing or
+stale, one request takes a short lock and renders it. Concurrent requests
+for the same page get the stale copy, or wait briefly for the fresh one,
+instead of all hitting the database at the same time.
+
+The generation and the locks only work when every worker process shares
+the cache, so pages are not cached at all when the default cache is
+process-local (``LocMemCache``, ``DummyCache``) unless
+``BLOG_SINGLE_PROCESS`` says there is only one process; see ``CACHES`` in
+settings.py.
+
+``anonymous_page_cache`` also wraps async views, using the cache's async
+methods.
+"""
+
+import asyncio
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+
+GENERATION_KEY = 'page_cache:generation'
+CHANGED_AT_KEY = 'page_cache:changed_at'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Seed from the clock so an evicted counter never goes backwards
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def acurrent_generation():
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, time.time_ns(), None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def invalidate_pages():
+    """Mark every cached page as stale"""
+    # A new value rather than incr(), which isn't atomic on every backend:
+    # two concurrent writes must not both end up at the same generation
+    cache.set(GENERATION_KEY, f'{time.time_ns()}-{uuid.uuid4().hex[:8]}', None)
+    cache.set(CHANGED_AT_KEY, time.time(), None)
+
+
+def last_invalidated():
+    """Unix time of the last content change, if the cache still knows it"""
+    return cache.get(CHANGED_AT_KEY)
+
+
+async def alast_invalidated():
+    return await cache.aget(CHANGED_AT_KEY)
+
+
+async def aprime_request(request):
+    """
+    Load the user (and with it the session) with async queries, so the
+    synchronous ``request.user`` and message lookups that follow in an
+    async view don't touch the database
+    """
+    if hasattr(request, 'auser'):
+        request.user = await request.auser()
+
+
+def page_cache_key(request):
+    page = request.GET.get('page', '')
+    digest = hashlib.md5(f'{request.path}?{page}'.encode(), usedforsecurity=False).hexdigest()
+    return f'page_cache:{digest}'
+
+
+def cache_is_shared():
+    """Whether every worker process sees the same cache"""
+    if _setting('BLOG_SINGLE_PROCESS', False):
+        return True
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def is_cacheable_request(request):
+    if not cache_is_shared():
+        return False
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    return len(get_messages(request)) == 0
+
+
+def is_cacheable_response(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and 'private' not in response.get('Cache-Control', '')
+    )
+
+
+def _to_entry(response, generation):
+    return {
+        'generation': generation,
+        'expires': time.time() + _setting('BLOG_PAGE_CACHE_TIMEOUT', 60),
+        'status': response.status_code,
+        'content': response.content,
+        'headers': list(response.items()),
+    }
+
+
+def _from_entry(entry, state):
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers']:
+        response[header] = value
+    response['X-Page-Cache'] = state
+    return response
+
+
+def _is_fresh(entry, generation):
+    return (
+        entry is not None
+        and entry['generation'] == generation
+        and entry['expires'] > time.time()
+    )
+
+
+def _cache_timeout():
+    return _setting('BLOG_PAGE_CACHE_TIMEOUT', 60) + _setting('BLOG_PAGE_CACHE_STALE', 300)
+
+
+def anonymous_page_cache(view_func):
+    """Serve ``view_func`` from the page cache for anonymous readers"""
+    if iscoroutinefunction(view_func):
+        return _async_page_cache(view_func)
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            return view_func(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        generation = current_generation()
+        entry = cache.get(key)
+        if _is_fresh(entry, generation):
+            return _from_entry(entry, 'HIT')
+
+        lock_key = f'{key}:lock'
+        if not cache.add(lock_key, 1, _setting('BLOG_PAGE_CACHE_LOCK_TIMEOUT', 10)):
+            # Someone else is rendering this page
+            if entry is not None:
+                return _from_entry(entry, 'STALE')
+            deadline = time.monotonic() + _setting('BLOG_PAGE_CACHE_WAIT', 2)
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = cache.get(key)
+                if _is_fresh(entry, generation):
+                    return _from_entry(entry, 'HIT')
+            # Only a copy rendered before the last write turned up
+            if entry is not None:
+                return _from_entry(entry, 'STALE')
+            return view_func(request, *args, **kwargs)
+
+        try:
+            response = view_func(request, *args, **kwargs)
+            if is_cacheable_response(response):
+                cache.set(key, _to_entry(response, generation), _cache_timeout())
+                response['X-Page-Cache'] = 'MISS'
+            return response
+        finally:
+            cache.delete(lock_key)
+
+    return _wrapped_view
+
+
+def _async_page_cache(view_func):
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        await aprime_request(request)
+        if not is_cacheable_request(request):
+            return await view_func(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        generation = await acurrent_generation()
+        entry = await cache.aget(key)
+        if _is_fresh(entry, generation):
+            return _from_entry(entry, 'HIT')
+
+        lock_key = f'{key}:lock'
+        if not await cache.aadd(lock_key, 1, _setting('BLOG_PAGE_CACHE_LOCK_TIMEOUT', 10)):
+            if entry is not None:
+                return _from_entry(entry, 'STALE')
+            deadline = time.monotonic() + _setting('BLOG_PAGE_CACHE_WAIT', 2)
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                entry = await cache.aget(key)
+                if _is_fresh(entry, generation):
+                    return _from_entry(entry, 'HIT')
+            if entry is not None:
+                return _from_entry(entry, 'STALE')
+            return await view_func(request, *args, **kwargs)
+
+        try:
+            response = await view_func(request, *args, **kwargs)
+            if is_cacheable_response(response):
+                await cache.aset(key, _to_entry(response, generation), _cache_timeout())
+                response['X-Page-Cache'] = 'MISS'
+            return response
+        finally:
+            await cache.adelete(lock_key)
+
+    return _wrapped_view
@@ -0,0 +1,176 @@
+"""
+Keyset (cursor) pagination for post listings.
+
+Pages are addressed by an opaque token holding the sort key of the row at
+the page boundary, so every page is fetched with one bounded range scan
+instead of a ``COUNT(*)`` plus an ever growing ``OFFSET``.
+"""
+
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+PageLink = namedtuple('PageLink', ['label', 'token', 'current'])
+
+
+class KeysetPage:
+    """A single page of results plus the tokens for its neighbours"""
+
+    def __init__(self, object_list, number, next_token=None, previous_token=None):
+        self.object_list = object_list
+        self.number = number
+        self.next_token = next_token
+        self.previous_token = previous_token
+
+    def __repr__(self):
+        return f'<KeysetPage {self.number}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_token is not None
+
+    def has_previous(self):
+        return self.previous_token is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def page_bar(self):
+        """
+        Elided page bar: first page, an ellipsis for the pages we have no
+        cursor for, then previous / current / next.
+        """
+        links = []
+        if self.has_previous():
+            if self.number > 2:
+                links.append(PageLink(1, '', False))
+            if self.number > 3:
+                links.append(PageLink('…', None, False))
+            links.append(PageLink(self.number - 1, self.previous_token, False))
+        links.append(PageLink(self.number, None, True))
+        if self.has_next():
+            links.append(PageLink(self.number + 1, self.next_token, False))
+            links.append(PageLink('…', None, False))
+        return links
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` newest first on ``keys`` (descending).
+
+    The last key must be unique (normally ``id``) so the ordering is total.
+    """
+
+    def __init__(self, queryset, per_page, keys=('publish_date', 'id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.keys = tuple(keys)
+        self.model = queryset.model
+
+    def encode_cursor(self, obj, direction, number):
+        values = [self.model._meta.get_field(key).value_to_string(obj) for key in self.keys]
+        payload = json.dumps({'k': values, 'd': direction, 'n': number}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values = payload['k']
+            direction = payload['d']
+            number = int(payload['n'])
+            if len(values) != len(self.keys) or direction not in ('next', 'prev') or number < 1:
+                raise ValueError(token)
+            values = [
+                self.model._meta.get_field(key).to_python(value)
+                for key, value in zip(self.keys, values)
+            ]
+        except (ValueError, TypeError, KeyError, binascii.Error, UnicodeDecodeError) as exc:
+            raise InvalidCursor(token) from exc
+        if any(value is None for value in values):
+            raise InvalidCursor(token)
+        return values, direction, number
+
+    def _seek(self, values, op):
+        # (a, b) < (x, y)  ==  a < x OR (a = x AND b < y)
+        condition = Q()
+        for i, key in enumerate(self.keys):
+            term = Q(**{f'{key}__{op}': values[i]})
+            for prior, value in zip(self.keys[:i], values[:i]):
+                term &= Q(**{prior: value})
+            condition |= term
+        return condition
+
+    def _query(self, token):
+        """Return ``(queryset, page number, direction)`` for ``token``"""
+        descending = [f'-{key}' for key in self.keys]
+        if not token:
+            return self.queryset.order_by(*descending)[:self.per_page + 1], 1, None
+
+        values, direction, number = self.decode_cursor(token)
+        if direction == 'next':
+            qs = self.queryset.filter(self._seek(values, 'lt')).order_by(*descending)
+        else:
+            qs = self.queryset.filter(self._seek(values, 'gt')).order_by(*self.keys)
+        return qs[:self.per_page + 1], number, direction
+
+    def _page_from_rows(self, rows, number, direction):
+        if direction is None:
+            return self._build(rows, 1, more_before=False, more_after=len(rows) > self.per_page)
+        if direction == 'next':
+            return self._build(rows, number, more_before=True, more_after=len(rows) > self.per_page)
+
+        more_before = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        if not more_before:
+            number = 1
+        return self._build(rows, number, more_before=more_before, more_after=True, trimmed=True)
+
+    def page(self, token=None):
+        """Return the page addressed by ``token`` (``None`` for the first page)"""
+        qs, number, direction = self._query(token)
+        return self._page_from_rows(list(qs), number, direction)
+
+    async def apage(self, token=None):
+        qs, number, direction = self._query(token)
+        return self._page_from_rows([obj async for obj in qs], number, direction)
+
+    def get_page(self, token=None):
+        """Like ``page()`` but falls back to the first page on a bad token"""
+        try:
+            return self.page(token)
+        except InvalidCursor:
+            return self.page()
+
+    async def aget_page(self, token=None):
+        try:
+            return await self.apage(token)
+        except InvalidCursor:
+            return await self.apage()
+
+    def _build(self, rows, number, more_before, more_after, trimmed=False):
+        if not trimmed:
+            rows = rows[:self.per_page]
+        next_token = previous_token = None
+        if rows and more_after:
+            next_token = self.encode_cursor(rows[-1], 'next', number + 1)
+        if rows and more_before:
+            # Page 1 is always linked without a cursor so it has one canonical URL
+            previous_token = '' if number == 2 else self.encode_cursor(rows[0], 'prev', number - 1)
+        return KeysetPage(rows, number, next_token, previous_token)
@@ -0,0 +1,81 @@
+"""
+Set-based category fixes: assign a category, merge categories, spread
+posts across categories.
+
+Each operation walks the affected posts in primary-key chunks and moves
+every chunk with one ``UPDATE`` per target category, all inside one
+transaction, so it either happens completely or not at all. ``update()``
+leaves ``updated_date`` alone (the posts' content didn't change) and sends
+no signals, so the cached cards of the moved posts, which show the
+category name, the cached pages and the category directory are dropped
+here once it has committed. Used by the ``fix_categories`` command and
+the admin actions.
+"""
+
+import random
+from collections import defaultdict
+
+from django.db import transaction
+
+from . import directory
+from .fragments import invalidate_post_cards
+from .models import Category, Post
+from .page_cache import invalidate_pages
+
+
+def _move(queryset, choose, batch_size):
+    """Set each post's category to ``choose(post_id)``; returns the moved ``(pk, updated_date, comment_count)`` rows"""
+    moved = []
+    last_pk = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'updated_date', 'comment_count')[:batch_size]
+        )
+        if not rows:
+            return moved
+        last_pk = rows[-1][0]
+        by_category = defaultdict(list)
+        for row in rows:
+            by_category[choose(row[0])].append(row[0])
+        for category_id, post_ids in by_category.items():
+            Post.objects.filter(pk__in=post_ids).update(category_id=category_id)
+        moved.extend(rows)
+
+
+def _expire(moved):
+    if moved:
+        invalidate_post_cards(moved)
+        invalidate_pages()
+        directory.invalidate()
+    return len(moved)
+
+
+def assign_category(queryset, category, batch_size=1000):
+    """Put the posts in ``queryset`` in ``category``; returns how many changed"""
+    with transaction.atomic():
+        moved = _move(queryset.exclude(category=category), lambda pk: category.pk, batch_size)
+    return _expire(moved)
+
+
+def merge_categories(sources, target, batch_size=1000):
+    """
+    Move the posts of the ``sources`` categories to ``target`` and delete the
+    sources; returns ``(posts moved, categories deleted)``.
+    """
+    sources = sources.exclude(pk=target.pk)
+    with transaction.atomic():
+        moved = _move(Post.objects.filter(category__in=sources), lambda pk: target.pk, batch_size)
+        deleted = sources.delete()[1].get(Category._meta.label, 0)
+    return _expire(moved), deleted
+
+
+def spread_categories(queryset, categories=None, seed=None, batch_size=1000):
+    """Give each post in ``queryset`` a random category (of ``categories``, default all); returns how many were set"""
+    category_ids = list((categories if categories is not None else Category.objects.all()).order_by('pk').values_list('pk', flat=True))
+    if not category_ids:
+        raise ValueError('There are no categories to spread posts across')
+    rng = random.Random(seed)
+    with transaction.atomic():
+        moved = _move(queryset, lambda pk: rng.choice(category_ids), batch_size)
+    return _expire(moved)
@@ -0,0 +1,334 @@
+"""
+Full-text search over post titles and content.
+
+Posts are tokenized into an inverted index kept in its own tables:
+``SearchTerm`` (the dictionary, with document frequencies),
+``SearchDocument`` (per-post length) and ``SearchPosting`` (term
+frequency and word positions per post). ``index_post()`` runs on every
+post save and rewrites only that post's postings, and only when its text
+actually changed; ``remove_post()`` runs before a post is deleted.
+
+Stop words ("the", "and", ...) are left out of the index: they occur in
+nearly every post, so their postings would make up most of the index and
+most of the work of any query using them, while adding almost nothing to
+the BM25 score. Query terms that are stop words are dropped; inside a
+phrase they still hold their place, so ``"state of the art"`` matches
+"state", then any two words, then "art".
+
+Queries are ANDed together and ranked with BM25 in the database:
+
+* ``word``: posts containing the word
+* ``wor*``: posts containing any word starting with ``wor``
+* ``"two words"``: posts containing the words next to each other
+
+Phrases are matched in SQL on their words first, then checked against the
+stored positions.
+"""
+
+import hashlib
+import math
+import re
+import unicodedata
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Case, Count, F, FloatField, Q, Sum, Value, When
+from django.utils.html import strip_tags
+
+from .models import SearchDocument, SearchPosting, SearchTerm
+
+TOKEN_RE = re.compile(r'\w+')
+QUERY_RE = re.compile(r'"([^"]*)"?|(\S+)')
+
+MAX_TERM_LENGTH = 64
+MIN_PREFIX_LENGTH = 2
+# Prefixes expand to at most this many of their most common words
+PREFIX_EXPANSIONS = 50
+# A title word counts as this many content words
+TITLE_WEIGHT = 3
+# Bump when tokenizing changes, so every post is reindexed
+INDEX_VERSION = 2
+
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for if in into is it no not of on or such '
+    'that the their then there these they this to was will with'.split()
+)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+STATS_KEY = 'search:stats'
+STATS_TIMEOUT = 300
+
+PHRASE_BATCH = 200
+MAX_PHRASE_CANDIDATES = 5000
+FILTER_LIMIT = 1000
+
+Query = namedtuple('Query', ['terms', 'prefixes', 'phrases'])
+SearchHit = namedtuple('SearchHit', ['post_id', 'score'])
+
+
+def normalize(text):
+    """Casefold and strip accents so e.g. "Café" and "cafe" are one term"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(normalize(strip_tags(text))) if len(t) <= MAX_TERM_LENGTH]
+
+
+def parse_query(text):
+    terms, prefixes, phrases = [], [], []
+    for quoted, word in QUERY_RE.findall(text):
+        is_prefix = not quoted and word.endswith('*')
+        tokens = tokenize(quoted or word)
+        if is_prefix and tokens and len(tokens[-1]) >= MIN_PREFIX_LENGTH:
+            prefixes.append(tokens.pop())
+        if len(tokens) > 1:
+            # Quoted text, or a word such as "don't" that splits into several
+            phrases.append(tokens)
+        terms.extend(t for t in tokens if t not in STOP_WORDS)
+    return Query(list(dict.fromkeys(terms)), list(dict.fromkeys(prefixes)), phrases)
+
+
+# Indexing
+
+def _document_postings(post):
+    """Return ``({term: [frequency, positions]}, length)`` for ``post``"""
+    title = tokenize(post.title)
+    content = tokenize(post.content)
+    postings = {}
+    for position, term in enumerate(title):
+        if term in STOP_WORDS:
+            continue
+        entry = postings.setdefault(term, [0, []])
+        entry[0] += TITLE_WEIGHT
+        entry[1].append(position)
+    # Leave a gap so a phrase can't match across the title and content
+    for position, term in enumerate(content, len(title) + 1):
+        if term in STOP_WORDS:
+            continue
+        entry = postings.setdefault(term, [0, []])
+        entry[0] += 1
+        entry[1].append(position)
+    return postings, len(title) * TITLE_WEIGHT + len(content)
+
+
+def _checksum(post):
+    return hashlib.sha1(f'{INDEX_VERSION}\0{post.title}\0{post.content}'.encode(), usedforsecurity=False).hexdigest()
+
+
+def _term_ids(words):
+    """Return ``{word: term id}``, creating missing terms"""
+    words = list(words)
+    ids = {}
+    for i in range(0, len(words), 500):
+        chunk = words[i:i + 500]
+        ids.update(SearchTerm.objects.filter(term__in=chunk).values_list('term', 'id'))
+        missing = [w for w in chunk if w not in ids]
+        if missing:
+            SearchTerm.objects.bulk_create([SearchTerm(term=w) for w in missing], ignore_conflicts=True)
+            ids.update(SearchTerm.objects.filter(term__in=missing).values_list('term', 'id'))
+    return ids
+
+
+def _adjust_doc_freq(term_ids, delta):
+    # Sorted so concurrent indexers lock terms in the same order
+    term_ids = sorted(term_ids)
+    for i in range(0, len(term_ids), 500):
+        SearchTerm.objects.filter(pk__in=term_ids[i:i + 500]).update(doc_freq=F('doc_freq') + delta)
+
+
+def index_post(post):
+    """
+    Bring ``post``'s entries in the index up to date.
+    Returns False when its title and content haven't changed since they were indexed.
+    """
+    checksum = _checksum(post)
+    # Unlocked first: most saves don't change the text
+    if SearchDocument.objects.filter(pk=post.pk, checksum=checksum).exists():
+        return False
+
+    postings, length = _document_postings(post)
+    with transaction.atomic():
+        # Insert-if-missing, then lock the row: concurrent saves of the same
+        # post queue up here instead of both inserting it
+        SearchDocument.objects.bulk_create(
+            [SearchDocument(pk=post.pk, length=0, checksum='')], ignore_conflicts=True,
+        )
+        document = SearchDocument.objects.select_for_update().get(pk=post.pk)
+        if document.checksum == checksum:
+            return False
+        old_ids = set(document.postings.values_list('term_id', flat=True))
+        if old_ids:
+            document.postings.all().delete()
+        document.length, document.checksum = length, checksum
+        document.save(update_fields=['length', 'checksum'])
+
+        ids = _term_ids(postings)
+        new_ids = set(ids.values())
+        _adjust_doc_freq(old_ids - new_ids, -1)
+        _adjust_doc_freq(new_ids - old_ids, 1)
+        SearchPosting.objects.bulk_create(
+            [
+                SearchPosting(term_id=ids[term], document_id=post.pk, frequency=frequency, positions=positions)
+                for term, (frequency, positions) in postings.items()
+            ],
+            batch_size=1000,
+        )
+    return True
+
+
+def remove_post(post_id):
+    with transaction.atomic():
+        postings = SearchPosting.objects.filter(document_id=post_id)
+        _adjust_doc_freq(postings.values_list('term_id', flat=True), -1)
+        postings.delete()
+        SearchDocument.objects.filter(pk=post_id).delete()
+
+
+def index_stats():
+    """Return ``(document count, average document length)``, cached briefly"""
+    stats = cache.get(STATS_KEY)
+    if stats is None:
+        totals = SearchDocument.objects.aggregate(count=Count('pk'), length=Avg('length'))
+        stats = (totals['count'], totals['length'] or 0.0)
+        cache.set(STATS_KEY, stats, STATS_TIMEOUT)
+    return stats
+
+
+# Querying
+
+def _clauses(query):
+    """
+    Resolve ``query`` to a list of term-id lists (one per word or prefix, all
+    of which must match) and ``{term id: doc_freq}``. Returns ``None`` when
+    some clause can't match anything.
+    """
+    words = set(query.terms)
+    for phrase in query.phrases:
+        words.update(term for term in phrase if term not in STOP_WORDS)
+    found = {
+        term: (pk, doc_freq)
+        for term, pk, doc_freq in SearchTerm.objects.filter(term__in=words, doc_freq__gt=0).values_list('term', 'id', 'doc_freq')
+    }
+    if len(found) < len(words):
+        return None
+
+    clauses = [[found[term][0]] for term in query.terms]
+    doc_freqs = dict(found.values())
+    for prefix in query.prefixes:
+        expansions = list(
+            SearchTerm.objects.filter(term__istartswith=prefix, doc_freq__gt=0)
+            .order_by('-doc_freq')
+            .values_list('id', 'doc_freq')[:PREFIX_EXPANSIONS]
+        )
+        if not expansions:
+            return None
+        clauses.append([pk for pk, _ in expansions])
+        doc_freqs.update(expansions)
+    return clauses, doc_freqs, {term: pk for term, (pk, _) in found.items()}
+
+
+def _ranked(clauses, doc_freqs, posts):
+    """Postings grouped per document, BM25 score descending"""
+    count, avg_length = index_stats()
+    count = max(count, 1)
+    avg_length = avg_length or 1.0
+
+    weight = Case(
+        *[
+            When(term_id=pk, then=Value(math.log(1 + (count - df + 0.5) / (df + 0.5)) * (K1 + 1)))
+            for pk, df in doc_freqs.items()
+        ],
+        output_field=FloatField(),
+    )
+    saturation = F('frequency') + Value(K1 * (1 - B)) + F('document__length') * Value(K1 * B / avg_length)
+
+    postings = SearchPosting.objects.filter(term_id__in=doc_freqs)
+    if posts is not None:
+        postings = postings.filter(document_id__in=posts.values('pk'))
+    ranked = postings.values('document_id').annotate(score=Sum(weight * F('frequency') / saturation))
+    if len(clauses) > 1:
+        # One count per clause: a posting can satisfy several (e.g. "data dat*")
+        matched = {f'clause_{i}': Count('term_id', filter=Q(term_id__in=ids)) for i, ids in enumerate(clauses)}
+        ranked = ranked.annotate(**matched).filter(**{f'{name}__gte': 1 for name in matched})
+    return ranked.order_by('-score', '-document_id')
+
+
+def _has_phrase(positions, phrase):
+    # Stop words aren't indexed; they only keep their place in the phrase
+    words = [(offset, term) for offset, term in enumerate(phrase) if term not in STOP_WORDS]
+    if not words:
+        return True
+    first_offset, first = words[0]
+    starts = {p - first_offset for p in positions.get(first, ())}
+    for offset, term in words[1:]:
+        starts &= {p - offset for p in positions.get(term, ())}
+        if not starts:
+            return False
+    return bool(starts)
+
+
+def _phrase_matches(rows, phrases, term_ids):
+    """Keep the ``(post id, score)`` rows whose positions contain every phrase"""
+    phrase_ids = {term_ids[term] for phrase in phrases for term in phrase if term not in STOP_WORDS}
+    names = {pk: term for term, pk in term_ids.items()}
+    positions = {}
+    for document_id, term_id, stored in SearchPosting.objects.filter(
+        document_id__in=[post_id for post_id, _ in rows], term_id__in=phrase_ids,
+    ).values_list('document_id', 'term_id', 'positions'):
+        positions.setdefault(document_id, {})[names[term_id]] = stored
+    return [
+        (post_id, score) for post_id, score in rows
+        if all(_has_phrase(positions.get(post_id, {}), phrase) for phrase in phrases)
+    ]
+
+
+def search_posts(text, posts=None, offset=0, limit=20):
+    """
+    Return up to ``limit`` ``SearchHit``s for the query ``text``, best first,
+    skipping the first ``offset``. ``posts`` optionally restricts the search
+    to a queryset of posts.
+    """
+    query = parse_query(text)
+    if not query.terms and not query.prefixes:
+        return []
+    resolved = _clauses(query)
+    if resolved is None:
+        return []
+    clauses, doc_freqs, term_ids = resolved
+    ranked = _ranked(clauses, doc_freqs, posts).values_list('document_id', 'score')
+
+    if not query.phrases:
+        return [SearchHit(*row) for row in ranked[offset:offset + limit]]
+
+    hits = []
+    for start in range(0, MAX_PHRASE_CANDIDATES, PHRASE_BATCH):
+        rows = list(ranked[start:start + PHRASE_BATCH])
+        hits.extend(_phrase_matches(rows, query.phrases, term_ids))
+        if len(hits) >= offset + limit or len(rows) < PHRASE_BATCH:
+            break
+    return [SearchHit(*row) for row in hits[offset:offset + limit]]
+
+
+def filter_posts(queryset, text):
+    """
+    Restrict a post queryset to the posts matching ``text`` (e.g. for the
+    admin changelist, which keeps its own ordering)
+    """
+    query = parse_query(text)
+    if not query.terms and not query.prefixes:
+        return queryset.none()
+    if query.phrases:
+        # Positions are checked in Python, so only the best matches are kept
+        hits = search_posts(text, queryset, limit=FILTER_LIMIT)
+        return queryset.filter(pk__in=[hit.post_id for hit in hits])
+    resolved = _clauses(query)
+    if resolved is None:
+        return queryset.none()
+    clauses, doc_freqs, _ = resolved
+    return queryset.filter(pk__in=_ranked(clauses, doc_freqs, None).order_by().values('document_id'))
@@ -0,0 +1,125 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, pre_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .changelist import filter_choices_key
+from . import directory
+from .backends import forget_user
+from .counters import adjust_comment_count
+from .fragments import invalidate_post_cards
+from .images import delete_post_derivatives, refresh_post_image_meta
+from .models import Category, Comment, Post
+from .page_cache import invalidate_pages
+from .search import index_post, remove_post
+
+
+def saved_any(update_fields, *names):
+    """Whether a save with ``update_fields`` may have written any of ``names``"""
+    return update_fields is None or not update_fields.isdisjoint(names)
+
+
+@receiver(post_save, sender=Post)
+def build_image_derivatives(sender, instance, raw, update_fields, **kwargs):
+    if not raw and saved_any(update_fields, 'image'):
+        refresh_post_image_meta(instance)
+
+
+@receiver(post_delete, sender=Post)
+def drop_image_derivatives(sender, instance, **kwargs):
+    delete_post_derivatives(instance)
+
+
+@receiver(post_save, sender=Post)
+def update_search_index(sender, instance, raw, update_fields, **kwargs):
+    if not raw and saved_any(update_fields, 'title', 'content'):
+        index_post(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def remove_from_search_index(sender, instance, **kwargs):
+    # Before the cascade removes the postings, so doc_freq can be decremented
+    remove_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def drop_deleted_post_card(sender, instance, **kwargs):
+    invalidate_post_cards([(instance.pk, instance.updated_date, instance.comment_count)])
+
+
+@receiver(post_save, sender=Category)
+def drop_category_post_cards(sender, instance, created, **kwargs):
+    # Cards show the category name, which doesn't touch Post.updated_date
+    if not created:
+        invalidate_post_cards(
+            instance.post_set.values_list('pk', 'updated_date', 'comment_count').iterator(chunk_size=2000)
+        )
+
+
+@receiver(pre_delete, sender=Category)
+def drop_deleted_category_post_cards(sender, instance, **kwargs):
+    # Posts are detached with SET_NULL, an UPDATE that sends no signals
+    invalidate_post_cards(
+        instance.post_set.values_list('pk', 'updated_date', 'comment_count').iterator(chunk_size=2000)
+    )
+
+
+@receiver(pre_save, sender=Comment)
+def remember_counted_post(sender, instance, raw, **kwargs):
+    # The post whose comment_count currently includes this comment, if any
+    instance._counted_post_id = None
+    if instance.pk and not raw:
+        instance._counted_post_id = (
+            Comment.objects.filter(pk=instance.pk, approved=True).values_list('post_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Comment)
+def update_comment_count(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    counted = getattr(instance, '_counted_post_id', None)
+    current = instance.post_id if instance.approved else None
+    if counted != current:
+        if counted:
+            adjust_comment_count(counted, -1)
+        if current:
+            adjust_comment_count(current, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(sender, instance, **kwargs):
+    if instance.approved:
+        adjust_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def drop_category_filter_choices(sender, **kwargs):
+    cache.delete(filter_choices_key(Post._meta.get_field('category')))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_category_directory(sender, update_fields=None, **kwargs):
+    # Post counts only depend on a post's category and status
+    if sender is Category or saved_any(update_fields, 'category', 'status'):
+        directory.invalidate()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def expire_cached_pages(sender, **kwargs):
+    invalidate_pages()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
@@ -0,0 +1,177 @@
+"""
+Range-aware responses for files in MEDIA_ROOT.
+
+``media_response()`` streams a stored file in blocks instead of reading it
+into memory, answers ``Range`` / ``If-Range`` requests with 206 Partial
+Content so transfers can resume, and can hand the transfer to the web
+server instead (``BLOG_MEDIA_OFFLOAD``):
+
+* ``None``: stream through Django. Under a server that provides
+  ``wsgi.file_wrapper`` (gunicorn, uWSGI) this becomes ``sendfile()``.
+* ``'x-accel-redirect'``: nginx serves ``BLOG_MEDIA_ACCEL_PREFIX + name``
+  from an ``internal`` location aliased to MEDIA_ROOT.
+* ``'x-sendfile'``: Apache mod_xsendfile / lighttpd serve the absolute path.
+"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+BLOCK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class RangeFile:
+    """
+    Read-only view of ``length`` bytes of ``file`` starting at ``start``.
+
+    ``fileno()`` is kept so ``wsgi.file_wrapper`` can still use sendfile();
+    servers doing so honour the current offset and the Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Return ``(start, end)`` (inclusive) for a single-range ``Range`` header,
+    or ``None`` when the header should be ignored and the whole file sent.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Malformed or multi-range requests: a full response is allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            # An empty file has no bytes to satisfy any range
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, min(end, size - 1)
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def if_range_matches(request, etag, mtime):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        # If-Range requires a strong comparison
+        return value == etag
+    date = parse_http_date_safe(value)
+    return date is not None and int(mtime) <= date
+
+
+def offload_response(fieldfile, content_type, disposition):
+    mode = getattr(settings, 'BLOG_MEDIA_OFFLOAD', None)
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'BLOG_MEDIA_ACCEL_PREFIX', '/protected-media/')
+        # nginx decodes the URI, so names with spaces or non-ASCII characters survive
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(fieldfile.name.lstrip('/'))
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = fieldfile.path
+    else:
+        raise ValueError(f'Unknown BLOG_MEDIA_OFFLOAD mode: {mode!r}')
+    if disposition:
+        response['Content-Disposition'] = disposition
+    return response
+
+
+def media_response(request, fieldfile, content_type=None, as_attachment=False, cache_control=None):
+    """Return a streaming, range-capable response for ``fieldfile``"""
+    filename = os.path.basename(fieldfile.name)
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(as_attachment, filename)
+
+    if getattr(settings, 'BLOG_MEDIA_OFFLOAD', None):
+        response = offload_response(fieldfile, content_type, disposition)
+        if cache_control:
+            response['Cache-Control'] = cache_control
+        return response
+
+    file = open(fieldfile.path, 'rb')
+    stat = os.fstat(file.fileno())
+    size = stat.st_size
+    etag = file_etag(stat)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        file.close()
+        if cache_control:
+            not_modified['Cache-Control'] = cache_control
+        return not_modified
+
+    start, end, status = 0, size - 1, 200
+    range_header = request.headers.get('Range')
+    if range_header and request.method in ('GET', 'HEAD') and if_range_matches(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+
+    length = end - start + 1 if size else 0
+    response = FileResponse(
+        RangeFile(file, start, length),
+        status=status,
+        content_type=content_type,
+        as_attachment=as_attachment,
+        filename=filename,
+    )
+    response.block_size = BLOCK_SIZE
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,47 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, meta, sizes='100vw', **attrs):
+    """
+    Render ``image`` as a lazily loaded ``<picture>`` with WebP and
+    original-format ``srcset``s built from ``meta`` (``Post.image_meta``).
+
+    Usage::
+
+        {% responsive_image post.image post.image_meta sizes="50vw" alt=post.title class="card-img-top" %}
+    """
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    meta = meta or {}
+
+    if meta.get('placeholder'):
+        style = attrs.get('style', '')
+        if style and not style.rstrip().endswith(';'):
+            style += ';'
+        attrs['style'] = f"{style} background: url('{meta['placeholder']}') center / cover no-repeat;".strip()
+    if meta.get('width') and meta.get('height'):
+        attrs.setdefault('width', meta['width'])
+        attrs.setdefault('height', meta['height'])
+
+    variants = meta.get('variants') or []
+    if not variants:
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+
+    storage = image.storage
+    srcset = ', '.join(f"{storage.url(v['src'])} {v['width']}w" for v in variants)
+    webp_srcset = ', '.join(f"{storage.url(v['webp'])} {v['width']}w" for v in variants)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        webp_srcset,
+        sizes,
+        storage.url(variants[-1]['src']),
+        srcset,
+        sizes,
+        flatatt(attrs),
+    )
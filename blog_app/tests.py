@@ -1,3 +1,1909 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+import threading
+import tracemalloc
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.http import HttpResponse
+from django.db.backends.sqlite3 import base as sqlite_base
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.urls import reverse
+from PIL import Image
+from django.utils import timezone
+
+from . import async_urls, backends, changelist, counters, dataset, diagnostics, directory, remediation, urls as blog_urls, views
+from .benchmarks import compare_runs, percentile, summarize
+from .management.commands.benchmark_views import VIEW_REQUESTS
+from blog_project import instrumentation, profiling
+from blog_project.db import pool as db_pool, routers
+from .forms import PostForm
+from .fragments import card_key, render_post_cards
+from .models import Category, Comment, Post, SearchDocument, SearchPosting, SearchTerm, VideoUpload
+from . import page_cache
+from .page_cache import page_cache_key
+from .pagination import InvalidCursor, KeysetPaginator
+from .search import filter_posts, index_post, parse_query, search_posts
+from .uploads import start_upload
+
+
+class BlogTestCase(TestCase):
+    """Start every test with an empty cache so cached pages don't leak between tests"""
+
+    def setUp(self):
+        cache.clear()
+
+
+class TempMediaMixin:
+    """Point MEDIA_ROOT at a throwaway directory for the test"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+def make_posts(author, count, category=None, status='published', start=None):
+    start = start or timezone.now()
+    return [
+        Post.objects.create(
+            title=f'Post {i}',
+            slug=f'post-{i}',
+            author=author,
+            content='Lorem ipsum dolor sit amet',
+            category=category,
+            status=status,
+            # Pairs of posts share a timestamp so the id tie-breaker is exercised
+            publish_date=start - timedelta(minutes=i // 2),
+        )
+        for i in range(count)
+    ]
+
+
+class KeysetPaginatorTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.posts = make_posts(cls.author, 23)
+        cls.expected = sorted(cls.posts, key=lambda p: (p.publish_date, p.pk), reverse=True)
+
+    def paginator(self):
+        return KeysetPaginator(Post.objects.all(), 5)
+
+    def test_walks_forward_and_back_without_gaps(self):
+        paginator = self.paginator()
+        page = paginator.page()
+        seen = list(page)
+        pages = [page]
+        while page.has_next():
+            page = paginator.page(page.next_token)
+            seen.extend(page)
+            pages.append(page)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([p.number for p in pages], [1, 2, 3, 4, 5])
+        self.assertFalse(pages[-1].has_next())
+
+        backwards = []
+        while page.has_previous():
+            page = paginator.get_page(page.previous_token)
+            backwards = list(page) + backwards
+        self.assertEqual(page.number, 1)
+        self.assertEqual(backwards, self.expected[:20])
+
+    def test_page_bar_is_elided(self):
+        paginator = self.paginator()
+        page = paginator.page()
+        for _ in range(3):
+            page = paginator.page(page.next_token)
+        labels = [link.label for link in page.page_bar()]
+        self.assertEqual(labels, [1, '…', 3, 4, 5, '…'])
+        self.assertEqual(page.page_bar()[0].token, '')
+
+    def test_bad_token(self):
+        paginator = self.paginator()
+        with self.assertRaises(InvalidCursor):
+            paginator.page('not-a-cursor')
+        self.assertEqual(paginator.get_page('not-a-cursor').number, 1)
+
+
+class ListingViewTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Tech')
+        make_posts(cls.author, 12, category=cls.category)
+
+    def test_home_paginates_with_cursor(self):
+        response = self.client.get(reverse('home'))
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 6)
+        response = self.client.get(reverse('home'), {'page': page.next_token})
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+    def test_category_and_user_posts_paginate(self):
+        response = self.client.get(reverse('category_posts', args=[self.category.pk]))
+        self.assertEqual(len(response.context['page_obj']), 9)
+        self.assertEqual(response.context['post_count'], 12)
+
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('user_posts'))
+        self.assertEqual(len(response.context['page_obj']), 9)
+        self.assertTrue(response.context['page_obj'].has_next())
+
+
+class QueryPlanTests(BlogTestCase):
+    """
+    EXPLAIN every blog query a view issues and fail on full table scans or
+    filesorts. Runs against SQLite locally and MySQL when that is configured.
+    """
+
+    TABLES = ('blog_app_post', 'blog_app_comment')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Tech')
+        posts = make_posts(cls.author, 30, category=cls.category)
+        make_posts(cls.author, 10, status='draft')
+        cls.post = posts[0]
+        for i in range(5):
+            Comment.objects.create(post=cls.post, author=cls.author, content=f'Comment {i}')
+
+    def capture(self, url):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            (sql, params) for sql, params in statements
+            if sql.lstrip().upper().startswith('SELECT') and any(t in sql for t in self.TABLES)
+        ]
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql, params)
+                columns = [col[0].lower() for col in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def plan_problems(self, plan):
+        problems = []
+        for step in plan:
+            if connection.vendor == 'mysql':
+                if step['table'] in self.TABLES and step['type'] == 'ALL':
+                    problems.append(f"full scan of {step['table']}")
+                if 'filesort' in (step.get('extra') or ''):
+                    problems.append(f"filesort on {step['table']}")
+            else:
+                if any(step == f'SCAN {t}' or step.startswith(f'SCAN {t} ') for t in self.TABLES):
+                    problems.append(step)
+                if 'TEMP B-TREE' in step:
+                    problems.append(step)
+        return problems
+
+    def assertIndexedPlans(self, url):
+        queries = self.capture(url)
+        self.assertTrue(queries, f'{url} issued no blog queries')
+        for sql, params in queries:
+            plan = self.explain(sql, params)
+            problems = self.plan_problems(plan)
+            self.assertFalse(problems, f'{url}: {sql}\n{plan}')
+
+    def test_home(self):
+        self.assertIndexedPlans(reverse('home'))
+        page = KeysetPaginator(Post.objects.filter(status='published'), 6).page()
+        self.assertIndexedPlans(reverse('home') + f'?page={page.next_token}')
+
+    def test_category_posts(self):
+        self.assertIndexedPlans(reverse('category_posts', args=[self.category.pk]))
+
+    def test_user_posts(self):
+        self.client.force_login(self.author)
+        self.assertIndexedPlans(reverse('user_posts'))
+
+    def test_post_detail(self):
+        self.assertIndexedPlans(reverse('post_detail', args=[self.post.pk]))
+
+
+# Maximum number of queries per URL name, for a logged-in author. Session
+# and user lookups are included. `None` exempts a URL from the harness.
+QUERY_BUDGETS = {
+    'home': 5,
+    'register': 2,
+    'login': 2,
+    'logout': 3,
+    'create_post': 3,
+    'post_detail': 5,
+    'post_comments': 5,
+    'update_post': 4,
+    'delete_post': 3,
+    'category_posts': 6,
+    'user_posts': 3,
+    'search': 2,
+    'download_post_image': 3,
+    'stream_post_video': 3,
+    'start_video_upload': 3,
+    'video_upload_status': 3,
+    'upload_video_chunk': 6,  # unlocked pre-check, then the locked re-check
+    'db_pool_stats': 2,
+    'profile_list': 3,  # admin chrome: user and group permissions
+    'download_profile': 2,
+}
+
+
+class QueryBudgetTests(TempMediaMixin, BlogTestCase):
+    """Fail when a view's query count grows past its budget (e.g. an N+1)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Staff, so the ops views answer too
+        cls.author = User.objects.create_user('author', password='pass', is_staff=True)
+        # Distinct authors, categories and commenters so any per-row lookup shows up
+        for i in range(8):
+            user = User.objects.create_user(f'user{i}', password='pass')
+            category = Category.objects.create(name=f'Category {i}')
+            make_posts(user, 3, category=category)
+        cls.category = category
+        cls.post = make_posts(cls.author, 1, category=category)[0]
+        for user in User.objects.all():
+            Comment.objects.create(post=cls.post, author=user, content='Nice post')
+
+    def setUp(self):
+        super().setUp()
+        ops_settings = override_settings(
+            BLOG_CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'tmp'),
+            BLOG_UPLOAD_CHUNK_SIZE=10,
+            BLOG_PROFILE_DIR=os.path.join(self.media_root, 'profiles'),
+        )
+        ops_settings.enable()
+        self.addCleanup(ops_settings.disable)
+        # Files the download and streaming views serve
+        for name, data in (('blog_images/photo.bin', b'image'), ('blog_videos/clip.mp4', b'video')):
+            os.makedirs(os.path.join(self.media_root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(self.media_root, name), 'wb') as f:
+                f.write(data)
+        Post.objects.filter(pk=self.post.pk).update(image='blog_images/photo.bin', video='blog_videos/clip.mp4')
+        os.makedirs(os.path.join(self.media_root, 'profiles'))
+        with open(os.path.join(self.media_root, 'profiles', 'capture.speedscope.json'), 'w') as f:
+            f.write('{}')
+        self.upload = start_upload(self.author, 'clip.mp4', 20, '')
+
+    def request_for(self, name):
+        """``(method, args, data)`` for one request to the view"""
+        if name in ('post_detail', 'post_comments', 'update_post', 'delete_post', 'download_post_image', 'stream_post_video'):
+            return 'get', [self.post.pk], None
+        if name == 'category_posts':
+            return 'get', [self.category.pk], None
+        if name == 'start_video_upload':
+            return 'post', [], {'filename': 'clip.mp4', 'size': 20}
+        if name == 'video_upload_status':
+            return 'get', [self.upload.pk], None
+        if name == 'upload_video_chunk':
+            return 'post', [self.upload.pk, 0], b'0123456789'
+        if name == 'download_profile':
+            return 'get', ['capture', 'speedscope'], None
+        return 'get', [], None
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in blog_urls.urlpatterns}
+        self.assertEqual(names - set(QUERY_BUDGETS), set())
+        self.assertNotIn(None, QUERY_BUDGETS.values())
+
+    def test_views_stay_within_budget(self):
+        for name, budget in QUERY_BUDGETS.items():
+            # logout ends the session, so every view gets a fresh login
+            self.client.force_login(self.author)
+            method, args, data = self.request_for(name)
+            kwargs = {'data': data}
+            if isinstance(data, bytes):
+                kwargs.update(content_type='application/octet-stream', headers={'X-Chunk-SHA256': hashlib.sha256(data).hexdigest()})
+            with self.subTest(name), CaptureQueriesContext(connection) as ctx:
+                response = getattr(self.client, method)(reverse(name, args=args), **kwargs)
+                self.assertIn(response.status_code, (200, 201, 302), name)
+            queries = '\n'.join(q['sql'] for q in ctx.captured_queries)
+            self.assertLessEqual(len(ctx), budget, f'{name} ran {len(ctx)} queries:\n{queries}')
+
+
+class PostCardCacheTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='pass')
+        self.category = Category.objects.create(name='Tech')
+        self.post = make_posts(self.author, 1, category=self.category)[0]
+
+    def test_cards_are_cached_per_version(self):
+        html = render_post_cards([self.post], 'home')
+        self.assertIn('Tech', html)
+        self.assertEqual(cache.get(card_key('home', self.post.pk, self.post.updated_date, 0)), html)
+
+        self.post.title = 'Renamed'
+        self.post.save()
+        self.assertIn('Renamed', render_post_cards([self.post], 'home'))
+
+    def test_category_change_invalidates_cards(self):
+        render_post_cards([self.post], 'home')
+        self.category.name = 'Science'
+        self.category.save()
+        self.assertIsNone(cache.get(card_key('home', self.post.pk, self.post.updated_date, 0)))
+        self.assertIn('Science', render_post_cards([Post.objects.get(pk=self.post.pk)], 'home'))
+
+    def test_delete_invalidates_cards(self):
+        render_post_cards([self.post], 'category')
+        key = card_key('category', self.post.pk, self.post.updated_date, 0)
+        self.post.delete()
+        self.assertIsNone(cache.get(key))
+
+
+class PageCacheTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='pass')
+        self.post = make_posts(self.author, 1)[0]
+        self.url = reverse('post_detail', args=[self.post.pk])
+
+    def test_anonymous_pages_are_cached(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'MISS')
+        # Only the conditional-GET validator query runs
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, self.post.title)
+
+    def test_writes_expire_cached_pages(self):
+        self.client.get(self.url)
+        Comment.objects.create(post=self.post, author=self.author, content='First!')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'First!')
+
+    def test_concurrent_miss_gets_stale_copy(self):
+        self.client.get(self.url)
+        self.post.title = 'Updated title'
+        self.post.save()
+        # Another worker holds the render lock for this page
+        key = page_cache_key(RequestFactory().get(self.url))
+        cache.add(f'{key}:lock', 1)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+        self.assertNotContains(response, 'Updated title')
+
+    def test_waiting_request_does_not_serve_old_generation_as_hit(self):
+        key = page_cache_key(RequestFactory().get(self.url))
+        cache.add(f'{key}:lock', 1)
+
+        def render_finishes(seconds):
+            # The lock holder started rendering before the last write
+            cache.set(key, page_cache._to_entry(HttpResponse('old page'), 'old-generation'))
+
+        with mock.patch.object(page_cache.time, 'sleep', render_finishes), self.settings(BLOG_PAGE_CACHE_WAIT=0.01):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+
+    def test_process_local_cache_is_not_used_for_pages(self):
+        with self.settings(BLOG_SINGLE_PROCESS=False):
+            self.assertFalse(page_cache.cache_is_shared())
+            self.client.get(self.url)
+            self.assertNotIn('X-Page-Cache', self.client.get(self.url))
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        with self.settings(BLOG_SINGLE_PROCESS=False, CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }):
+            self.assertTrue(page_cache.cache_is_shared())
+
+    def test_logged_in_users_bypass_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(self.author)
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Edit')
+
+
+class ConditionalGetTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='pass')
+        self.post = make_posts(self.author, 1)[0]
+        self.url = reverse('post_detail', args=[self.post.pk])
+
+    def test_revalidation_returns_304_without_rendering(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_comment_changes_validators(self):
+        etag = self.client.get(self.url)['ETag']
+        Comment.objects.create(post=self.post, author=self.author, content='First!')
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_login_changes_etag(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('home'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class DownloadPostImageTests(TempMediaMixin, BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'blog_images'))
+        self.data = bytes(range(256)) * 40
+        with open(os.path.join(self.media_root, 'blog_images', 'photo.jpg'), 'wb') as f:
+            f.write(self.data)
+
+        self.author = User.objects.create_user('author', password='pass')
+        self.post = make_posts(self.author, 1)[0]
+        self.post.image = 'blog_images/photo.jpg'
+        self.post.save()
+        self.url = reverse('download_post_image', args=[self.post.pk])
+        self.client.force_login(self.author)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_download_streams(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertIn('attachment; filename="photo.jpg"', response['Content-Disposition'])
+        self.assertEqual(self.body(response), self.data)
+
+    def test_ranges(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(self.body(response), self.data[100:200])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-10'})
+        self.assertEqual(self.body(response), self.data[-10:])
+
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(self.data)}-'})
+        self.assertEqual(response.status_code, 416)
+
+    def test_empty_file_ranges_are_not_satisfiable(self):
+        open(os.path.join(self.media_root, 'blog_images', 'photo.jpg'), 'wb').close()
+        for header in ('bytes=-10', 'bytes=0-'):
+            response = self.client.get(self.url, headers={'Range': header})
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */0')
+        response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response['Content-Length']), (200, '0'))
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    @override_settings(BLOG_MEDIA_OFFLOAD='x-accel-redirect')
+    def test_offload_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/blog_images/photo.jpg')
+        self.assertEqual(response.content, b'')
+
+        Post.objects.filter(pk=self.post.pk).update(image='blog_images/my café photo.jpg')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/blog_images/my%20caf%C3%A9%20photo.jpg')
+
+    def test_only_author_may_download(self):
+        self.client.force_login(User.objects.create_user('other', password='pass'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class ImageDerivativeTests(TempMediaMixin, BlogTestCase):
+    def upload(self, size=(1500, 1000), orientation=None, name='photo.jpg', fmt='JPEG'):
+        image = Image.new('RGB', size, (200, 30, 30))
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        if orientation:
+            exif[0x0112] = orientation
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='pass')
+        self.post = make_posts(self.author, 1)[0]
+
+    def test_save_builds_variants(self):
+        self.post.image = self.upload()
+        self.post.save()
+        meta = Post.objects.get(pk=self.post.pk).image_meta
+        self.assertEqual([v['width'] for v in meta['variants']], [320, 640, 960, 1280])
+        self.assertTrue(meta['placeholder'].startswith('data:image/jpeg;base64,'))
+        for variant in meta['variants']:
+            with Image.open(os.path.join(self.media_root, variant['webp'])) as webp:
+                self.assertEqual(webp.format, 'WEBP')
+            with Image.open(os.path.join(self.media_root, variant['src'])) as jpeg:
+                self.assertEqual(jpeg.width, variant['width'])
+                self.assertEqual(len(jpeg.getexif()), 0)
+
+    def test_exif_orientation_is_applied(self):
+        # Orientation 6 = rotated 90 degrees; the derivative must be portrait
+        self.post.image = self.upload(size=(800, 400), orientation=6)
+        self.post.save()
+        meta = Post.objects.get(pk=self.post.pk).image_meta
+        self.assertEqual((meta['width'], meta['height']), (400, 800))
+        self.assertEqual([v['width'] for v in meta['variants']], [320, 400])
+
+    def test_sources_differing_in_extension_keep_their_own_derivatives(self):
+        other = make_posts(self.author, 1)[0]
+        self.post.image = self.upload(name='photo.jpg')
+        self.post.save()
+        other.image = self.upload(name='photo.png', fmt='PNG')
+        other.save()
+        first = Post.objects.get(pk=self.post.pk).image_meta['variants']
+        second = Post.objects.get(pk=other.pk).image_meta['variants']
+        self.assertFalse({v['webp'] for v in first} & {v['webp'] for v in second})
+        for variant in first:
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, variant['webp'])))
+
+    def test_deleting_post_deletes_derivatives(self):
+        self.post.image = self.upload()
+        self.post.save()
+        variants = Post.objects.get(pk=self.post.pk).image_meta['variants']
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.get(pk=self.post.pk).delete()
+        for variant in variants:
+            self.assertFalse(os.path.exists(os.path.join(self.media_root, variant['src'])))
+            self.assertFalse(os.path.exists(os.path.join(self.media_root, variant['webp'])))
+
+    def test_template_tag_emits_srcset(self):
+        self.post.image = self.upload()
+        self.post.save()
+        self.post.refresh_from_db()
+        html = Template(
+            '{% load blog_images %}{% responsive_image post.image post.image_meta sizes="50vw" alt=post.title %}'
+        ).render(Context({'post': self.post}))
+        self.assertIn('<source type="image/webp" srcset="/media/blog_images/derived/', html)
+        self.assertIn('-640w.webp 640w', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('sizes="50vw"', html)
+
+
+class ChunkedVideoUploadTests(TempMediaMixin, BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        upload_settings = override_settings(
+            BLOG_CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'tmp'),
+            BLOG_UPLOAD_CHUNK_SIZE=10,
+        )
+        upload_settings.enable()
+        self.addCleanup(upload_settings.disable)
+        self.author = User.objects.create_user('author', password='pass')
+        self.client.force_login(self.author)
+        self.data = b'0123456789abcdefghijklmnopqrstuvwxyz'
+        response = self.client.post(reverse('start_video_upload'), {
+            'filename': 'clip.mp4',
+            'size': len(self.data),
+            'sha256': hashlib.sha256(self.data).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.json()['id']
+
+    def send(self, index, data=None, checksum=None):
+        if data is None:
+            data = self.data[index * 10:(index + 1) * 10]
+        return self.client.post(
+            reverse('upload_video_chunk', args=[self.upload_id, index]),
+            data=data,
+            content_type='application/octet-stream',
+            headers={'X-Chunk-SHA256': checksum or hashlib.sha256(data).hexdigest()},
+        )
+
+    def test_resumable_upload_attaches_to_post(self):
+        self.assertEqual(self.send(0).json()['received'], 10)
+        # A retried chunk is accepted without being written twice
+        self.assertEqual(self.send(0).json()['received'], 10)
+        # Skipping ahead is refused and reports where to resume
+        response = self.send(2)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['next_index'], 1)
+
+        status = self.client.get(reverse('video_upload_status', args=[self.upload_id])).json()
+        for index in range(status['next_index'], 4):
+            status = self.send(index).json()
+        self.assertTrue(status['completed'])
+
+        response = self.client.post(reverse('create_post'), {
+            'title': 'With video',
+            'content': 'Body',
+            'status': 'published',
+            'video_upload': self.upload_id,
+        })
+        post = Post.objects.get(title='With video')
+        self.assertRedirects(response, reverse('post_detail', args=[post.pk]), fetch_redirect_response=False)
+        with post.video.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(VideoUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'tmp')), [])
+
+    def test_corrupt_chunk_is_rejected(self):
+        response = self.send(0, checksum='0' * 64)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 0)
+        self.assertEqual(self.send(0).json()['received'], 10)
+
+    def test_malformed_content_length_is_rejected(self):
+        response = self.client.post(
+            reverse('upload_video_chunk', args=[self.upload_id, 0]),
+            data=self.data[:10],
+            content_type='application/octet-stream',
+            headers={'X-Chunk-SHA256': hashlib.sha256(self.data[:10]).hexdigest()},
+            CONTENT_LENGTH='ten',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_file_checksum_mismatch_restarts_upload(self):
+        VideoUpload.objects.filter(pk=self.upload_id).update(sha256='0' * 64)
+        for index in range(3):
+            self.send(index)
+        response = self.send(3)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 0)
+        self.assertEqual(VideoUpload.objects.get(pk=self.upload_id).received, 0)
+
+    def test_unfinished_upload_cannot_be_attached(self):
+        self.send(0)
+        response = self.client.post(reverse('create_post'), {
+            'title': 'Too early',
+            'content': 'Body',
+            'status': 'published',
+            'video_upload': self.upload_id,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.filter(title='Too early').exists())
+
+    def test_uploads_are_private(self):
+        self.client.force_login(User.objects.create_user('other', password='pass'))
+        self.assertEqual(self.send(0).status_code, 404)
+
+
+class StreamPostVideoTests(TempMediaMixin, BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'blog_videos'))
+        self.data = os.urandom(100_000)
+        with open(os.path.join(self.media_root, 'blog_videos', 'clip.mp4'), 'wb') as f:
+            f.write(self.data)
+        self.author = User.objects.create_user('author', password='pass')
+        self.post = make_posts(self.author, 1)[0]
+        self.post.video = 'blog_videos/clip.mp4'
+        self.post.save()
+        self.url = reverse('stream_post_video', args=[self.post.pk])
+
+    def test_seek_returns_partial_content(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=50000-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        self.assertEqual(b''.join(response.streaming_content), self.data[50000:])
+
+    def test_revalidation(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_templates_use_streaming_url(self):
+        response = self.client.get(reverse('post_detail', args=[self.post.pk]))
+        self.assertContains(response, f'src="{self.url}"')
+        self.assertContains(response, 'preload="metadata"')
+
+
+class SearchTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+
+    def post(self, title, content, status='published'):
+        return Post.objects.create(
+            title=title, slug='s', author=self.author, content=content, status=status,
+        )
+
+    def ids(self, query, posts=None):
+        return [hit.post_id for hit in search_posts(query, posts)]
+
+    def test_parse_query(self):
+        query = parse_query('Django "class based views" templ* Café')
+        self.assertEqual(query.terms, ['django', 'class', 'based', 'views', 'cafe'])
+        self.assertEqual(query.prefixes, ['templ'])
+        self.assertEqual(query.phrases, [['class', 'based', 'views']])
+
+    def test_ranks_with_bm25(self):
+        once = self.post('Cooking notes', 'Some pasta and a little django.')
+        title = self.post('Django tips', 'Short tips.')
+        often = self.post('Web notes', 'django django django for the web.')
+        self.post('Gardening', 'Nothing relevant here.')
+        # Title words weigh more than content words
+        self.assertEqual(self.ids('django'), [title.pk, often.pk, once.pk])
+
+    def test_terms_are_anded(self):
+        both = self.post('Python and Django', 'Text')
+        self.post('Only python', 'Text')
+        self.assertEqual(self.ids('django python'), [both.pk])
+        self.assertEqual(self.ids('django missingword'), [])
+
+    def test_phrase_query_checks_positions(self):
+        phrase = self.post('Views', 'Writing class based views in Django.')
+        self.post('Views', 'Based on the class hierarchy, views are simple.')
+        self.assertEqual(self.ids('"class based views"'), [phrase.pk])
+
+    def test_phrase_does_not_span_title_and_content(self):
+        self.post('Learning class', 'based views')
+        self.assertEqual(self.ids('"class based"'), [])
+
+    def test_prefix_query(self):
+        template = self.post('Templates', 'Text')
+        templating = self.post('Templating engines', 'Text')
+        self.post('Temperature', 'Text')
+        self.assertCountEqual(self.ids('templ*'), [template.pk, templating.pk])
+        # Single letters are too broad to expand
+        self.assertEqual(self.ids('t*'), [])
+
+    def test_prefix_overlapping_a_term(self):
+        data = self.post('Data', 'Text')
+        database = self.post('Databases', 'data everywhere')
+        self.post('Datum', 'Text')
+        self.assertCountEqual(self.ids('data dat*'), [data.pk, database.pk])
+        self.assertEqual(self.ids('data databas*'), [database.pk])
+
+    def test_index_updates_incrementally(self):
+        post = self.post('Original title', 'alpha beta')
+        alpha = SearchTerm.objects.get(term='alpha')
+        self.assertEqual(alpha.doc_freq, 1)
+
+        post.content = 'gamma beta'
+        post.save()
+        alpha.refresh_from_db()
+        self.assertEqual(alpha.doc_freq, 0)
+        self.assertEqual(self.ids('alpha'), [])
+        self.assertEqual(self.ids('gamma'), [post.pk])
+
+        # Saving unchanged text doesn't touch the postings
+        post = Post.objects.get(pk=post.pk)
+        with self.assertNumQueries(2):  # the UPDATE and the checksum lookup
+            post.save()
+        # Nor does a save that leaves out the text
+        with self.assertNumQueries(1):
+            post.save(update_fields=['status'])
+
+    def test_stop_words_are_not_indexed(self):
+        post = self.post('The state of the art', 'It is a tale of two cities.')
+        self.assertFalse(SearchTerm.objects.filter(term__in=['the', 'of', 'is', 'a']).exists())
+        # Dropped from queries, but they still hold their place in a phrase
+        self.assertEqual(self.ids('the art'), [post.pk])
+        self.assertEqual(self.ids('"state of the art"'), [post.pk])
+        self.assertEqual(self.ids('"state of art"'), [])
+        self.assertEqual(self.ids('the'), [])
+
+    def test_reindex_of_existing_document_replaces_postings(self):
+        # e.g. rebuild_search_index --force, or a concurrent save that got there first
+        post = self.post('Original', 'alpha beta')
+        SearchDocument.objects.update(checksum='')
+        self.assertTrue(index_post(post))
+        self.assertEqual(SearchPosting.objects.filter(document_id=post.pk).count(), 3)
+        self.assertEqual(SearchTerm.objects.get(term='alpha').doc_freq, 1)
+        self.assertFalse(index_post(post))
+
+    def test_delete_removes_postings(self):
+        post = self.post('Doomed', 'ephemeral words')
+        post.delete()
+        self.assertFalse(SearchPosting.objects.exists())
+        self.assertEqual(SearchTerm.objects.get(term='ephemeral').doc_freq, 0)
+
+    def test_restricts_to_queryset(self):
+        published = self.post('Django', 'Text')
+        self.post('Django draft', 'Text', status='draft')
+        self.assertEqual(self.ids('django', Post.objects.filter(status='published')), [published.pk])
+
+    def test_filter_posts_for_admin(self):
+        match = self.post('Django', 'class based views')
+        self.post('Flask', 'class methods')
+        self.assertEqual(list(filter_posts(Post.objects.all(), 'class view*')), [match])
+        self.assertEqual(list(filter_posts(Post.objects.all(), '"based views"')), [match])
+
+    def test_admin_changelist_uses_index(self):
+        match = self.post('Django', 'Text')
+        self.post('Flask', 'Text')
+        admin = User.objects.create_superuser('admin', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:blog_app_post_changelist'), {'q': 'django'})
+        self.assertEqual(list(response.context['cl'].result_list), [match])
+
+    def test_search_view_rejects_out_of_range_pages(self):
+        self.post('Data', 'Text')
+        for page in (views.SEARCH_MAX_PAGE + 1, '99999999999999999999'):
+            response = self.client.get(reverse('search'), {'q': 'data', 'page': page})
+            self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('search'), {'q': 'data', 'page': views.SEARCH_MAX_PAGE})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['results'], [])
+
+    def test_search_view(self):
+        for i in range(12):
+            self.post(f'Django {i}', 'Text')
+        self.post('Django draft', 'Text', status='draft')
+        response = self.client.get(reverse('search'), {'q': 'django'})
+        self.assertEqual(len(response.context['results']), 10)
+        self.assertTrue(response.context['has_next'])
+        response = self.client.get(reverse('search'), {'q': 'django', 'page': 2})
+        self.assertEqual(len(response.context['results']), 2)
+        self.assertFalse(response.context['has_next'])
+        self.assertTrue(all(post.status == 'published' for post in response.context['results']))
+
+
+class AdminChangelistTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='pass')
+        for i in range(5):
+            user = User.objects.create_user(f'user{i}', password='pass')
+            category = Category.objects.create(name=f'Category {i}')
+            for post in make_posts(user, 3, category=category):
+                Comment.objects.create(post=post, author=user, content='Nice post')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, name, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(f'admin:blog_app_{name}_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for name in ('post', 'comment'):
+            with self.subTest(name):
+                # Cold cache both times, the cached session and user included
+                cache.clear()
+                before = self.changelist_queries(name)
+                user = User.objects.create_user(f'extra-{name}', password='pass')
+                category = Category.objects.create(name=f'Extra {name}')
+                for post in make_posts(user, 4, category=category):
+                    Comment.objects.create(post=post, author=user, content='Another')
+                cache.clear()
+                self.assertEqual(self.changelist_queries(name), before)
+
+    def test_category_filter_choices_are_cached(self):
+        self.changelist_queries('post')
+        with CaptureQueriesContext(connection) as ctx:
+            self.changelist_queries('post')
+        self.assertFalse(any('blog_app_category' in q['sql'] and 'JOIN' not in q['sql'] for q in ctx.captured_queries))
+
+        Category.objects.create(name='Brand new')
+        response = self.client.get(reverse('admin:blog_app_post_changelist'))
+        self.assertContains(response, 'Brand new')
+
+    def test_pages_keep_changelist_order(self):
+        posts = Post.objects.order_by('-publish_date', '-pk')
+        paginator = changelist.EstimatedCountPaginator(posts, 4)
+        self.assertEqual(paginator.count, 15)
+        self.assertEqual(list(paginator.page(2)), list(posts[4:8]))
+        self.assertEqual(list(paginator.page(4)), list(posts[12:15]))
+
+    def test_deep_page_offsets_only_primary_keys(self):
+        paginator = changelist.EstimatedCountPaginator(Post.objects.order_by('-publish_date', '-pk'), 4)
+        paginator.count
+        with CaptureQueriesContext(connection) as ctx:
+            page = list(paginator.page(4))
+        self.assertEqual(len(ctx), 2)
+        offset_query, rows_query = (q['sql'] for q in ctx.captured_queries)
+        # The OFFSET walks the ordering columns and the pk, never whole rows
+        self.assertIn('OFFSET 12', offset_query)
+        self.assertRegex(offset_query, r'^SELECT "blog_app_post"."id"( AS "pk")? FROM')
+        self.assertNotIn('OFFSET', rows_query)
+        self.assertEqual(len(page), 3)
+
+    def test_unfiltered_count_uses_table_statistics(self):
+        with mock.patch.object(changelist, 'estimated_row_count', return_value=2_000_000):
+            paginator = changelist.EstimatedCountPaginator(Post.objects.all(), 100)
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.count, 2_000_000)
+
+    def test_small_tables_are_counted_exactly(self):
+        with mock.patch.object(changelist, 'estimated_row_count', return_value=40):
+            self.assertEqual(changelist.EstimatedCountPaginator(Post.objects.all(), 100).count, 15)
+
+    def test_filtered_count_is_capped(self):
+        with mock.patch.object(changelist, 'FILTERED_COUNT_LIMIT', 10):
+            paginator = changelist.EstimatedCountPaginator(Post.objects.filter(status='published'), 4)
+            self.assertEqual(paginator.count, 10)
+
+
+class CommentCountTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='pass')
+        self.post, self.other = make_posts(self.author, 2)
+
+    def count(self, post=None):
+        return Post.objects.values_list('comment_count', flat=True).get(pk=(post or self.post).pk)
+
+    def comment(self, approved=True, post=None):
+        return Comment.objects.create(post=post or self.post, author=self.author, content='Hi', approved=approved)
+
+    def test_create_and_delete(self):
+        comment = self.comment()
+        self.comment(approved=False)
+        self.assertEqual(self.count(), 1)
+        comment.delete()
+        self.assertEqual(self.count(), 0)
+
+    def test_approval_and_move_via_save(self):
+        comment = self.comment(approved=False)
+        comment.approved = True
+        comment.save()
+        self.assertEqual(self.count(), 1)
+        comment.post = self.other
+        comment.save()
+        self.assertEqual((self.count(), self.count(self.other)), (0, 1))
+        comment.approved = False
+        comment.save()
+        self.assertEqual(self.count(self.other), 0)
+
+    def test_stale_post_save_keeps_count(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        self.comment()
+        stale.title = 'Edited'
+        stale.save()
+        self.assertEqual(self.count(), 1)
+
+    def test_deferred_post_save_writes_only_loaded_fields(self):
+        partial = Post.objects.only('status').get(pk=self.post.pk)
+        partial.status = 'draft'
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                partial.save()
+        # The UPDATE and the directory rebuild; no per-field refetches
+        self.assertEqual(len(ctx), 2, '\n'.join(q['sql'] for q in ctx.captured_queries))
+        self.assertIn('SET "status" = \'draft\', "updated_date" = ', ctx.captured_queries[0]['sql'])
+        self.assertEqual(Post.objects.get(pk=self.post.pk).title, self.post.title)
+
+    def test_clone_and_save_inserts_a_copy(self):
+        clone = Post.objects.get(pk=self.post.pk)
+        clone.pk = None
+        clone.slug = 'copy'
+        clone.save()
+        self.assertNotEqual(clone.pk, self.post.pk)
+        self.assertEqual(Post.objects.filter(title=self.post.title).count(), 2)
+
+    def test_save_after_delete_inserts_the_row_again(self):
+        post = Post.objects.get(pk=self.post.pk)
+        Post.objects.filter(pk=post.pk).delete()
+        post.title = 'Restored'
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).title, 'Restored')
+
+    def test_save_respects_update_fields(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.title, post.content = 'Edited', 'Edited'
+        post.save(update_fields=['title'])
+        post.refresh_from_db()
+        self.assertEqual((post.title, post.content), ('Edited', self.post.content))
+
+    def test_bulk_approve(self):
+        for _ in range(3):
+            self.comment(approved=False)
+        self.comment(approved=False, post=self.other)
+        self.comment(post=self.other)
+        self.assertEqual(counters.approve_comments(Comment.objects.all()), 4)
+        self.assertEqual((self.count(), self.count(self.other)), (3, 2))
+        self.assertEqual(counters.approve_comments(Comment.objects.all()), 0)
+
+    def test_admin_approve_action(self):
+        comment = self.comment(approved=False)
+        admin = User.objects.create_superuser('admin', password='pass')
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:blog_app_comment_changelist'), {
+            'action': 'approve_comments', '_selected_action': [comment.pk],
+        })
+        self.assertEqual(self.count(), 1)
+
+    def test_recount_repairs_drift(self):
+        self.comment()
+        self.comment()
+        Post.objects.filter(pk=self.post.pk).update(comment_count=7)
+        Post.objects.filter(pk=self.other.pk).update(comment_count=1)
+        self.assertEqual(counters.recount_comments(batch_size=1), (2, 2))
+        self.assertEqual((self.count(), self.count(self.other)), (2, 0))
+
+    def test_cards_show_stored_count(self):
+        self.comment()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '<i class="bi bi-chat"></i> 1')
+
+
+class CommentPaginationTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.post = make_posts(cls.author, 1)[0]
+        start = timezone.now()
+        for i in range(45):
+            comment = Comment.objects.create(post=cls.post, author=cls.author, content=f'Comment {i}')
+            # Pairs share a timestamp so the id tie-breaker is exercised
+            Comment.objects.filter(pk=comment.pk).update(created_date=start - timedelta(minutes=i // 2))
+        Comment.objects.create(post=cls.post, author=cls.author, content='Hidden', approved=False)
+
+    def test_detail_renders_first_page_only(self):
+        response = self.client.get(reverse('post_detail', args=[self.post.pk]))
+        self.assertEqual(len(response.context['comments']), 20)
+        self.assertContains(response, 'Comments (45)')
+        self.assertContains(response, 'id="load-more-comments"')
+
+    def test_endpoint_walks_remaining_comments(self):
+        first = self.client.get(reverse('post_detail', args=[self.post.pk])).context['comments']
+        seen = [comment.content for comment in first]
+        url = f"{reverse('post_comments', args=[self.post.pk])}?page={first.next_token}"
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(re.findall(r'<p>(.*?)</p>', data['html']))
+            url = data['next']
+        expected = Comment.objects.filter(approved=True).order_by('-created_date', '-id')
+        self.assertEqual(seen, list(expected.values_list('content', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('post_comments', args=[self.post.pk]), {'page': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_detail_query_count_is_independent_of_comments(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('post_detail', args=[self.post.pk]))
+        for i in range(30):
+            Comment.objects.create(post=self.post, author=self.author, content=f'More {i}')
+        cache.clear()
+        with self.assertNumQueries(len(ctx)):
+            self.client.get(reverse('post_detail', args=[self.post.pk]))
+
+
+@override_settings(ROOT_URLCONF='blog_app.async_urls')
+class CategoryReportTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='pass')
+        self.tech = Category.objects.create(name='Tech')
+        self.food = Category.objects.create(name='Food')
+        self.empty = Category.objects.create(name='Empty')
+        posts = make_posts(self.author, 5, category=self.tech)
+        posts[4].category = self.food
+        posts[4].status = 'draft'
+        posts[4].save()
+        self.uncategorized = make_posts(self.author, 1)[0]
+        Post.objects.filter(pk=self.uncategorized.pk).update(slug='uncategorized')
+        start = timezone.now() - timedelta(days=4)
+        for days, post in enumerate(posts[:4]):
+            Post.objects.filter(pk=post.pk).update(created_date=start + timedelta(days=days * 2))
+
+    def report(self, **options):
+        out = io.StringIO()
+        call_command('category_report', stdout=out, **options)
+        return out.getvalue()
+
+    def test_stats_per_category(self):
+        rows = {row['name']: row for row in diagnostics.category_stats()}
+        self.assertEqual([rows[name]['posts'] for name in ['Empty', 'Food', 'Tech']], [0, 1, 4])
+        self.assertEqual(rows['Food']['published'], 0)
+        self.assertAlmostEqual(rows['Tech']['per_day'], 4 / 6)
+        self.assertIsNone(rows['Food']['per_day'])
+        self.assertIsNone(rows['Empty']['first_post'])
+
+    def test_overview(self):
+        totals = diagnostics.overview()
+        self.assertEqual((totals['categories'], totals['posts'], totals['published'], totals['uncategorized']), (3, 6, 5, 1))
+
+    def test_latest_posts_per_category(self):
+        latest = diagnostics.latest_posts(2)
+        self.assertEqual([post['title'] for post in latest[self.tech.pk]], ['Post 1', 'Post 0'])
+        self.assertEqual(len(latest[self.food.pk]), 1)
+        self.assertNotIn(self.empty.pk, latest)
+
+    def test_query_count_does_not_grow_with_categories(self):
+        with self.assertNumQueries(5):
+            self.report(latest=3)
+        for n in range(10):
+            make_posts(self.author, 1, category=Category.objects.create(name=f'Extra {n}'))[0].delete()
+        with self.assertNumQueries(5):
+            self.report(latest=3)
+
+    def test_text_report(self):
+        output = self.report(latest=1)
+        self.assertIn('Uncategorized: 1', output)
+        self.assertIn('Empty categories: 1', output)
+        self.assertRegex(output, r'Tech\s+4\s+4\s+66\.7%')
+        self.assertIn(f'#{self.uncategorized.pk} Post 0', output)
+
+    def test_json_report(self):
+        data = json.loads(self.report(format='json', latest=1))
+        self.assertEqual(data['overview']['posts'], 6)
+        self.assertEqual([row['name'] for row in data['categories']], ['Empty', 'Food', 'Tech'])
+        self.assertEqual(data['categories'][2]['latest'][0]['title'], 'Post 1')
+        self.assertEqual(data['empty_categories'], 1)
+        self.assertEqual([post['pk'] for post in data['uncategorized']], [self.uncategorized.pk])
+
+
+class CategoryRemediationTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='pass')
+        self.old = Category.objects.create(name='Old')
+        self.new = Category.objects.create(name='New')
+        self.posts = make_posts(self.author, 7)
+        for post in self.posts[5:]:
+            Post.objects.filter(pk=post.pk).update(category=self.old)
+
+    def categories(self):
+        return list(Post.objects.order_by('pk').values_list('category__name', flat=True))
+
+    def test_assign_uses_chunked_updates(self):
+        updated = Post.objects.get(pk=self.posts[0].pk).updated_date
+        # Two chunks: one SELECT and one UPDATE each, plus the empty SELECT
+        with self.assertNumQueries(5 + 2):
+            moved = remediation.assign_category(Post.objects.filter(category__isnull=True), self.new, batch_size=3)
+        self.assertEqual(moved, 5)
+        self.assertEqual(self.categories(), ['New'] * 5 + ['Old'] * 2)
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).updated_date, updated)
+
+    def test_merge_deletes_sources(self):
+        remediation.assign_category(Post.objects.filter(pk=self.posts[0].pk), self.new)
+        self.assertEqual(remediation.merge_categories(Category.objects.all(), self.new), (2, 1))
+        self.assertFalse(Category.objects.filter(pk=self.old.pk).exists())
+        self.assertEqual(Post.objects.filter(category=self.new).count(), 3)
+
+    def test_spread_is_reproducible(self):
+        remediation.spread_categories(Post.objects.all(), seed=3, batch_size=2)
+        first = self.categories()
+        self.assertNotIn(None, first)
+        remediation.spread_categories(Post.objects.all(), seed=3, batch_size=2)
+        self.assertEqual(self.categories(), first)
+        Category.objects.all().delete()
+        with self.assertRaises(ValueError):
+            remediation.spread_categories(Post.objects.all())
+
+    def test_moved_cards_are_dropped(self):
+        self.client.get(reverse('home'))
+        post = Post.objects.get(pk=self.posts[0].pk)
+        key = card_key('home', post.pk, post.updated_date, post.comment_count)
+        self.assertIsNotNone(cache.get(key))
+        remediation.assign_category(Post.objects.filter(pk=post.pk), self.new)
+        self.assertIsNone(cache.get(key))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('fix_categories', 'assign', '--to', 'Misc', '--create', stdout=out)
+        self.assertIn('Assigned 5 post(s) to "Misc"', out.getvalue())
+        call_command('fix_categories', 'merge', '--from', 'Misc', '--from', str(self.old.pk), '--to', 'New', stdout=out)
+        self.assertEqual(self.categories(), ['New'] * 7)
+        with self.assertRaises(CommandError):
+            call_command('fix_categories', 'merge', '--from', 'Missing', '--to', 'New', stdout=out)
+
+    def test_admin_actions(self):
+        admin = User.objects.create_superuser('admin', password='pass')
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:blog_app_post_changelist'), {
+            'action': 'assign_category', 'category': self.new.pk, 'index': 0,
+            '_selected_action': [post.pk for post in self.posts[:2]],
+        })
+        self.assertEqual(self.categories()[:3], ['New', 'New', None])
+        self.client.post(reverse('admin:blog_app_category_changelist'), {
+            'action': 'merge_categories', 'category': self.new.pk, 'index': 0,
+            '_selected_action': [self.old.pk],
+        })
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['New'])
+        response = self.client.post(reverse('admin:blog_app_post_changelist'), {
+            'action': 'assign_category', 'index': 0, '_selected_action': [self.posts[2].pk],
+        }, follow=True)
+        self.assertContains(response, 'Choose a category')
+        self.assertIsNone(self.categories()[2])
+
+
+class CategoryDirectoryTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='pass')
+        self.tech = Category.objects.create(name='Tech')
+        self.art = Category.objects.create(name='Art')
+        make_posts(self.author, 3, category=self.tech)
+        Post.objects.create(title='Draft', slug='draft', author=self.author, content='x', category=self.art)
+
+    def test_cached_after_one_query(self):
+        with self.assertNumQueries(1):
+            entries = directory.categories()
+        self.assertEqual(entries, [(self.art.pk, 'Art', 0), (self.tech.pk, 'Tech', 3)])
+        with self.assertNumQueries(0):
+            self.assertEqual(directory.get(self.tech.pk).post_count, 3)
+            self.assertIsNone(directory.get(0))
+
+    def test_rebuilt_on_commit_after_writes(self):
+        directory.categories()
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Music')
+        with self.assertNumQueries(0):
+            self.assertEqual([entry.name for entry in directory.categories()], ['Art', 'Music', 'Tech'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.filter(category=self.art).get().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            remediation.assign_category(Post.objects.all(), self.art)
+        self.assertEqual([entry.post_count for entry in directory.categories()], [3, 0, 0])
+
+    @override_settings(
+        BLOG_SINGLE_PROCESS=False,
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_process_local_cache_is_not_used(self):
+        directory.categories()
+        # A category created by another worker is seen straight away
+        Category.objects.bulk_create([Category(name='Music')])
+        music = Category.objects.get(name='Music')
+        with self.assertNumQueries(1):
+            self.assertEqual(directory.get(music.pk).name, 'Music')
+        self.assertEqual(self.client.get(reverse('category_posts', args=[music.pk])).status_code, 200)
+
+    def test_views_use_directory(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '<span class="badge bg-secondary rounded-pill">3</span>', html=True)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('category_posts', args=[self.tech.pk]))
+        self.assertEqual(response.context['post_count'], 3)
+        self.assertFalse([q for q in ctx.captured_queries if 'blog_app_category' in q['sql'] and 'JOIN' not in q['sql']])
+        self.assertEqual(self.client.get(reverse('category_posts', args=[999])).status_code, 404)
+
+    def test_post_form_choices(self):
+        directory.categories()
+        with self.assertNumQueries(0):
+            choices = list(PostForm().fields['category'].choices)
+        self.assertEqual([label for _, label in choices], ['---------', 'Art', 'Tech'])
+        form = PostForm({'title': 'New', 'content': 'Text', 'status': 'draft', 'category': self.art.pk})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['category'], self.art)
+
+
+class SessionAuthCacheTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('reader', password='pass')
+        make_posts(self.user, 2)
+
+    def auth_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if 'django_session' in q['sql'] or 'FROM "auth_user"' in q['sql']]
+
+    def login(self):
+        response = self.client.post(reverse('login'), {'username': 'reader', 'password': 'pass'})
+        self.assertRedirects(response, reverse('home'))
+        return response
+
+    def test_anonymous_requests_skip_sessions(self):
+        self.assertEqual(self.auth_queries(reverse('home')), [])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+    def test_logged_in_requests_are_served_from_cache(self):
+        response = self.login()
+        self.assertIn('messages', response.cookies)
+        self.client.get(reverse('home'))
+        self.assertEqual(self.auth_queries(reverse('user_posts')), [])
+        self.assertEqual(self.auth_queries(reverse('home')), [])
+
+    def test_user_changes_reach_the_cache(self):
+        self.login()
+        self.client.get(reverse('home'))
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertRedirects(self.client.get(reverse('user_posts')), f"{reverse('login')}?next={reverse('user_posts')}")
+
+        self.client.post(reverse('login'), {'username': 'reader', 'password': 'changed'})
+        self.assertEqual(self.client.get(reverse('user_posts')).status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get(reverse('user_posts')).status_code, 302)
+
+    def test_logout_ends_the_cached_session(self):
+        self.login()
+        self.client.get(reverse('home'))
+        session_cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.post(reverse('logout'))
+        # Replaying the old cookie must not find the session in the cache
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_cookie
+        self.assertRedirects(self.client.get(reverse('user_posts')), f"{reverse('login')}?next={reverse('user_posts')}")
+
+    @override_settings(
+        BLOG_SINGLE_PROCESS=False,
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_process_local_cache_is_not_used_for_users(self):
+        backend = backends.CachedModelBackend()
+        backend.get_user(self.user.pk)
+        # Another worker could deactivate the user without this one noticing
+        with self.assertNumQueries(1):
+            self.assertEqual(backend.get_user(self.user.pk), self.user)
+        self.assertEqual([w.id for w in backends.check_shared_cache()], ['blog_app.W001'])
+
+    def test_shared_cache_passes_check(self):
+        self.assertEqual(backends.check_shared_cache(), [])
+
+    def test_async_lookup(self):
+        backend = backends.CachedModelBackend()
+        self.assertEqual(async_to_sync(backend.aget_user)(self.user.pk), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(backend.aget_user)(self.user.pk), self.user)
+        self.assertIsNone(async_to_sync(backend.aget_user)(0))
+
+
+class AsyncViewTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Tech')
+        cls.posts = make_posts(cls.author, 12, category=cls.category)
+        cls.post = cls.posts[0]
+        for i in range(25):
+            Comment.objects.create(post=cls.post, author=cls.author, content=f'Comment {i}')
+
+    def test_same_url_names_as_sync_urls(self):
+        self.assertEqual(
+            [p.name for p in async_urls.urlpatterns],
+            [p.name for p in blog_urls.urlpatterns],
+        )
+
+    async def test_home(self):
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 6)
+        self.assertEqual([c.name for c in response.context['categories']], ['Tech'])
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        response = await self.async_client.get(reverse('home'), headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_category_posts(self):
+        response = await self.async_client.get(reverse('category_posts', args=[self.category.pk]))
+        self.assertEqual(response.context['post_count'], 12)
+        self.assertEqual(len(response.context['page_obj']), 9)
+        response = await self.async_client.get(reverse('category_posts', args=[self.category.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_post_detail_and_comments(self):
+        response = await self.async_client.get(reverse('post_detail', args=[self.post.pk]))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        data = (await self.async_client.get(
+            reverse('post_comments', args=[self.post.pk]), {'page': comments.next_token},
+        )).json()
+        self.assertEqual(data['html'].count('<p>'), 5)
+        self.assertIsNone(data['next'])
+
+    async def test_logged_in_comment(self):
+        await self.async_client.aforce_login(self.author)
+        response = await self.async_client.post(reverse('post_detail', args=[self.post.pk]), {'content': 'Async hello'})
+        self.assertRedirects(response, reverse('post_detail', args=[self.post.pk]), fetch_redirect_response=False)
+        self.assertTrue(await Comment.objects.filter(content='Async hello').aexists())
+
+        response = await self.async_client.get(reverse('post_detail', args=[self.post.pk]))
+        self.assertEqual(response.context['user'], self.author)
+        self.assertNotIn('X-Page-Cache', response)
+
+
+class DatasetTests(TempMediaMixin, BlogTestCase):
+    def generate(self, **kwargs):
+        options = {'posts': 25, 'users': 4, 'seed': 7, 'batch_size': 10, 'processes': 1}
+        return dataset.generate(**{**options, **kwargs})
+
+    def test_generates_requested_rows(self):
+        counts = self.generate(image_ratio=0.2)
+        self.assertEqual(counts['posts'], Post.objects.count())
+        self.assertEqual(counts['comments'], Comment.objects.count())
+        self.assertEqual(counts['users'], 4)
+        self.assertEqual(counts['images'], Post.objects.exclude(image='').count())
+        self.assertGreater(counts['images'], 0)
+        self.assertTrue(all(os.path.exists(post.image.path) for post in Post.objects.exclude(image='')))
+
+    def test_counts_and_timestamps_are_kept(self):
+        self.generate()
+        self.assertEqual(counters.recount_comments(), (25, 0))
+        post = Post.objects.earliest('pk')
+        self.assertEqual(post.created_date, post.publish_date)
+        self.assertLessEqual(Post.objects.latest('publish_date').publish_date, dataset.DEFAULT_END)
+
+    def test_same_seed_same_data(self):
+        self.generate()
+        rows = list(Post.objects.order_by('pk').values_list('title', 'content', 'publish_date', 'status', 'comment_count'))
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        category_ids = dataset.create_categories(len(dataset.CATEGORY_NAMES))
+        expected = [
+            dataset.build_post(7, n, user_ids, category_ids, dataset.DEFAULT_END, 365, 5, 0.0)[0]
+            for n in range(25)
+        ]
+        self.assertEqual(rows, [(p.title, p.content, p.publish_date, p.status, p.comment_count) for p in expected])
+
+    def test_refuses_to_run_twice(self):
+        self.generate(posts=1)
+        with self.assertRaises(ValueError):
+            self.generate(posts=1)
+
+
+class BenchmarkHelperTests(TestCase):
+    def test_percentiles(self):
+        values = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 0.05)
+        self.assertEqual(percentile(values, 99), 0.099)
+        self.assertEqual(percentile([], 99), 0.0)
+        summary = summarize(reversed(values), elapsed=2.0, errors=1)
+        self.assertEqual((summary['requests'], summary['rps'], summary['errors']), (100, 50.0, 1))
+        self.assertAlmostEqual(summary['p99_ms'], 99.0)
+
+    def test_every_url_is_benchmarked(self):
+        names = {pattern.name for pattern in blog_urls.urlpatterns}
+        self.assertEqual(names - set(VIEW_REQUESTS), set())
+
+    def test_compare_flags_regressions(self):
+        def run(**metrics):
+            return {'sizes': {'1000': {'home': {'p95_ms': 10.0, 'queries': 2.0, 'peak_kib': 100.0, **metrics}}}}
+
+        self.assertEqual(compare_runs(run(), run(p95_ms=11.5, peak_kib=150.0)), [])
+        self.assertEqual(
+            compare_runs(run(), run(p95_ms=13.0, queries=3.0)),
+            [('1000', 'home', 'p95_ms', 10.0, 13.0), ('1000', 'home', 'queries', 2.0, 3.0)],
+        )
+        # Growth below the absolute floor is noise
+        self.assertEqual(compare_runs(run(p95_ms=1.0), run(p95_ms=1.8)), [])
+        self.assertEqual(compare_runs(run(), {'sizes': {'5000': run()['sizes']['1000']}}), [])
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ConnectionPoolTests(TestCase):
+    def make_pool(self, **options):
+        self.made = []
+        self.clock = FakeClock()
+
+        def connect():
+            self.made.append(FakeConnection(len(self.made)))
+            return self.made[-1]
+
+        def check(raw):
+            if not raw.healthy:
+                raise OSError('gone away')
+
+        return db_pool.ConnectionPool(connect, check=check, clock=self.clock, **options)
+
+    def test_reuses_released_connections(self):
+        pool = self.make_pool()
+        raw, reused = pool.acquire()
+        self.assertFalse(reused)
+        pool.release(raw)
+        self.assertEqual(pool.acquire(), (raw, True))
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['hits'], stats['creations']), (2, 1, 1))
+        self.assertEqual((stats['open'], stats['in_use'], stats['idle']), (1, 1, 0))
+
+    def test_failed_health_check_replaces_connection(self):
+        pool = self.make_pool()
+        raw, _ = pool.acquire()
+        pool.release(raw)
+        raw.healthy = False
+        fresh, reused = pool.acquire()
+        self.assertIsNot(fresh, raw)
+        self.assertFalse(reused)
+        self.assertTrue(raw.closed)
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+
+    def test_recently_used_connections_skip_the_check(self):
+        pool = self.make_pool(check_after=5)
+        raw, _ = pool.acquire()
+        pool.release(raw)
+        raw.healthy = False
+        self.assertEqual(pool.acquire(), (raw, True))
+
+    def test_idle_and_old_connections_expire(self):
+        pool = self.make_pool(idle_timeout=10, max_lifetime=100)
+        first, _ = pool.acquire()
+        pool.release(first)
+        self.clock.now = 11
+        second, reused = pool.acquire()
+        self.assertFalse(reused)
+        self.assertTrue(first.closed)
+
+        self.clock.now = 200
+        pool.release(second)  # past max_lifetime: closed, not pooled
+        self.assertTrue(second.closed)
+        self.assertEqual(pool.stats()['open'], 0)
+
+    def test_discard(self):
+        pool = self.make_pool()
+        raw, _ = pool.acquire()
+        pool.release(raw, discard=True)
+        self.assertTrue(raw.closed)
+        self.assertEqual(pool.stats()['open'], 0)
+
+    def test_bounded_size_waits_then_times_out(self):
+        pool = self.make_pool(max_size=1, timeout=0)
+        raw, _ = pool.acquire()
+        with self.assertRaises(db_pool.PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiter_gets_released_connection(self):
+        pool = db_pool.ConnectionPool(lambda: FakeConnection(0), max_size=1, timeout=5)
+        raw, _ = pool.acquire()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+        waiter.start()
+        while pool.stats()['waits'] == 0:
+            threading.Event().wait(0.001)
+        pool.release(raw)
+        waiter.join(5)
+        self.assertEqual(got, [(raw, True)])
+        self.assertEqual(pool.stats()['creations'], 1)
+
+    def test_rejects_unknown_options(self):
+        with self.assertRaises(ValueError):
+            db_pool.ConnectionPool(lambda: None, max_connections=3)
+
+
+class PooledSQLiteWrapper(db_pool.PooledDatabaseWrapperMixin, sqlite_base.DatabaseWrapper):
+    pass
+
+
+class PooledBackendTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_dict = {
+            **connection.settings_dict,
+            'NAME': os.path.join(directory, 'pool.sqlite3'),
+            'OPTIONS': {'pool': {'max_size': 2}},
+        }
+        self.alias = f'pooltest-{id(self)}'
+        self.wrapper = PooledSQLiteWrapper(settings_dict, alias=self.alias)
+        self.addCleanup(self.cleanup)
+
+    def cleanup(self):
+        self.wrapper.close()
+        _, pool = db_pool._pools.pop(self.alias, (None, None))
+        if pool is not None:
+            pool.close_idle()
+
+    def test_close_returns_connection_to_pool(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x integer)')
+        raw = self.wrapper.connection
+        self.wrapper.close()
+        self.assertIsNone(self.wrapper.connection)
+
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM t')
+        self.assertIs(self.wrapper.connection, raw)
+        stats = db_pool.pool_stats()[self.alias]
+        self.assertEqual((stats['creations'], stats['hits']), (1, 1))
+
+    def test_open_transaction_is_rolled_back_on_close(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x integer)')
+        self.wrapper.set_autocommit(False)
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO t VALUES (1)')
+        self.wrapper.close()
+
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM t')
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_broken_connection_is_discarded(self):
+        self.wrapper.ensure_connection()
+        raw = self.wrapper.connection
+        self.wrapper.errors_occurred = True
+        self.wrapper.close()
+        self.wrapper.ensure_connection()
+        self.assertIsNot(self.wrapper.connection, raw)
+
+    def test_pointing_alias_at_another_database_retires_its_pool(self):
+        # What the test runner does around create_test_db / destroy_test_db
+        self.wrapper.ensure_connection()
+        old_raw = self.wrapper.connection
+        old_pool = self.wrapper.get_pool()
+        self.wrapper.close()
+        self.wrapper.settings_dict['NAME'] = self.wrapper.settings_dict['NAME'] + '-other'
+
+        self.wrapper.ensure_connection()
+        self.assertIsNot(self.wrapper.connection, old_raw)
+        self.assertIsNot(self.wrapper.get_pool(), old_pool)
+        self.assertEqual(old_pool.stats()['open'], 0)
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA database_list')
+            self.assertTrue(cursor.fetchone()[2].endswith('-other'))
+
+    def test_connection_is_returned_to_its_own_pool(self):
+        self.wrapper.ensure_connection()
+        old_pool = self.wrapper.get_pool()
+        other = PooledSQLiteWrapper(
+            {**self.wrapper.settings_dict, 'NAME': self.wrapper.settings_dict['NAME'] + '-other'}, alias=self.alias,
+        )
+        other.ensure_connection()
+        self.addCleanup(other.close)
+        # Retired while in use: closed on release instead of going back to idle
+        self.wrapper.close()
+        self.assertEqual(old_pool.stats()['open'], 0)
+
+    def test_pool_option_is_not_passed_to_the_driver(self):
+        self.assertNotIn('pool', self.wrapper.get_connection_params())
+
+    def test_stats_view_is_staff_only(self):
+        user = User.objects.create_user('reader', password='pass')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('db_pool_stats')).status_code, 302)
+        user.is_staff = True
+        user.save()
+        self.wrapper.ensure_connection()
+        response = self.client.get(reverse('db_pool_stats'))
+        self.assertEqual(response.json()[self.alias]['in_use'], 1)
+
+
+@override_settings(BLOG_DB_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # Not TestCase: its transaction would keep every read on the primary
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        routers.forget_health()
+        self.addCleanup(routers.forget_health)
+        self.router = routers.PrimaryReplicaRouter()
+        self.user = User.objects.create_user('writer', password='pass')
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        self.assertEqual(Post.objects.db, 'replica')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        with override_settings(BLOG_DB_REPLICAS=[]):
+            self.assertEqual(Post.objects.db, 'default')
+
+    def test_related_reads_follow_the_instance(self):
+        post = make_posts(self.user, 1)[0]
+        self.assertEqual(post.comments.all().db, 'default')
+
+    def test_lagging_or_unreachable_replica_is_skipped(self):
+        for lag in (60, None, DatabaseError('gone')):
+            routers.forget_health()
+            with self.subTest(lag=lag), mock.patch.object(routers, 'replica_lag', side_effect=[lag]):
+                with self.assertLogs(routers.logger, 'WARNING'):
+                    self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_health_is_checked_once_per_interval(self):
+        with mock.patch.object(routers, 'replica_lag', return_value=0) as replica_lag:
+            self.router.db_for_read(Post)
+            self.router.db_for_read(Post)
+        replica_lag.assert_called_once_with('replica')
+
+    def test_write_pins_rest_of_request_to_primary(self):
+        token = routers.begin_request()
+        try:
+            self.assertEqual(self.router.db_for_read(Post), 'replica')
+            self.router.db_for_write(Post)
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+        finally:
+            routers.end_request(token)
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+
+    def test_reads_inside_a_transaction_use_primary(self):
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_client_reads_its_own_writes(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('create_post'), {
+            'title': 'Fresh',
+            'content': 'Body',
+            'status': 'published',
+        })
+        self.assertIn('db_primary', response.cookies)
+        post = Post.objects.using('default').get(title='Fresh')
+
+        # The replica hasn't got the post yet; the sticky cookie skips it
+        response = self.client.get(reverse('post_detail', args=[post.pk]))
+        self.assertContains(response, 'Fresh')
+        self.client.cookies.pop('db_primary')
+        response = self.client.get(reverse('post_detail', args=[post.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_forged_cookie_is_ignored(self):
+        post = make_posts(self.user, 1)[0]
+        self.client.cookies['db_primary'] = '1'
+        self.assertEqual(self.client.get(reverse('post_detail', args=[post.pk])).status_code, 404)
+
+    def test_reads_are_spread_over_replicas(self):
+        with override_settings(BLOG_DB_REPLICAS=['replica', 'default']):
+            used = {self.router.db_for_read(Post) for _ in range(50)}
+        self.assertEqual(used, {'replica', 'default'})
+
+
+SERVER_TIMING_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries", tpl;dur=([\d.]+), app;dur=[\d.]+, total;dur=[\d.]+$')
+
+
+@override_settings(BLOG_SERVER_TIMING=True)
+class ServerTimingTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.post = make_posts(cls.author, 3)[0]
+
+    def timing(self, response):
+        match = SERVER_TIMING_RE.match(response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        return int(match[1]), float(match[2])
+
+    def test_header_counts_queries_and_template_time(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('home'))
+        queries, template_ms = self.timing(response)
+        self.assertEqual(queries, len(ctx))
+        self.assertGreater(template_ms, 0)
+
+    @override_settings(BLOG_SERVER_TIMING=False)
+    def test_header_can_be_turned_off(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+
+    def test_header_is_off_by_default_without_debug(self):
+        with self.settings(DEBUG=False):
+            del settings.BLOG_SERVER_TIMING
+            self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+
+    @override_settings(ROOT_URLCONF='blog_app.async_urls')
+    async def test_async_views_are_timed(self):
+        response = await self.async_client.get(reverse('post_detail', args=[self.post.pk]))
+        self.assertGreater(self.timing(response)[0], 0)
+
+    def test_slow_requests_are_logged_with_top_sql(self):
+        with override_settings(BLOG_SLOW_REQUEST_MS=0), self.assertLogs('blog.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('post_detail', args=[self.post.pk]))
+        timing = logs.records[0].request_timing
+        self.assertEqual((timing['method'], timing['status']), ('GET', 200))
+        self.assertTrue(timing['top_sql'])
+        self.assertEqual(timing['queries'], sum(statement['count'] for statement in timing['top_sql']))
+
+        with self.assertNoLogs('blog.slow_requests'):
+            self.client.get(reverse('post_detail', args=[self.post.pk]))
+
+    def test_background_handler_writes_json_lines(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'slow.log')
+        handler = instrumentation.BackgroundHandler(path)
+        handler.setFormatter(instrumentation.JsonFormatter())
+        record = logging.makeLogRecord({'msg': 'Slow request', 'levelname': 'WARNING', 'request_timing': {'total_ms': 900}})
+        handler.handle(record)
+        handler.close()
+        with open(path) as f:
+            line = json.loads(f.readline())
+        self.assertEqual((line['message'], line['total_ms']), ('Slow request', 900))
+
+    def test_full_queue_drops_records(self):
+        handler = instrumentation.BackgroundHandler(maxsize=1)
+        handler.stop()
+        record = logging.makeLogRecord({'msg': 'Slow request'})
+        handler.handle(record)
+        handler.handle(record)
+        self.assertEqual(handler.dropped, 1)
+        handler.close()
+
+
+class ProfilingTests(TempMediaMixin, BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        profile_settings = override_settings(BLOG_PROFILE_DIR=os.path.join(self.media_root, 'profiles'))
+        profile_settings.enable()
+        self.addCleanup(profile_settings.disable)
+        self.staff = User.objects.create_user('staff', password='pass', is_staff=True)
+        self.post = make_posts(self.staff, 1)[0]
+        self.client.force_login(self.staff)
+
+    def profiled_url(self, user=None):
+        return f"{reverse('post_detail', args=[self.post.pk])}?_profile={profiling.make_token(user or self.staff)}"
+
+    def test_signed_request_is_profiled(self):
+        response = self.client.get(self.profiled_url())
+        self.assertEqual(response.status_code, 200)
+        capture = response['X-Profile-Id']
+
+        [meta] = profiling.list_captures()
+        self.assertEqual((meta['id'], meta['user'], meta['status']), (capture, 'staff', 200))
+        speedscope = json.loads(b''.join(self.client.get(reverse('download_profile', args=[capture, 'speedscope'])).streaming_content))
+        self.assertEqual(speedscope['profiles'][0]['type'], 'sampled')
+        memory = b''.join(self.client.get(reverse('download_profile', args=[capture, 'memory'])).streaming_content)
+        self.assertIn(b'Peak traced memory', memory)
+        self.assertContains(self.client.get(reverse('profile_list')), capture)
+
+    def test_header_token_works(self):
+        token = profiling.make_token(self.staff)
+        response = self.client.get(reverse('home'), headers={'X-Profile': token})
+        self.assertIn('X-Profile-Id', response)
+
+    def test_requires_staff_and_own_token(self):
+        other = User.objects.create_user('other', password='pass', is_staff=True)
+        self.assertNotIn('X-Profile-Id', self.client.get(self.profiled_url(other)))
+        self.assertNotIn('X-Profile-Id', self.client.get(self.profiled_url() + 'x'))
+
+        reader = User.objects.create_user('reader', password='pass')
+        self.client.force_login(reader)
+        self.assertNotIn('X-Profile-Id', self.client.get(self.profiled_url(reader)))
+        self.assertEqual(self.client.get(reverse('profile_list')).status_code, 302)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_download_rejects_bad_names(self):
+        self.assertEqual(self.client.get(reverse('download_profile', args=['..', 'memory'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('download_profile', args=['missing', 'secrets'])).status_code, 404)
+
+    def test_profile_link(self):
+        response = self.client.get(reverse('profile_list'), {'path': '/post/1/?page=2'})
+        self.assertRegex(response.context['link'], r'^/post/1/\?page=2&_profile=')
+        response = self.client.get(reverse('profile_list'), {'path': '//evil.example/'})
+        self.assertIsNone(response.context['link'])
+
+    def test_collapsed_stacks(self):
+        sampler = profiling.Sampler()
+        sampler.samples[(('main', '/app/main.py', 1), ('view', '/app/views.py', 10))] = 3
+        self.assertEqual(profiling.collapsed(sampler.samples), 'main (main.py:1);view (views.py:10) 3\n')
+
+    def test_old_captures_are_pruned(self):
+        with override_settings(BLOG_PROFILE_KEEP=2):
+            for _ in range(3):
+                self.client.get(self.profiled_url())
+        self.assertEqual(len(profiling.list_captures()), 2)
+        self.assertEqual(len(os.listdir(profiling.profile_dir())), 2 * 4)
@@ -0,0 +1,172 @@
+"""
+Chunked, resumable uploads for ``Post.video``.
+
+The client creates a ``VideoUpload``, then sends the file as fixed-size
+chunks, each with its SHA-256. Chunks are appended to a temp file outside
+MEDIA_ROOT, and ``received`` records how far the file has got. After a
+disconnect the client asks for the upload's status and resumes from
+``received``. Once every byte is in (and the optional whole-file checksum
+matches), the post form references the upload by id. The temp file is
+then moved into storage instead of being sent again.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .models import VideoUpload
+
+READ_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    pass
+
+
+def upload_dir():
+    return getattr(settings, 'BLOG_CHUNKED_UPLOAD_DIR', settings.BASE_DIR / 'upload_tmp')
+
+
+def chunk_size():
+    return getattr(settings, 'BLOG_UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+
+
+def temp_path(upload):
+    return os.path.join(upload_dir(), f'{upload.pk}.part')
+
+
+def start_upload(owner, filename, size, sha256=''):
+    upload = VideoUpload.objects.create(
+        owner=owner,
+        filename=os.path.basename(filename)[:255],
+        size=size,
+        chunk_size=chunk_size(),
+        sha256=sha256.lower(),
+    )
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(temp_path(upload), 'wb').close()
+    return upload
+
+
+def upload_status(upload):
+    return {
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'chunk_size': upload.chunk_size,
+        'received': upload.received,
+        'next_index': upload.received // upload.chunk_size,
+        'completed': upload.completed,
+    }
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _spool_chunk(stream, length, sha256, index):
+    """Read ``length`` bytes of ``stream`` into a temp file, verifying the checksum"""
+    spool = tempfile.TemporaryFile(dir=upload_dir())
+    digest = hashlib.sha256()
+    remaining = length
+    while remaining:
+        block = stream.read(min(READ_SIZE, remaining))
+        if not block:
+            break
+        spool.write(block)
+        digest.update(block)
+        remaining -= len(block)
+    if remaining or digest.hexdigest() != sha256.lower():
+        spool.close()
+        raise ChunkError(f'Chunk {index} failed checksum verification')
+    spool.seek(0)
+    return spool
+
+
+def _check_chunk(upload, index, length):
+    """Return True if chunk ``index`` is already stored; raise ChunkError if it can't be appended"""
+    offset = index * upload.chunk_size
+    expected = min(upload.chunk_size, upload.size - offset)
+    if upload.completed or offset + expected <= upload.received:
+        return True
+    if offset != upload.received:
+        raise ChunkError(f'Expected chunk {upload.received // upload.chunk_size}, got {index}')
+    if length != expected:
+        raise ChunkError(f'Chunk {index} must be {expected} bytes, got {length}')
+    return False
+
+
+def append_chunk(upload_id, owner, index, stream, length, sha256):
+    """
+    Write chunk ``index`` read from ``stream`` and return the upload.
+
+    Chunks must arrive in order; re-sending a chunk that is already stored
+    (e.g. after a lost response) is a no-op. The body is read and verified
+    into a temp file first, so a slow client never holds the row lock; the
+    row is then locked only to re-check the offset and append, so two
+    requests can't append at once.
+    """
+    upload = VideoUpload.objects.get(pk=upload_id, owner=owner)
+    if _check_chunk(upload, index, length):
+        return upload
+
+    with _spool_chunk(stream, length, sha256, index) as spool, transaction.atomic():
+        upload = VideoUpload.objects.select_for_update().get(pk=upload_id, owner=owner)
+        if _check_chunk(upload, index, length):
+            # Another request stored this chunk while the body was being read
+            return upload
+
+        offset = index * upload.chunk_size
+        path = temp_path(upload)
+        with open(path, 'r+b') as f:
+            f.seek(offset)
+            shutil.copyfileobj(spool, f, READ_SIZE)
+
+        upload.received = offset + length
+        restarted = False
+        if upload.received == upload.size:
+            if upload.sha256 and _file_sha256(path) != upload.sha256:
+                open(path, 'wb').close()
+                upload.received = 0
+                restarted = True
+            else:
+                upload.completed = True
+        upload.save(update_fields=['received', 'completed', 'updated_date'])
+
+    # Raised outside the transaction so the restart is committed
+    if restarted:
+        raise ChunkError('File checksum mismatch; upload restarted')
+    return upload
+
+
+class CompletedUpload(File):
+    """Lets FileSystemStorage move the temp file into place instead of copying it"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def attach_upload(post, upload):
+    """Attach a completed upload to ``post.video`` (without saving the post)"""
+    path = temp_path(upload)
+    with open(path, 'rb') as f:
+        post.video.save(upload.filename, CompletedUpload(f, name=upload.filename), save=False)
+    if os.path.exists(path):
+        os.remove(path)
+    upload.delete()
+
+
+def discard_upload(upload):
+    path = temp_path(upload)
+    if os.path.exists(path):
+        os.remove(path)
+    upload.delete()
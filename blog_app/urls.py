@@ -9,11 +9,22 @@ urlpatterns = [
     
     path('post/new/', views.create_post, name='create_post'),
     path('post/<int:pk>/', views.post_detail, name='post_detail'),
+    path('post/<int:pk>/comments/', views.post_comments, name='post_comments'),
     path('post/<int:pk>/update/', views.update_post, name='update_post'),
     path('post/<int:pk>/delete/', views.delete_post, name='delete_post'),
     
     path('category/<int:category_id>/', views.category_posts, name='category_posts'),
     path('my-posts/', views.user_posts, name='user_posts'),
+    path('search/', views.search, name='search'),
     path('post/<int:pk>/download/', views.download_post_image, name='download_post_image'),
+    path('post/<int:pk>/video/', views.stream_post_video, name='stream_post_video'),
+
+    path('uploads/video/', views.start_video_upload, name='start_video_upload'),
+    path('uploads/video/<uuid:upload_id>/', views.video_upload_status, name='video_upload_status'),
+    path('uploads/video/<uuid:upload_id>/chunks/<int:index>/', views.upload_video_chunk, name='upload_video_chunk'),
+
+    path('ops/db-pool/', views.db_pool_stats, name='db_pool_stats'),
+    path('ops/profiles/', views.profile_list, name='profile_list'),
+    path('ops/profiles/<str:capture>/<str:kind>/', views.download_profile, name='download_profile'),
 
 ]
\ No newline at end of file
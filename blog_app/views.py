@@ -1,41 +1,70 @@
+import os
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout
 from django.contrib import messages
-from django.core.paginator import Paginator
-from .models import Post, Category, Comment
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+from blog_project.db.pool import pool_stats
+from blog_project.profiling import FILES as PROFILE_FILES, PARAM as PROFILE_PARAM, capture_path, list_captures, make_token
+from . import directory
+from .models import Post, Comment, VideoUpload
 from .forms import UserRegisterForm, PostForm, CommentForm
+from .conditional import category_last_modified, conditional_page, home_last_modified, post_last_modified
+from .fragments import render_post_cards
+from .page_cache import anonymous_page_cache
+from .pagination import InvalidCursor, KeysetPaginator
+from .search import search_posts
+from .streaming import media_response
+from .uploads import ChunkError, append_chunk, start_upload, upload_status
 
+@conditional_page(home_last_modified)
+@anonymous_page_cache
 def home(request):
-    posts = Post.objects.filter(status='published').order_by('-publish_date')
+    posts = Post.objects.filter(status='published').select_related('author', 'category')
     
     # Pagination
-    paginator = Paginator(posts, 6)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    categories = Category.objects.all()
+    paginator = KeysetPaginator(posts, 6)
+    page_obj = paginator.get_page(request.GET.get('page'))
     
     context = {
         'page_obj': page_obj,
-        'categories': categories,
+        'post_cards': render_post_cards(page_obj, 'home'),
+        'categories': directory.categories(),
     }
     return render(request, 'blog_app/home.html', context)
 
 
+@conditional_page(category_last_modified)
+@anonymous_page_cache
 def category_posts(request, category_id):
-    category = get_object_or_404(Category, pk=category_id)
-    posts = Post.objects.filter(category=category, status='published').order_by('-publish_date')
+    category = directory.get(category_id)
+    if category is None:
+        raise Http404('No such category')
+    posts = Post.objects.filter(category_id=category_id, status='published').select_related('author', 'category')
+    
+    paginator = KeysetPaginator(posts, 9)
+    page_obj = paginator.get_page(request.GET.get('page'))
     
     context = {
         'category': category,
-        'posts': posts,
+        'page_obj': page_obj,
+        'post_cards': render_post_cards(page_obj, 'category'),
+        'post_count': category.post_count,
     }
     return render(request, 'blog_app/category_posts.html', context)
 
+@conditional_page(post_last_modified)
+@anonymous_page_cache
 def post_detail(request, pk):
-    post = get_object_or_404(Post, pk=pk)
-    comments = post.comments.filter(approved=True)
+    post = get_object_or_404(Post.objects.select_related('author', 'category'), pk=pk)
+    comments = comment_paginator(post.comments.all()).page()
     
     if request.method == 'POST':
         if request.user.is_authenticated:
@@ -60,10 +89,32 @@ def post_detail(request, pk):
     }
     return render(request, 'blog_app/post_detail.html', context)
 
+COMMENTS_PER_PAGE = 20
+
+def comment_paginator(comments):
+    comments = comments.filter(approved=True).select_related('author')
+    return KeysetPaginator(comments, COMMENTS_PER_PAGE, keys=('created_date', 'id'))
+
+@conditional_page(post_last_modified)
+@anonymous_page_cache
+def post_comments(request, pk):
+    """The next page of a post's comments, as rendered HTML plus the URL of the page after it"""
+    post = get_object_or_404(Post.objects.only('pk'), pk=pk)
+    try:
+        comments = comment_paginator(Comment.objects.filter(post=post)).page(request.GET.get('page'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid page'}, status=400)
+
+    next_url = None
+    if comments.has_next():
+        next_url = f"{reverse('post_comments', args=[pk])}?page={comments.next_token}"
+    html = render_to_string('blog_app/includes/comment_list.html', {'comments': comments}, request=request)
+    return JsonResponse({'html': html, 'next': next_url})
+
 @login_required
 def create_post(request):
     if request.method == 'POST':
-        form = PostForm(request.POST, request.FILES)
+        form = PostForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
@@ -71,7 +122,7 @@ def create_post(request):
             messages.success(request, 'Post created successfully!')
             return redirect('post_detail', pk=post.pk)
     else:
-        form = PostForm()
+        form = PostForm(user=request.user)
     
     return render(request, 'blog_app/post_form.html', {'form': form, 'title': 'Create Post'})
 
@@ -79,26 +130,26 @@ def create_post(request):
 def update_post(request, pk):
     post = get_object_or_404(Post, pk=pk)
     
-    if request.user != post.author:
+    if request.user.pk != post.author_id:
         messages.error(request, 'You are not authorized to edit this post.')
         return redirect('post_detail', pk=post.pk)
     
     if request.method == 'POST':
-        form = PostForm(request.POST, request.FILES, instance=post)
+        form = PostForm(request.POST, request.FILES, instance=post, user=request.user)
         if form.is_valid():
             form.save()
             messages.success(request, 'Post updated successfully!')
             return redirect('post_detail', pk=post.pk)
     else:
-        form = PostForm(instance=post)
+        form = PostForm(instance=post, user=request.user)
     
     return render(request, 'blog_app/post_form.html', {'form': form, 'title': 'Update Post'})
 
 @login_required
 def delete_post(request, pk):
-    post = get_object_or_404(Post, pk=pk)
+    post = get_object_or_404(Post.objects.select_related('author', 'category'), pk=pk)
     
-    if request.user != post.author:
+    if request.user.pk != post.author_id:
         messages.error(request, 'You are not authorized to delete this post.')
         return redirect('post_detail', pk=post.pk)
     
@@ -155,31 +206,139 @@ def user_logout(request):
 
 @login_required
 def user_posts(request):
-    posts = Post.objects.filter(author=request.user).order_by('-publish_date')
-    return render(request, 'blog_app/user_posts.html', {'posts': posts})
+    posts = Post.objects.filter(author=request.user)
+    paginator = KeysetPaginator(posts, 9)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'page_obj': page_obj,
+        'post_cards': render_post_cards(page_obj, 'user'),
+    }
+    return render(request, 'blog_app/user_posts.html', context)
 
-import os
-from django.http import HttpResponse, Http404
-from django.shortcuts import get_object_or_404
-from django.contrib.auth.decorators import login_required
-from .models import Post
+SEARCH_RESULTS_PER_PAGE = 10
+# Deeper pages are never linked, and each one costs an ever larger OFFSET
+SEARCH_MAX_PAGE = 100
 
+def search(request):
+    query = request.GET.get('q', '').strip()[:200]
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    if page > SEARCH_MAX_PAGE:
+        raise Http404('No such page')
+
+    results = []
+    has_next = False
+    if query:
+        per_page = SEARCH_RESULTS_PER_PAGE
+        # One extra hit tells us whether there is a next page
+        hits = search_posts(query, Post.objects.filter(status='published'), offset=(page - 1) * per_page, limit=per_page + 1)
+        has_next = len(hits) > per_page
+        posts = Post.objects.select_related('author', 'category').in_bulk([hit.post_id for hit in hits[:per_page]])
+        results = [posts[hit.post_id] for hit in hits[:per_page] if hit.post_id in posts]
+
+    context = {
+        'query': query,
+        'page': page,
+        'has_next': has_next,
+        'results': results,
+        'post_cards': render_post_cards(results, 'home'),
+    }
+    return render(request, 'blog_app/search.html', context)
 
 @login_required
 def download_post_image(request, pk):
     post = get_object_or_404(Post, pk=pk)
 
     # 🔐 Only author can download
-    if post.author != request.user:
+    if post.author_id != request.user.pk:
         return HttpResponse("You are not allowed to download this file.", status=403)
 
     if not post.image:
         raise Http404("No image found")
 
-    file_path = post.image.path
-    file_name = os.path.basename(file_path)
+    return media_response(request, post.image, content_type='application/octet-stream', as_attachment=True)
+
+
+def stream_post_video(request, pk):
+    post = get_object_or_404(Post.objects.only('video', 'status'), pk=pk)
+
+    if not post.video:
+        raise Http404("No video found")
+
+    # Uploads get unique names, so a URL's bytes practically never change
+    cache_control = 'public, max-age=86400' if post.status == 'published' else 'private, max-age=3600'
+    return media_response(request, post.video, cache_control=cache_control)
+
+
+
+@login_required
+@require_POST
+def start_video_upload(request):
+    try:
+        filename = request.POST['filename']
+        size = int(request.POST['size'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'filename and size are required'}, status=400)
+    if not 0 < size <= settings.BLOG_MAX_VIDEO_SIZE:
+        return JsonResponse({'error': 'File is empty or too large'}, status=400)
+
+    upload = start_upload(request.user, filename, size, request.POST.get('sha256', ''))
+    return JsonResponse(upload_status(upload), status=201)
+
+
+@login_required
+def video_upload_status(request, upload_id):
+    upload = get_object_or_404(VideoUpload, pk=upload_id, owner=request.user)
+    return JsonResponse(upload_status(upload))
+
+
+@login_required
+@require_POST
+def upload_video_chunk(request, upload_id, index):
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid Content-Length'}, status=400)
+    checksum = request.headers.get('X-Chunk-SHA256', '')
+    try:
+        upload = append_chunk(upload_id, request.user, index, request, length, checksum)
+    except VideoUpload.DoesNotExist:
+        raise Http404("No such upload")
+    except ChunkError as exc:
+        upload = get_object_or_404(VideoUpload, pk=upload_id, owner=request.user)
+        return JsonResponse({'error': str(exc), **upload_status(upload)}, status=409)
+    return JsonResponse(upload_status(upload))
+
+
+@staff_member_required
+def db_pool_stats(request):
+    """Connection pool counters per database alias (hits, waits, creations, ...)"""
+    return JsonResponse(pool_stats())
+
+
+@staff_member_required
+def profile_list(request):
+    """Captured request profiles, and a profiling link for a given path"""
+    path = request.GET.get('path', '').strip()
+    link = None
+    if path.startswith('/') and not path.startswith('//'):
+        separator = '&' if '?' in path else '?'
+        link = f'{path}{separator}{PROFILE_PARAM}={make_token(request.user)}'
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'captures': list_captures(),
+        'path': path,
+        'link': link,
+    }
+    return render(request, 'blog_app/ops/profiles.html', context)
+
 
-    with open(file_path, 'rb') as file:
-        response = HttpResponse(file.read(), content_type="application/octet-stream")
-        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
-        return response
\ No newline at end of file
+@staff_member_required
+def download_profile(request, capture, kind):
+    path = capture_path(capture, kind)
+    if path is None or not os.path.exists(path):
+        raise Http404("No such profile")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path), content_type=PROFILE_FILES[kind][1])
@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog_project.settings')
+# The async read views are opt-in: set BLOG_ASYNC_VIEWS=1 (see settings.py)
 
 application = get_asgi_application()
@@ -0,0 +1,54 @@
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from .routers import begin_request, end_request
+
+COOKIE_NAME = 'db_primary'
+COOKIE_SALT = 'blog_project.db.middleware'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+def _sticky_seconds():
+    return getattr(settings, 'BLOG_REPLICA_STICKY_SECONDS', 10)
+
+
+def _begin(request):
+    recently_wrote = request.get_signed_cookie(
+        COOKIE_NAME, default=None, salt=COOKIE_SALT, max_age=_sticky_seconds(),
+    )
+    return begin_request(primary=request.method not in SAFE_METHODS or recently_wrote is not None)
+
+
+def _finish(response, token):
+    state = end_request(token)
+    if state.wrote:
+        # Keep this client's reads on the primary until the replicas catch up
+        response.set_signed_cookie(
+            COOKIE_NAME, '1', salt=COOKIE_SALT, max_age=_sticky_seconds(), httponly=True, samesite='Lax',
+        )
+    return response
+
+
+@sync_and_async_middleware
+def ReplicaStickinessMiddleware(get_response):
+    """Pin writes, and a client's reads shortly after its writes, to the primary"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = _begin(request)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                end_request(token)
+                raise
+            return _finish(response, token)
+    else:
+        def middleware(request):
+            token = _begin(request)
+            try:
+                response = get_response(request)
+            except BaseException:
+                end_request(token)
+                raise
+            return _finish(response, token)
+    return middleware
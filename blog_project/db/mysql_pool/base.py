@@ -0,0 +1,15 @@
+"""
+MySQL backend with pooled connections, see ``blog_project/db/pool.py``.
+
+    'ENGINE': 'blog_project.db.mysql_pool',
+"""
+
+from django.db.backends.mysql import base as mysql
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, mysql.DatabaseWrapper):
+    def check_connection(self, raw):
+        # COM_PING: one round trip, no statement parsing
+        raw.ping()
@@ -0,0 +1,283 @@
+"""
+A thread-safe pool of DB-API connections, and a mixin that makes a Django
+database backend take its connections from one.
+
+Django opens a connection for each request and closes it again at the end
+(``CONN_MAX_AGE = 0``). With the mixin, "opening" checks a connection out
+of a process-wide pool and "closing" returns it, so the TCP handshake and
+authentication happen only when the pool grows. Configure it with
+``OPTIONS['pool']``::
+
+    'OPTIONS': {
+        'pool': {
+            'max_size': 20,         # open connections, idle or in use
+            'timeout': 5,           # seconds to wait for a free connection
+            'idle_timeout': 300,    # close connections idle this long
+            'max_lifetime': 1800,   # replace connections this old
+            'check_after': 1,       # ping a connection idle this long before reuse
+        },
+    }
+
+Django keeps one connection per thread (or per ``sync_to_async`` thread
+under ASGI); the pool is shared by all of them. A pool belongs to one
+database: when an alias is pointed at another one (as the test runner does
+when it creates and destroys the test database), its old pool is retired
+and a new one started, so no connection to the old database is reused.
+"""
+
+import threading
+import time
+
+from django.db.utils import OperationalError
+
+DEFAULTS = {
+    'max_size': 10,
+    'timeout': 5.0,
+    'idle_timeout': 300.0,
+    'max_lifetime': 1800.0,
+    'check_after': 0.0,
+}
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class _Entry:
+    __slots__ = ('raw', 'created_at', 'last_used')
+
+    def __init__(self, raw, now):
+        self.raw = raw
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    At most ``max_size`` connections made by ``connect()``. ``check(raw)``
+    must raise if a connection is no longer usable; ``close(raw)`` disposes
+    of one.
+    """
+
+    def __init__(self, connect, close=None, check=None, clock=time.monotonic, **options):
+        unknown = set(options) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f'Unknown pool options: {", ".join(sorted(unknown))}')
+        self.options = {**DEFAULTS, **options}
+        self._connect = connect
+        self._close = close or (lambda raw: raw.close())
+        self._check = check
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._idle = []  # most recently used last
+        self._in_use = {}
+        self._open = 0
+        self._retired = False
+        self._counters = dict.fromkeys(
+            ('checkouts', 'hits', 'creations', 'waits', 'timeouts', 'failed_checks', 'expired', 'discarded'), 0,
+        )
+
+    def _expired(self, entry, now):
+        return (
+            now - entry.last_used > self.options['idle_timeout']
+            or now - entry.created_at > self.options['max_lifetime']
+        )
+
+    def _take_idle(self, now, dead):
+        # Reap expired connections from the cold end of the stack
+        while self._idle and self._expired(self._idle[0], now):
+            dead.append(self._idle.pop(0))
+            self._counters['expired'] += 1
+        while self._idle:
+            entry = self._idle.pop()
+            if not self._expired(entry, now):
+                return entry
+            dead.append(entry)
+            self._counters['expired'] += 1
+        return None
+
+    def _dispose(self, entries):
+        for entry in entries:
+            try:
+                self._close(entry.raw)
+            except Exception:
+                pass
+        if entries:
+            with self._cond:
+                self._open -= len(entries)
+                self._cond.notify(len(entries))
+
+    def acquire(self):
+        """Return ``(connection, reused)``"""
+        deadline = self._clock() + self.options['timeout']
+        waited = False
+        with self._cond:
+            self._counters['checkouts'] += 1
+        while True:
+            dead = []
+            timed_out = False
+            with self._cond:
+                while True:
+                    now = self._clock()
+                    entry = self._take_idle(now, dead)
+                    if entry is not None:
+                        break
+                    if self._open - len(dead) < self.options['max_size']:
+                        # Reserve the slot, then connect outside the lock
+                        self._open += 1
+                        break
+                    if now >= deadline:
+                        timed_out = True
+                        self._counters['timeouts'] += 1
+                        break
+                    if not waited:
+                        waited = True
+                        self._counters['waits'] += 1
+                    self._cond.wait(deadline - now)
+            self._dispose(dead)
+            if timed_out:
+                raise PoolTimeout(f'No database connection free after {self.options["timeout"]}s')
+
+            if entry is None:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                entry = _Entry(raw, self._clock())
+                with self._cond:
+                    self._counters['creations'] += 1
+                    self._in_use[id(raw)] = entry
+                return raw, False
+
+            if self._check and self._clock() - entry.last_used >= self.options['check_after']:
+                try:
+                    self._check(entry.raw)
+                except Exception:
+                    with self._cond:
+                        self._counters['failed_checks'] += 1
+                    self._dispose([entry])
+                    continue
+            with self._cond:
+                self._counters['hits'] += 1
+                self._in_use[id(entry.raw)] = entry
+            return entry.raw, True
+
+    def release(self, raw, discard=False):
+        """Return a connection from ``acquire()``; ``discard`` closes it instead"""
+        with self._cond:
+            entry = self._in_use.pop(id(raw), None)
+            if entry is None:
+                return
+            entry.last_used = self._clock()
+            if not discard and not self._retired and not self._expired(entry, entry.last_used):
+                self._idle.append(entry)
+                self._cond.notify()
+                return
+            self._counters['discarded'] += 1
+        self._dispose([entry])
+
+    def close_idle(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        self._dispose(idle)
+
+    def retire(self):
+        """Close the idle connections, and the ones in use as they are released"""
+        with self._cond:
+            self._retired = True
+        self.close_idle()
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self._counters,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'max_size': self.options['max_size'],
+            }
+
+
+# {alias: (database key, pool)}
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_stats():
+    """``{alias: stats}`` for every pool in this process"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, (_, pool) in pools.items()}
+
+
+class PooledDatabaseWrapperMixin:
+    """Mix into a backend's ``DatabaseWrapper`` ahead of the backend class"""
+
+    def pool_options(self):
+        options = self.settings_dict['OPTIONS'].get('pool') or {}
+        return {} if options is True else dict(options)
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def check_connection(self, raw):
+        """Raise if ``raw`` can't be used; backends may override with a cheaper ping"""
+        cursor = raw.cursor()
+        try:
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def pool_key(self):
+        """Connections are only shared between wrappers of the same database"""
+        return tuple(self.settings_dict.get(name) for name in ('NAME', 'USER', 'HOST', 'PORT'))
+
+    def get_pool(self, conn_params=None):
+        key = self.pool_key()
+        retired = None
+        with _pools_lock:
+            current_key, pool = _pools.get(self.alias, (None, None))
+            if pool is not None and current_key != key:
+                retired, pool = pool, None
+            if pool is None:
+                if conn_params is None:
+                    conn_params = self.get_connection_params()
+                new_connection = super().get_new_connection
+                pool = ConnectionPool(
+                    lambda: new_connection(conn_params),
+                    check=self.check_connection,
+                    **self.pool_options(),
+                )
+                _pools[self.alias] = (key, pool)
+        if retired is not None:
+            retired.retire()
+        return pool
+
+    def get_new_connection(self, conn_params):
+        self._pool = self.get_pool(conn_params)
+        raw, self._pool_reused = self._pool.acquire()
+        return raw
+
+    def init_connection_state(self):
+        # The session settings made when the connection was created still apply
+        if not getattr(self, '_pool_reused', False):
+            super().init_connection_state()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        discard = self.errors_occurred
+        if not discard and not self.autocommit:
+            # Closed mid-transaction: don't hand the open transaction on
+            try:
+                self.connection.rollback()
+            except Exception:
+                discard = True
+        # The pool it came from, even if the alias has moved on since
+        self._pool.release(self.connection, discard=discard)
@@ -0,0 +1,141 @@
+"""
+Primary / read-replica routing.
+
+Writes always go to ``default``. Reads are spread at random over the
+replicas listed in ``BLOG_DB_REPLICAS`` unless:
+
+* the current request is pinned to the primary: it is a write (POST etc.),
+  it has already written, or the client wrote within the last
+  ``BLOG_REPLICA_STICKY_SECONDS`` (see ``middleware.py``) — so users
+  always read their own changes;
+* the read happens inside a transaction on the primary, which it has to see;
+* the read belongs to an object loaded from a particular database;
+* no replica is healthy: a replica more than ``BLOG_REPLICA_MAX_LAG``
+  seconds behind, or one that can't be reached, is skipped for
+  ``BLOG_REPLICA_CHECK_INTERVAL`` seconds.
+"""
+
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+
+
+class RoutingState:
+    """Per-request routing flags, shared with ``sync_to_async`` threads by reference"""
+
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+def begin_request(primary=False):
+    """Start routing a request; returns a token for ``end_request()``"""
+    return _state.set(RoutingState(primary))
+
+
+def end_request(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def use_primary():
+    """Send the rest of this request's reads to the primary"""
+    state = _state.get()
+    if state is not None:
+        state.primary = True
+
+
+def replica_aliases():
+    return list(getattr(settings, 'BLOG_DB_REPLICAS', []))
+
+
+def replica_lag(alias):
+    """Seconds the replica is behind, or None when unknown (e.g. replication stopped)"""
+    connection = connections[alias]
+    if connection.vendor != 'mysql':
+        return 0
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+            column = 'Seconds_Behind_Source'
+        except DatabaseError:
+            # MySQL < 8.0.22
+            cursor.execute('SHOW SLAVE STATUS')
+            column = 'Seconds_Behind_Master'
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        names = [col[0] for col in cursor.description]
+        return row[names.index(column)]
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def is_healthy(alias):
+    now = time.monotonic()
+    with _health_lock:
+        checked = _health.get(alias)
+    if checked is not None and now - checked[0] < getattr(settings, 'BLOG_REPLICA_CHECK_INTERVAL', 5):
+        return checked[1]
+
+    try:
+        lag = replica_lag(alias)
+    except DatabaseError as exc:
+        logger.warning('Replica %s unavailable, reading from the primary: %s', alias, exc)
+        healthy = False
+    else:
+        healthy = lag is not None and lag <= getattr(settings, 'BLOG_REPLICA_MAX_LAG', 5)
+        if not healthy:
+            logger.warning('Replica %s is behind (lag: %s), reading from the primary', alias, lag)
+    with _health_lock:
+        _health[alias] = (now, healthy)
+    return healthy
+
+
+def forget_health():
+    with _health_lock:
+        _health.clear()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.primary:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        replicas = [alias for alias in replica_aliases() if is_healthy(alias)]
+        if not replicas:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.primary = True
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
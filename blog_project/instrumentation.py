@@ -0,0 +1,233 @@
+"""
+Per-request timing: where did the time go?
+
+``ServerTimingMiddleware`` measures, for every request:
+
+* ``db``: time and number of SQL queries on every connection, through an
+  ``execute_wrapper`` installed on each connection as it is created (under
+  ASGI, queries run on other threads' connections), with per-statement
+  totals;
+* ``tpl``: template rendering, excluding SQL run while rendering (lazy
+  querysets), via the ``TimedDjangoTemplates`` backend;
+* ``app``: everything else until the response is returned.
+
+The numbers go out in a ``Server-Timing`` header (shown in the browser's
+network panel) when ``BLOG_SERVER_TIMING`` is on (by default only with
+``DEBUG``: the header exposes internals to every client). Requests slower than
+``BLOG_SLOW_REQUEST_MS`` are logged to ``blog.slow_requests`` with their
+most expensive statements; ``BackgroundHandler`` writes those records from
+a thread so a slow disk never holds up a response.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger('blog.slow_requests')
+
+TOP_STATEMENTS = 5
+MAX_SQL_LENGTH = 1000
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = 0.0
+        self.db = 0.0
+        self.queries = 0
+        self.template = 0.0
+        self.template_depth = 0
+        # sql -> [count, seconds]
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.db += elapsed
+            self.queries += 1
+            entry = self.statements.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    @property
+    def app(self):
+        return max(self.total - self.db - self.template, 0.0)
+
+    def header(self):
+        return (
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries", '
+            f'tpl;dur={self.template * 1000:.1f}, app;dur={self.app * 1000:.1f}, '
+            f'total;dur={self.total * 1000:.1f}'
+        )
+
+    def top_statements(self, count=TOP_STATEMENTS):
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:count]
+        return [
+            {'sql': sql[:MAX_SQL_LENGTH], 'count': calls, 'ms': round(seconds * 1000, 2)}
+            for sql, (calls, seconds) in ranked
+        ]
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def timing_wrapper(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def install_timing_wrapper(connection, **kwargs):
+    if timing_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timing_wrapper)
+
+
+connection_created.connect(install_timing_wrapper)
+# Connections opened before this module was imported
+for _connection in connections.all(initialized_only=True):
+    install_timing_wrapper(_connection)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None or timings.template_depth:
+            return super().render(context, request)
+        timings.template_depth += 1
+        db_before = timings.db
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_depth -= 1
+            timings.template += time.perf_counter() - start - (timings.db - db_before)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for ``ServerTimingMiddleware``"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _finish(request, response, timings, token):
+    _current.reset(token)
+    timings.finish()
+    if getattr(settings, 'BLOG_SERVER_TIMING', settings.DEBUG):
+        response['Server-Timing'] = timings.header()
+    if timings.total * 1000 >= getattr(settings, 'BLOG_SLOW_REQUEST_MS', 500):
+        logger.warning(
+            'Slow request: %s %s took %.0f ms', request.method, request.path, timings.total * 1000,
+            extra={'request_timing': {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(timings.total * 1000, 1),
+                'db_ms': round(timings.db * 1000, 1),
+                'queries': timings.queries,
+                'template_ms': round(timings.template * 1000, 1),
+                'app_ms': round(timings.app * 1000, 1),
+                'top_sql': timings.top_statements(),
+            }},
+        )
+    return response
+
+
+@sync_and_async_middleware
+def ServerTimingMiddleware(get_response):
+    """Time SQL, templates and the rest of each request; see the module docstring"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = RequestTimings()
+            token = _current.set(timings)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                _current.reset(token)
+                raise
+            return _finish(request, response, timings, token)
+    else:
+        def middleware(request):
+            timings = RequestTimings()
+            token = _current.set(timings)
+            try:
+                response = get_response(request)
+            except BaseException:
+                _current.reset(token)
+                raise
+            return _finish(request, response, timings, token)
+    return middleware
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the ``request_timing`` extra merged in"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'request_timing', {}))
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """
+    Queue records for a thread that writes them to ``filename`` (stderr when
+    empty). When the queue is full, records are dropped rather than making
+    the request wait.
+    """
+
+    def __init__(self, filename=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        target = logging.FileHandler(filename, delay=True) if filename else logging.StreamHandler()
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(self.queue, target)
+        self.listener.start()
+        self.running = True
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write out the queued records and stop the thread"""
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.stop()
+        super().close()
@@ -0,0 +1,295 @@
+"""
+On-demand profiling of single requests in production.
+
+A staff user adds ``?_profile=<token>`` (or an ``X-Profile: <token>``
+header) to any URL; the token comes from ``/ops/profiles/`` and is signed
+for that user, valid for ``BLOG_PROFILE_TOKEN_MAX_AGE`` seconds. For that
+request only, ``ProfilingMiddleware``:
+
+* samples the request thread's stack every ``BLOG_PROFILE_INTERVAL``
+  seconds from a background thread (no tracing hooks, so the request runs
+  at close to full speed);
+* traces allocations with ``tracemalloc`` and keeps the top allocation
+  sites still alive at the end.
+
+A capture is written to ``BLOG_PROFILE_DIR`` as ``<id>.meta.json`` plus
+``<id>.speedscope.json`` (open in https://www.speedscope.app),
+``<id>.collapsed.txt`` (flamegraph.pl / speedscope) and
+``<id>.memory.txt``. Only the newest ``BLOG_PROFILE_KEEP`` are kept.
+
+Under ASGI every thread is sampled, since an async view's work hops
+between the event loop and the sync thread; other requests running at the
+same time show up in the profile too. ``tracemalloc`` is process-wide in
+any case.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.text import slugify
+
+PARAM = '_profile'
+HEADER = 'X-Profile'
+TOKEN_SALT = 'blog_project.profiling'
+
+CAPTURE_RE = re.compile(r'^[\w-]+$')
+FILES = {
+    'speedscope': ('speedscope.json', 'application/json'),
+    'collapsed': ('collapsed.txt', 'text/plain'),
+    'memory': ('memory.txt', 'text/plain'),
+}
+MEMORY_TOP = 50
+TRACEBACK_DEPTH = 10
+
+
+def profile_dir():
+    return str(getattr(settings, 'BLOG_PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+def make_token(user):
+    return signing.dumps(user.pk, salt=TOKEN_SALT, compress=True)
+
+
+def token_user_id(token):
+    max_age = getattr(settings, 'BLOG_PROFILE_TOKEN_MAX_AGE', 60 * 60)
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
+    except signing.BadSignature:
+        return None
+
+
+class Sampler:
+    """Counts the stacks of the given threads (all but its own when None) every ``interval`` seconds"""
+
+    def __init__(self, thread_ids=None, interval=0.005):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            self.samples[tuple(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+def frame_label(frame):
+    name, filename, line = frame
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def collapsed(samples):
+    """Brendan Gregg's collapsed stack format: ``frame;frame;frame count`` per line"""
+    return ''.join(
+        ';'.join(frame_label(frame) for frame in stack) + f' {count}\n'
+        for stack, count in sorted(samples.items())
+    )
+
+
+def speedscope(samples, interval, name):
+    frames, index = [], {}
+    stacks, weights = [], []
+    for stack, count in samples.items():
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+            ids.append(index[frame])
+        stacks.append(ids)
+        weights.append(count * interval)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': stacks,
+            'weights': weights,
+        }],
+    }
+
+
+def memory_report(snapshot, peak):
+    stats = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics('traceback')
+    lines = [f'Peak traced memory: {peak / 1024:.1f} KiB', f'Top {MEMORY_TOP} allocation sites still alive:', '']
+    for stat in stats[:MEMORY_TOP]:
+        lines.append(f'{stat.size / 1024:.1f} KiB in {stat.count} block(s)')
+        lines.extend(f'    {line}' for line in stat.traceback.format())
+    return '\n'.join(lines) + '\n'
+
+
+def save_capture(request, user, status, sampler, snapshot, peak):
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.now(dt_timezone.utc)
+    capture = f'{now:%Y%m%d-%H%M%S}-{slugify(request.path)[:40] or "root"}-{uuid.uuid4().hex[:8]}'
+    name = f'{request.method} {request.get_full_path()}'
+    files = {
+        'speedscope': json.dumps(speedscope(sampler.samples, sampler.interval, name)),
+        'collapsed': collapsed(sampler.samples),
+        'memory': memory_report(snapshot, peak),
+    }
+    for kind, content in files.items():
+        with open(os.path.join(directory, f'{capture}.{FILES[kind][0]}'), 'w') as f:
+            f.write(content)
+    meta = {
+        'id': capture,
+        'created': now.isoformat(timespec='seconds'),
+        'request': name,
+        'user': user.get_username(),
+        'status': status,
+        'duration_ms': round(sampler.elapsed * 1000, 1),
+        'samples': sum(sampler.samples.values()),
+        'peak_kib': round(peak / 1024, 1),
+    }
+    with open(os.path.join(directory, f'{capture}.meta.json'), 'w') as f:
+        json.dump(meta, f)
+    prune(directory)
+    return meta
+
+
+def list_captures():
+    """Metadata of the stored captures, newest first"""
+    directory = profile_dir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    captures = []
+    for name in sorted(names, reverse=True):
+        if name.endswith('.meta.json'):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    captures.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return captures
+
+
+def capture_path(capture, kind):
+    """Path of one file of a capture, or None when the names are invalid"""
+    if kind not in FILES or not CAPTURE_RE.match(capture):
+        return None
+    return os.path.join(profile_dir(), f'{capture}.{FILES[kind][0]}')
+
+
+def prune(directory):
+    keep = getattr(settings, 'BLOG_PROFILE_KEEP', 50)
+    for meta in list_captures()[keep:]:
+        for suffix in ['meta.json'] + [filename for filename, _ in FILES.values()]:
+            try:
+                os.remove(os.path.join(directory, f'{meta["id"]}.{suffix}'))
+            except FileNotFoundError:
+                pass
+
+
+# tracemalloc is process-wide: one capture at a time
+_busy = threading.Lock()
+
+
+def _token(request):
+    return request.GET.get(PARAM) or request.headers.get(HEADER)
+
+
+def _allowed(user, token):
+    return user.is_staff and token_user_id(token) == user.pk
+
+
+def _start(thread_ids):
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start(TRACEBACK_DEPTH)
+    tracemalloc.reset_peak()
+    sampler = Sampler(thread_ids, getattr(settings, 'BLOG_PROFILE_INTERVAL', 0.005))
+    sampler.start()
+    return sampler, tracing
+
+
+def _stop(sampler, tracing):
+    sampler.stop()
+    if not tracing:
+        tracemalloc.stop()
+    _busy.release()
+
+
+def _finish(request, user, response, sampler, tracing):
+    sampler.stop()
+    try:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+        _busy.release()
+    meta = save_capture(request, user, response.status_code, sampler, snapshot, peak)
+    response['X-Profile-Id'] = meta['id']
+    return response
+
+
+@sync_and_async_middleware
+def ProfilingMiddleware(get_response):
+    """Profile requests carrying a valid staff token; see the module docstring"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = _token(request)
+            user = await request.auser() if token else None
+            if not token or not _allowed(user, token) or not _busy.acquire(blocking=False):
+                return await get_response(request)
+            sampler, tracing = _start(None)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                _stop(sampler, tracing)
+                raise
+            return _finish(request, user, response, sampler, tracing)
+    else:
+        def middleware(request):
+            token = _token(request)
+            user = request.user if token else None
+            if not token or not _allowed(user, token) or not _busy.acquire(blocking=False):
+                return get_response(request)
+            sampler, tracing = _start({threading.get_ident()})
+            try:
+                response = get_response(request)
+            except BaseException:
+                _stop(sampler, tracing)
+                raise
+            return _finish(request, user, response, sampler, tracing)
+    return middleware
@@ -21,11 +21,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so it times everything below it
+    'blog_project.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Before anything that reads the database (sessions, auth)
+    'blog_project.db.middleware.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Needs request.user; see blog_project/profiling.py
+    'blog_project.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -34,7 +40,8 @@ ROOT_URLCONF = 'blog_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for the Server-Timing header
+        'BACKEND': 'blog_project.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -52,7 +59,8 @@ WSGI_APPLICATION = 'blog_project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # django.db.backends.mysql with pooled connections, see blog_project/db/pool.py
+        'ENGINE': 'blog_project.db.mysql_pool',
         'NAME': 'django_blog',           # Database name
         'USER': 'root',                   # MySQL username
         'PASSWORD': 'anis1234',                   # MySQL password (empty if none)
@@ -61,10 +69,56 @@ DATABASES = {
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'charset': 'utf8mb4',
-        }
+            'pool': {
+                'max_size': 20,
+                'timeout': 5,
+                'idle_timeout': 300,
+                'max_lifetime': 1800,
+                'check_after': 1,
+            },
+        },
+        # "Closing" at the end of each request returns the connection to the pool
+        'CONN_MAX_AGE': 0,
     }
 }
 
+# Read replicas, e.g. BLOG_DB_REPLICA_HOSTS=10.0.0.2,10.0.0.3. Each gets the
+# primary's settings with its own HOST; see blog_project/db/routers.py.
+for _number, _host in enumerate(filter(None, os.environ.get('BLOG_DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{_number}'] = {**DATABASES['default'], 'HOST': _host.strip(), 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['blog_project.db.routers.PrimaryReplicaRouter']
+BLOG_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# After a write, the client's reads stay on the primary this long
+BLOG_REPLICA_STICKY_SECONDS = 10
+# Replicas further behind than this (in seconds) are skipped
+BLOG_REPLICA_MAX_LAG = 5
+BLOG_REPLICA_CHECK_INTERVAL = 5
+
+# Every worker process must see the same cache: page-cache generations and
+# render locks, the category directory, cached_db sessions and cached users
+# are invalidated by whichever process handled the write. The file cache
+# is shared by the processes of one host and needs no service; set
+# BLOG_REDIS_URL (e.g. redis://10.0.0.5:6379/0) when serving from several
+# hosts. A process-local cache (LocMemCache) is only correct with a single
+# process, which is what BLOG_SINGLE_PROCESS declares.
+if os.environ.get('BLOG_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['BLOG_REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        },
+    }
+BLOG_SINGLE_PROCESS = False
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -80,6 +134,15 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Sessions are read from the cache and written through to the database
+# only when they change; the logged-in user is cached too (see
+# blog_app/backends.py) and flash messages travel in a signed cookie, so a
+# logged-in page view needs no session, user or message queries.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+AUTHENTICATION_BACKENDS = ['blog_app.backends.CachedModelBackend']
+BLOG_USER_CACHE_TIMEOUT = 60 * 15
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
@@ -92,6 +155,63 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# How protected media downloads are delivered: None streams them through
+# Django, 'x-accel-redirect' hands them to nginx (an internal location at
+# BLOG_MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT), 'x-sendfile' to
+# Apache mod_xsendfile / lighttpd.
+BLOG_MEDIA_OFFLOAD = None
+BLOG_MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Chunked video uploads are assembled here (outside MEDIA_ROOT) before
+# being moved into storage.
+BLOG_CHUNKED_UPLOAD_DIR = BASE_DIR / 'upload_tmp'
+BLOG_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+BLOG_MAX_VIDEO_SIZE = 2 * 1024 * 1024 * 1024
+
+# Serve home, category, post and comment pages from async views. Off by
+# default, under ASGI too: the ORM is synchronous underneath, so each async
+# query still runs in a thread, and measured ASGI throughput was 0.4-0.5x of
+# WSGI workers. Only turn it on (BLOG_ASYNC_VIEWS=1) for an ASGI deployment
+# that needs it, e.g. to share the process with websockets or long polling,
+# after checking compare_wsgi_asgi against your own data. Never under WSGI,
+# where every async view would need its own event loop.
+BLOG_ASYNC_VIEWS = os.environ.get('BLOG_ASYNC_VIEWS', '') == '1'
+
+# Server-Timing header with db / tpl / app / total durations on every
+# response (development only: it tells anyone how many queries a page runs
+# and how long they take), and the threshold for the slow-request log (JSON
+# lines, written from a background thread to BLOG_SLOW_REQUEST_LOG, or stderr).
+BLOG_SERVER_TIMING = DEBUG
+BLOG_SLOW_REQUEST_MS = 500
+
+# Staff can profile single requests with a signed link from /ops/profiles/
+BLOG_PROFILE_DIR = BASE_DIR / 'profiles'
+BLOG_PROFILE_INTERVAL = 0.005
+BLOG_PROFILE_KEEP = 50
+BLOG_PROFILE_TOKEN_MAX_AGE = 60 * 60
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'blog_project.instrumentation.JsonFormatter'},
+    },
+    'handlers': {
+        'slow_requests': {
+            'class': 'blog_project.instrumentation.BackgroundHandler',
+            'filename': os.environ.get('BLOG_SLOW_REQUEST_LOG', ''),
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'blog.slow_requests': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
@@ -0,0 +1,28 @@
+"""
+Settings for running the test suite without a MySQL server.
+
+Usage: python manage.py test --settings=blog_project.test_settings
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_db.sqlite3',
+    },
+    # A separate database standing in for a replica, so the routing tests
+    # (which list it in BLOG_DB_REPLICAS) can tell which one answered a read
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_db_replica.sqlite3',
+    },
+}
+BLOG_DB_REPLICAS = []
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# The test runner is one process, so a process-local cache is shared by
+# everything it runs
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+BLOG_SINGLE_PROCESS = True
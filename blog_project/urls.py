@@ -21,7 +21,7 @@ from django.conf.urls.static import static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', include('blog_app.urls')),
+    path('', include('blog_app.async_urls' if settings.BLOG_ASYNC_VIEWS else 'blog_app.urls')),
 ]
 
 if settings.DEBUG:
@@ -4,6 +4,7 @@ CHECK CATEGORIES DEBUG SCRIPT
 =============================
 This script checks all category-related issues in your Django blog project.
 Run with: python check_categories.py
+For the report alone (text or JSON): python manage.py category_report
 """
 
 import os
@@ -23,8 +24,9 @@ except Exception as e:
     print("Make sure you're in the project root directory with manage.py")
     sys.exit(1)
 
-from blog_app.models import Category, Post, Comment
-from django.contrib.auth.models import User
+from blog_app import diagnostics, remediation
+from blog_app.models import Category, Post
+from django.core.management import call_command
 from django.db import connection
 from django.template import TemplateDoesNotExist
 from django.template.loader import get_template
@@ -86,8 +88,7 @@ def list_all_categories():
     """List all categories with details"""
     print_header("ALL CATEGORIES")
     
-    categories = Category.objects.all()
-    total = categories.count()
+    total = Category.objects.count()
     
     if total == 0:
         print("❌ No categories found in the database!")
@@ -107,8 +108,7 @@ def list_all_categories():
         
         if created > 0:
             print(f"\n   Created {created} sample categories")
-            categories = Category.objects.all()
-            total = categories.count()
+            total = Category.objects.count()
         else:
             print("   No new categories created (they may already exist)")
     
@@ -117,15 +117,13 @@ def list_all_categories():
     if total > 0:
         print("\nCategory Details:")
         print("-" * 50)
-        for i, cat in enumerate(categories, 1):
-            post_count = cat.post_set.count()
-            print(f"{i:2}. {cat.name:20} | Posts: {post_count:3} | ID: {cat.id}")
+        latest = diagnostics.latest_posts(3)
+        for i, row in enumerate(diagnostics.category_stats(), 1):
+            print(f"{i:2}. {row['name']:20} | Posts: {row['posts']:3} | ID: {row['pk']}")
             
             # Show latest posts in this category
-            if post_count > 0:
-                latest = cat.post_set.order_by('-publish_date')[:3]
-                for post in latest:
-                    print(f"     - '{post.title[:40]}...' by {post.author}")
+            for post in latest.get(row['pk'], []):
+                print(f"     - '{post['title'][:40]}...' by {post['author__username']}")
     
     return total
 
@@ -141,7 +139,7 @@ def check_posts_without_categories():
     if count > 0:
         print("\nPosts missing categories:")
         print("-" * 60)
-        for i, post in enumerate(posts_without_cat[:10], 1):  # Show first 10
+        for i, post in enumerate(posts_without_cat.select_related('author')[:10], 1):  # Show first 10
             print(f"{i:2}. ID: {post.id:4} | Title: '{post.title[:50]}...'")
             print(f"     Author: {post.author} | Status: {post.status} | Created: {post.created_date.date()}")
         
@@ -164,39 +162,26 @@ def check_posts_without_categories():
             if created:
                 print(f"✅ Created 'Uncategorized' category")
             
-            updated = 0
-            for post in posts_without_cat:
-                post.category = uncategorized
-                post.save()
-                updated += 1
-            
+            updated = remediation.assign_category(posts_without_cat, uncategorized)
             print(f"✅ Assigned {updated} posts to 'Uncategorized' category")
             
         elif choice == '2':
             cat_name = input("Enter new category name: ").strip()
             if cat_name:
-                new_cat, created = Category.objects.create(name=cat_name)
-                updated = 0
-                for post in posts_without_cat:
-                    post.category = new_cat
-                    post.save()
-                    updated += 1
+                new_cat = Category.objects.create(name=cat_name)
+                updated = remediation.assign_category(posts_without_cat, new_cat)
                 print(f"✅ Created '{cat_name}' and assigned {updated} posts")
             else:
                 print("❌ No category name provided")
                 
         elif choice == '3':
-            existing_cats = list(Category.objects.all())
-            if existing_cats:
-                import random
-                updated = 0
-                for post in posts_without_cat:
-                    post.category = random.choice(existing_cats)
-                    post.save()
-                    updated += 1
+            try:
+                updated = remediation.spread_categories(posts_without_cat)
                 print(f"✅ Assigned random categories to {updated} posts")
-            else:
+            except ValueError:
                 print("❌ No existing categories to assign")
+        
+        print("   Without prompts: python manage.py fix_categories --help")
     
     return count
 
@@ -204,39 +189,22 @@ def check_category_posts_distribution():
     """Check how posts are distributed among categories"""
     print_header("CATEGORY POSTS DISTRIBUTION")
     
-    categories = Category.objects.all().order_by('name')
+    totals = diagnostics.overview()
     
-    if not categories.exists():
+    if not totals['categories']:
         print("No categories found")
         return
     
-    total_posts = Post.objects.count()
+    total_posts = totals['posts']
     
     print(f"{'Category':<25} {'Posts':<6} {'%':<6} {'Avg Posts/Day':<12}")
     print("-" * 55)
     
-    for cat in categories:
-        posts = cat.post_set.all()
-        count = posts.count()
-        
-        if count > 0:
-            # Calculate average posts per day
-            if posts.count() > 1:
-                dates = sorted([p.created_date for p in posts])
-                days_diff = (dates[-1] - dates[0]).days
-                if days_diff > 0:
-                    avg_per_day = count / days_diff
-                    avg_str = f"{avg_per_day:.2f}"
-                else:
-                    avg_str = "N/A"
-            else:
-                avg_str = "N/A"
-        else:
-            avg_str = "N/A"
-        
-        percentage = (count / total_posts * 100) if total_posts > 0 else 0
+    for row in diagnostics.category_stats():
+        avg_str = f"{row['per_day']:.2f}" if row['per_day'] is not None else "N/A"
+        percentage = (row['posts'] / total_posts * 100) if total_posts > 0 else 0
         
-        print(f"{cat.name:<25} {count:<6} {percentage:5.1f}% {avg_str:<12}")
+        print(f"{row['name']:<25} {row['posts']:<6} {percentage:5.1f}% {avg_str:<12}")
     
     print("-" * 55)
     print(f"{'TOTAL':<25} {total_posts:<6} {100:5.1f}%")
@@ -339,9 +307,10 @@ def generate_recommendations():
     """Generate recommendations based on findings"""
     print_header("RECOMMENDATIONS")
     
-    total_categories = Category.objects.count()
-    total_posts = Post.objects.count()
-    posts_without_cat = Post.objects.filter(category__isnull=True).count()
+    totals = diagnostics.overview()
+    total_categories = totals['categories']
+    total_posts = totals['posts']
+    posts_without_cat = totals['uncategorized']
     
     recommendations = []
     
@@ -373,9 +342,8 @@ def generate_recommendations():
     print("   >>> from blog_app.models import Category")
     print("   >>> Category.objects.create(name='Your Category')")
     print("\n2. Fix uncategorized posts:")
-    print("   >>> for post in Post.objects.filter(category__isnull=True):")
-    print("   ...     post.category = Category.objects.first()")
-    print("   ...     post.save()")
+    print("   python manage.py fix_categories assign --to 'Uncategorized' --create")
+    print("   python manage.py fix_categories merge --from 'Old name' --to 'New name'")
 
 def export_categories_report():
     """Export categories report to file"""
@@ -385,43 +353,13 @@ def export_categories_report():
     filename = f"categories_report_{timestamp}.txt"
     
     with open(filename, 'w') as f:
-        # Redirect print to file
-        import io
-        from contextlib import redirect_stdout
-        
-        f_capture = io.StringIO()
-        with redirect_stdout(f_capture):
-            # Re-run the checks but capture output
-            print("CATEGORIES DEBUG REPORT")
-            print("="*70)
-            print(f"Generated: {datetime.now()}")
-            print(f"Project: Django Blog")
-            print("="*70)
-            
-            # Database info
-            print("\nDATABASE INFO:")
-            print(f"Categories: {Category.objects.count()}")
-            print(f"Total Posts: {Post.objects.count()}")
-            print(f"Posts without categories: {Post.objects.filter(category__isnull=True).count()}")
-            
-            # List categories
-            print("\nCATEGORIES LIST:")
-            for cat in Category.objects.all():
-                post_count = cat.post_set.count()
-                f.write(f"{cat.name}: {post_count} posts\n")
-            
-            # List posts without categories
-            uncat_posts = Post.objects.filter(category__isnull=True)
-            if uncat_posts.exists():
-                f.write("\nPOSTS WITHOUT CATEGORIES:\n")
-                for post in uncat_posts:
-                    f.write(f"- {post.title} (ID: {post.id}, Author: {post.author})\n")
-        
-        f.write(f_capture.getvalue())
+        f.write("CATEGORIES DEBUG REPORT\n")
+        f.write(f"Generated: {datetime.now()}\n\n")
+        call_command('category_report', latest=3, uncategorized=100, stdout=f)
     
     print(f"✅ Report saved to: {filename}")
-    print(f"📄 Open with: notepad {filename}")
-
+    print("   For dashboards: python manage.py category_report --format json")
+    
 def main():
     """Main function"""
     print("\n" + "="*70)